@@ -2,7 +2,7 @@
 import streamlit as st
 import os
 import struct
-from tabela_hash import HashExtensivel, RegistroHashExtensivel
+from tabela_hash import HashExtensivel, RegistroHashExtensivel, VisaoEstrutura
 
 # Classe de Registro
 class TestRecord(RegistroHashExtensivel):
@@ -32,12 +32,6 @@ class TestRecord(RegistroHashExtensivel):
 dir_file = "__pycache__/gui_dir.bin"
 buckets_file = "__pycache__/gui_buckets.bin"
 
-# Inicialização da tabela hash
-if 'hash_table' not in st.session_state:
-    if os.path.exists(dir_file): os.remove(dir_file)
-    if os.path.exists(buckets_file): os.remove(buckets_file)
-    st.session_state.hash_table = HashExtensivel(TestRecord, 3, dir_file, buckets_file)
-
 # Quantidade máxima de registros por cesto = 3
 # 🔧 Para alterar a capacidade dos buckets, mude o valor abaixo:
 MAX_POR_CESTO = 3
@@ -47,8 +41,11 @@ if 'hash_table' not in st.session_state:
     if os.path.exists(dir_file): os.remove(dir_file)
     if os.path.exists(buckets_file): os.remove(buckets_file)
     st.session_state.hash_table = HashExtensivel(TestRecord, MAX_POR_CESTO, dir_file, buckets_file)
+    # Visão incremental: a cada execução do script, só os cestos alterados são relidos
+    st.session_state.visao = VisaoEstrutura(st.session_state.hash_table)
 
 ht = st.session_state.hash_table
+visao = st.session_state.visao
 
 st.title("Visualizador de Tabela Hash Extensível")
 
@@ -98,38 +95,58 @@ if st.button("Remover"):
 
 # Exibir Estrutura Visual
 st.subheader("Visualização Estruturada da Tabela Hash")
-
-# Diretório
-ht.arq_diretorio.seek(0)
-bd = ht.arq_diretorio.read()
-ht.diretorio = ht.Diretorio()
-ht.diretorio.from_byte_array(bd)
-
+visao.atualiza()
+resumo = visao.resumo()
+
+# Resumo da estrutura, obtido só dos cabeçalhos dos cestos
+st.markdown("### Resumo")
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Registros", resumo['registros'])
+col2.metric("Fator de carga", f"{resumo['fator_carga']:.0%}")
+col3.metric("Cestos vazios", resumo['cestos_vazios'])
+col4.metric("Cestos cheios", resumo['cestos_cheios'])
+st.markdown(f"**Profundidade Global:** {resumo['profundidade_global']} — "
+            f"**Entradas do diretório:** {resumo['entradas_diretorio']} — **Cestos:** {resumo['cestos']} — "
+            f"**Cestos relidos nesta atualização:** {visao.relidos}")
+st.markdown("**Cestos por profundidade local:** " +
+            ", ".join(f"{pl}: {quantidade}" for pl, quantidade in resumo['histograma_profundidades'].items()))
+
+# Intervalo de entradas do diretório exibido (filtra também os cestos)
+ultima_entrada = resumo['entradas_diretorio'] - 1
+col1, col2 = st.columns(2)
+entrada_min = int(col1.number_input("Primeira entrada do diretório", min_value=0, max_value=ultima_entrada, value=0, step=1))
+entrada_max = int(col2.number_input("Última entrada do diretório", min_value=0, max_value=ultima_entrada,
+                                    value=ultima_entrada, step=1))
+entrada_max = max(entrada_min, entrada_max)
+
+# Diretório: as entradas que apontam para o mesmo cesto aparecem em uma única linha, em páginas
 st.markdown("### Diretório")
-# Mostrar profundidade global
-st.markdown(f"**Profundidade Global:** {ht.diretorio.profundidade_global}")
-
-dir_data = []
-for i, endereco in enumerate(ht.diretorio.enderecos):
-    bin_index = format(i, f'0{ht.diretorio.profundidade_global}b')
-    dir_data.append({"Índice Binário": bin_index, "Endereço (byte offset)": endereco})
-st.table(dir_data)
-
-# Buckets
+bits = resumo['profundidade_global']
+linhas = visao.diretorio_agrupado(entrada_min, entrada_max)
+linhas_por_pagina = st.selectbox("Linhas do diretório por página", (50, 100, 200, 500), index=2)
+paginas_diretorio = max(1, -(-len(linhas) // linhas_por_pagina))
+pagina_diretorio = int(st.number_input(f"Página do diretório (de {paginas_diretorio})", min_value=1,
+                                       max_value=paginas_diretorio, value=1, step=1)) - 1
+inicio = pagina_diretorio * linhas_por_pagina
+st.caption(f"Linhas {inicio + 1 if linhas else 0}–{min(inicio + linhas_por_pagina, len(linhas))} de {len(linhas)} "
+           f"(uma por cesto)")
+st.table([{"Bits finais": linha['bits_finais'],
+           "Primeira entrada": format(linha['primeira_entrada'], f'0{bits}b') if bits else '0',
+           "Entradas": linha['entradas'],
+           "Endereço (byte offset)": linha['endereco']}
+          for linha in linhas[inicio:inicio + linhas_por_pagina]])
+
+# Buckets, em páginas
 st.markdown("### Buckets (Cestos)")
-bucket_visualizados = set()
-ht.arq_cestos.seek(0)
-end = os.path.getsize(ht.nome_arquivo_cestos)
-while ht.arq_cestos.tell() < end:
-    offset = ht.arq_cestos.tell()
-    if offset in bucket_visualizados:
-        break
-    bucket_visualizados.add(offset)
-    cesto = ht.Cesto(ht.cls, ht.quantidade_dados_por_cesto)
-    ba = ht.arq_cestos.read(cesto.size())
-    cesto.from_byte_array(ba)
-
-    ocupacao = cesto.quantidade / cesto.quantidade_maxima
+por_pagina = st.selectbox("Cestos por página", (10, 25, 50, 100), index=0)
+_, total_cestos = visao.pagina(0, por_pagina, entrada_min, entrada_max)
+paginas = max(1, -(-total_cestos // por_pagina))
+pagina = int(st.number_input(f"Página (de {paginas})", min_value=1, max_value=paginas, value=1, step=1)) - 1
+cestos, _ = visao.pagina(pagina, por_pagina, entrada_min, entrada_max)
+
+for info in cestos:
+    offset = info['endereco']
+    ocupacao = info['quantidade'] / resumo['capacidade_cesto']
     if ocupacao == 1.0:
         cor = "#DF0505"  # vermelho claro (cheio)
     elif ocupacao == 0.0:
@@ -139,15 +156,18 @@ while ht.arq_cestos.tell() < end:
 
     st.markdown(
         f"<div style='background-color:{cor}; padding:10px; border-radius:10px;'>"
-        f"<b>Endereço:</b> {offset} bytes — <b>Profundidade Local:</b> {cesto.profundidade_local}</div>",
+        f"<b>Endereço:</b> {offset} bytes — <b>Profundidade Local:</b> {info['profundidade_local']} — "
+        f"<b>Registros:</b> {info['quantidade']}/{resumo['capacidade_cesto']}</div>",
         unsafe_allow_html=True
     )
 
+    # Apenas os cestos da página são desserializados, e só quando mudaram
+    elementos = visao.registros_cesto(offset)
     registros = [{"Posição": i + 1,
-                  "Chave": str(cesto.elementos[i].key),
-                  "Valor": cesto.elementos[i].value}
-                 if i < cesto.quantidade else
+                  "Chave": str(elementos[i].key),
+                  "Valor": elementos[i].value}
+                 if i < len(elementos) else
                  {"Posição": i + 1, "Chave": "-", "Valor": "-"}
-                 for i in range(cesto.quantidade_maxima)]
+                 for i in range(resumo['capacidade_cesto'])]
 
     st.table(registros)
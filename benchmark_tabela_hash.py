@@ -0,0 +1,795 @@
+# Benchmarks da tabela hash extensível
+# Uso: python benchmark_tabela_hash.py [nome_do_benchmark ...] [--json resultados.json]
+#      [--compara base.json] [--tolerancia 0.2] [--tamanhos 1000 10000 ...]
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import tabela_hash
+from tabela_hash import AsyncHashExtensivel, HashExtensivel, HashExtensivelParticionada, HashExtensivelVariavel, LeitorHashExtensivel, RegistroHashExtensivel, hash_modulo, hash_splitmix64
+
+# Registro de tamanho fixo usado nos benchmarks (mesmo formato do test_tabela_hash.py)
+class TestRecord(RegistroHashExtensivel):
+    formato_chave = (0, '>i')
+
+    def __init__(self, key: int = 0, value: str = ""):
+        self.key = key
+        self.value = value
+
+    def hash_code(self) -> int:
+        return self.key
+
+    def size(self) -> int:
+        return 4 + 20
+
+    def to_byte_array(self) -> bytes:
+        value_bytes = self.value.encode('utf-8')[:20]
+        value_bytes += b' ' * (20 - len(value_bytes))
+        return struct.pack('>i', self.key) + value_bytes
+
+    def from_byte_array(self, ba: bytes):
+        self.key = struct.unpack('>i', ba[:4])[0]
+        self.value = ba[4:24].decode('utf-8').rstrip()
+
+    def __str__(self):
+        return f"({self.key}, '{self.value}')"
+
+# Os arquivos dos benchmarks ficam na pasta __pycache__, como nos testes
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__')
+os.makedirs(cache_dir, exist_ok=True)
+
+# Tabela com a divisão recursiva original, usada como referência nas comparações
+class HashRecursivo(HashExtensivel):
+    def create(self, elem):
+        self._diretorio_atual()
+        endereco_cesto = self.diretorio.endereco(self.diretorio.hash(elem.hash_code()))
+        c = self._le_cesto(endereco_cesto)
+        if c.read(elem.hash_code()) is not None:
+            raise Exception("Elemento já existe")
+        if not c.full():
+            c.create(elem)
+            self._escreve_cesto(endereco_cesto, c)
+            return True
+        pl = c.profundidade_local
+        if pl >= self.diretorio.profundidade_global:
+            self.diretorio.duplica()
+        pg = self.diretorio.profundidade_global
+        self._escreve_cesto(endereco_cesto, self.Cesto(self.cls, self.quantidade_dados_por_cesto, pl + 1))
+        novo_endereco = self._acrescenta_cesto(self.Cesto(self.cls, self.quantidade_dados_por_cesto, pl + 1))
+        inicio = self.diretorio.hash2(elem.hash_code(), pl)
+        troca = False
+        for j in range(inicio, 2 ** pg, 2 ** pl):
+            if troca:
+                self.diretorio.atualiza_endereco(j, novo_endereco)
+            troca = not troca
+        self._salva_diretorio()
+        for j in range(c.quantidade):
+            self.create(c.elementos[j])
+        self.create(elem)
+        return True
+
+# Conta as gravações de cestos e do diretório feitas por uma tabela
+def conta_gravacoes(ht):
+    contagem = {'cestos': 0, 'diretorio': 0}
+    escreve_cesto, salva_diretorio = ht._escreve_cesto, ht._salva_diretorio
+    def conta_cesto(endereco, c):
+        contagem['cestos'] += 1
+        escreve_cesto(endereco, c)
+    def conta_diretorio():
+        if ht.diretorio.sujo():
+            contagem['diretorio'] += 1
+        salva_diretorio()
+    ht._escreve_cesto, ht._salva_diretorio = conta_cesto, conta_diretorio
+    return contagem
+
+# Cria uma tabela nova em arquivos próprios do benchmark
+def nova_tabela(nome: str, n: int, classe=HashExtensivel, **kwargs):
+    nd = os.path.join(cache_dir, f'bench_{nome}_dir.bin')
+    nc = os.path.join(cache_dir, f'bench_{nome}_buckets.bin')
+    for caminho in (nd, nc, nc + '.impressoes', nd + '.versao', nd + '.livres'):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    return classe(TestRecord, n, nd, nc, **kwargs)
+
+# Mede o tempo médio por operação, em microssegundos
+def cronometra(funcao, chaves):
+    inicio = time.perf_counter()
+    for chave in chaves:
+        funcao(chave)
+    return (time.perf_counter() - inicio) / len(chaves) * 1e6
+
+# Mede cada operação separadamente e retorna os tempos em nanossegundos
+def latencias(funcao, argumentos):
+    relogio = time.perf_counter_ns
+    tempos = []
+    for argumento in argumentos:
+        inicio = relogio()
+        funcao(argumento)
+        tempos.append(relogio() - inicio)
+    return tempos
+
+# Percentil (0 a 100) de uma lista de tempos já ordenada
+def percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, len(ordenados) * p // 100)]
+
+# Latência de leitura com o diretório residente e relido a cada operação,
+# conforme o diretório cresce
+def bench_diretorio_residente(tamanhos=(1000, 4000, 16000, 64000), leituras=2000):
+    print("\nLeitura pontual x tamanho do diretório (µs por leitura)")
+    print(f"{'registros':>10} {'entradas':>10} {'residente':>10} {'relido':>10}")
+    for n in tamanhos:
+        ht = nova_tabela('residente', 4)
+        for i in range(n):
+            ht.create(TestRecord(i, f"v{i}"))
+        ht.flush()
+        chaves = [(i * 7919) % n for i in range(leituras)]
+        residente = cronometra(ht.read, chaves)
+        nr = HashExtensivel(TestRecord, 4, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, diretorio_residente=False)
+        relido = cronometra(nr.read, chaves)
+        print(f"{n:>10} {len(ht.diretorio.enderecos):>10} {residente:>10.1f} {relido:>10.1f}")
+        nr.close()
+        ht.close()
+
+# Latência de leitura com cestos lidos do arquivo e com cestos mapeados em memória,
+# para cestos de diferentes capacidades
+def bench_cestos_mapeados(capacidades=(16, 256, 4096, 32767), registros=20000, leituras=2000):
+    print("\nLeitura pontual x capacidade do cesto (µs por leitura)")
+    print(f"{'capacidade':>10} {'arquivo':>10} {'mmap':>10}")
+    for n in capacidades:
+        ht = nova_tabela('mapa', n)
+        for i in range(registros):
+            ht.create(TestRecord(i, f"v{i}"))
+        ht.close()
+        chaves = [(i * 7919) % registros for i in range(leituras)]
+        arquivo = HashExtensivel(TestRecord, n, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos)
+        t_arquivo = cronometra(arquivo.read, chaves)
+        arquivo.close()
+        mapeado = HashExtensivel(TestRecord, n, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, mmap_cestos=True)
+        t_mapa = cronometra(mapeado.read, chaves)
+        mapeado.close()
+        print(f"{n:>10} {t_arquivo:>10.1f} {t_mapa:>10.1f}")
+
+# Tempo total de carga com inserções individuais e com create_many
+def bench_carga_em_lote(tamanhos=(10000, 50000, 200000), n=16):
+    print("\nCarga inicial (segundos)")
+    print(f"{'registros':>10} {'create':>10} {'create_many':>12}")
+    for total in tamanhos:
+        chaves = [(i * 7919) % total for i in range(total)]
+        ht = nova_tabela('individual', n)
+        inicio = time.perf_counter()
+        for chave in chaves:
+            ht.create(TestRecord(chave, f"v{chave}"))
+        ht.close()
+        t_individual = time.perf_counter() - inicio
+        ht = nova_tabela('lote', n)
+        inicio = time.perf_counter()
+        ht.create_many(TestRecord(chave, f"v{chave}") for chave in chaves)
+        ht.close()
+        t_lote = time.perf_counter() - inicio
+        print(f"{total:>10} {t_individual:>10.2f} {t_lote:>12.2f}")
+
+# Gravações em disco por inserção com chaves adversárias (múltiplos de 2^k),
+# comparando a divisão recursiva original com a divisão em memória
+def bench_divisao_adversaria(expoentes=(0, 4, 8, 12), registros=2000, n=4):
+    print("\nGravações por inserção com chaves múltiplas de 2^k")
+    print(f"{'k':>4} {'cestos rec.':>12} {'cestos':>8} {'dir. rec.':>10} {'dir.':>6} {'tempo rec.':>11} {'tempo':>7}")
+    for k in expoentes:
+        chaves = [i << k for i in range(registros)]
+        linha = []
+        for classe in (HashRecursivo, HashExtensivel):
+            ht = nova_tabela('adversaria', n, classe, funcao_hash=hash_modulo)
+            contagem = conta_gravacoes(ht)
+            inicio = time.perf_counter()
+            for chave in chaves:
+                ht.create(TestRecord(chave, f"v{chave}"))
+            tempo = time.perf_counter() - inicio
+            ht.close()
+            linha.append((contagem['cestos'] / registros, contagem['diretorio'] / registros, tempo))
+        (cr, dr, tr), (c, d, t) = linha
+        print(f"{k:>4} {cr:>12.2f} {c:>8.2f} {dr:>10.3f} {d:>6.3f} {tr:>11.2f} {t:>7.2f}")
+
+# Leituras concentradas em poucas chaves quentes, com caches de diferentes capacidades
+def bench_cache_cestos(capacidades=(0, 16, 256, 4096), registros=50000, leituras=20000, n=16):
+    print("\nLeitura com chaves quentes x capacidade do cache")
+    print(f"{'cache':>8} {'µs/leitura':>11} {'acertos':>9} {'despejos':>9}")
+    ht = nova_tabela('cache', n)
+    ht.create_many(TestRecord(i, f"v{i}") for i in range(registros))
+    ht.close()
+    aleatorio = random.Random(42)
+    # Distribuição de Pareto: a maioria das leituras cai em uma pequena fração das chaves
+    chaves = [min(int(aleatorio.paretovariate(1.2)) - 1, registros - 1) * 7919 % registros for _ in range(leituras)]
+    for capacidade in capacidades:
+        ht = HashExtensivel(TestRecord, n, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, cache_cestos=capacidade)
+        tempo = cronometra(ht.read, chaves)
+        estatisticas = ht.estatisticas_cache() or {'acertos': 0, 'faltas': leituras, 'despejos': 0}
+        taxa = estatisticas['acertos'] / (estatisticas['acertos'] + estatisticas['faltas'])
+        print(f"{capacidade:>8} {tempo:>11.1f} {taxa:>9.1%} {estatisticas['despejos']:>9}")
+        ht.close()
+
+# Busca linear original dentro do cesto, usada como referência
+def busca_linear(c, chave):
+    i = 0
+    while i < c.quantidade and chave > c.elementos[i].hash_code():
+        i += 1
+    if i < c.quantidade and chave == c.elementos[i].hash_code():
+        return c.elementos[i]
+    return None
+
+# Custo das operações dentro de um cesto em memória, conforme a capacidade do cesto cresce
+def bench_busca_no_cesto(capacidades=(3, 64, 1024, 8192, 32767), operacoes=2000):
+    print("\nOperações dentro do cesto (µs por operação)")
+    print(f"{'capacidade':>10} {'leitura linear':>15} {'leitura':>8} {'inserção+remoção':>17}")
+    for n in capacidades:
+        c = HashExtensivel.Cesto(TestRecord, n)
+        c.define_elementos([TestRecord(2 * i, f"v{i}") for i in range(n - 1)])
+        chaves = [(i * 7919) % (2 * n) for i in range(operacoes)]
+        t_linear = cronometra(lambda chave: busca_linear(c, chave), chaves)
+        t_leitura = cronometra(c.read, chaves)
+        impares = [2 * ((i * 7919) % n) + 1 for i in range(operacoes)]
+        t_escrita = cronometra(lambda chave: (c.create(TestRecord(chave)), c.delete(chave)), impares)
+        print(f"{n:>10} {t_linear:>15.1f} {t_leitura:>8.2f} {t_escrita:>17.2f}")
+
+# Exportação completa da tabela: leitura chave a chave x varredura sequencial
+def bench_scan(tamanhos=(10000, 100000), n=64):
+    print("\nExportação completa (segundos)")
+    print(f"{'registros':>10} {'chave a chave':>14} {'scan':>8} {'keys':>8}")
+    for total in tamanhos:
+        ht = nova_tabela('scan', n)
+        ht.create_many(TestRecord(i, f"v{i}") for i in range(total))
+        inicio = time.perf_counter()
+        for i in range(total):
+            ht.read(i)
+        t_chaves = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        assert sum(1 for _ in ht.scan()) == total
+        t_scan = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        assert sum(1 for _ in ht.keys()) == total
+        t_keys = time.perf_counter() - inicio
+        print(f"{total:>10} {t_chaves:>14.2f} {t_scan:>8.2f} {t_keys:>8.2f}")
+        ht.close()
+
+# Vazão de leituras com várias threads compartilhando a mesma tabela
+def bench_threads(quantidades=(1, 2, 4, 8), registros=50000, leituras=40000, n=64):
+    print("\nLeituras por segundo x quantidade de threads")
+    print(f"{'threads':>8} {'arquivo':>10} {'mmap':>10}")
+    ht = nova_tabela('threads', n)
+    ht.create_many(TestRecord(i, f"v{i}") for i in range(registros))
+    ht.close()
+    for quantidade in quantidades:
+        linha = []
+        for opcoes in ({}, {'mmap_cestos': True}):
+            tabela = HashExtensivel(TestRecord, n, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, **opcoes)
+            por_thread = leituras // quantidade
+
+            def le(t):
+                for i in range(por_thread):
+                    tabela.read((t * por_thread + i) * 7919 % registros)
+
+            threads = [threading.Thread(target=le, args=(t,)) for t in range(quantidade)]
+            inicio = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            linha.append(por_thread * quantidade / (time.perf_counter() - inicio))
+            tabela.close()
+        print(f"{quantidade:>8} {linha[0]:>10.0f} {linha[1]:>10.0f}")
+
+# Inserções por segundo sem log, com sincronização do log a cada operação e com group commit
+def bench_log(registros=5000, n=16, intervalos=(0.0, 0.01, 0.1)):
+    print("\nInserções por segundo com log de operações")
+    log_path = os.path.join(cache_dir, 'bench_log_wal.bin')
+    configuracoes = [('sem log', {})]
+    configuracoes += [(f'sync {intervalo}s', {'arquivo_log': log_path, 'intervalo_sync': intervalo}) for intervalo in intervalos]
+    for nome, opcoes in configuracoes:
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        ht = nova_tabela('log', n, **opcoes)
+        inicio = time.perf_counter()
+        for i in range(registros):
+            ht.create(TestRecord(i * 7919 % registros, "v"))
+        ht.close()
+        print(f"{nome:>12} {registros / (time.perf_counter() - inicio):>10.0f}")
+
+# Tamanho dos arquivos após uma carga seguida de remoções em massa, com e sem junção de cestos
+def bench_juncao(registros=50000, restantes=2000, n=16):
+    print("\nArquivos após remover a maior parte dos registros")
+    print(f"{'modo':>18} {'entradas dir.':>14} {'KB cestos':>10} {'KB diretório':>13}")
+
+    def mostra(modo, ht):
+        ht.flush()
+        print(f"{modo:>18} {len(ht.diretorio.enderecos):>14} {os.path.getsize(ht.nome_arquivo_cestos) / 1024:>10.0f} "
+              f"{os.path.getsize(ht.nome_arquivo_diretorio) / 1024:>13.0f}")
+
+    chaves = list(range(registros))
+    random.Random(1).shuffle(chaves)
+    for modo, junta in (('sem junção', False), ('com junção', True)):
+        ht = nova_tabela('juncao', n, junta_cestos=junta)
+        ht.create_many(TestRecord(c, "v") for c in chaves)
+        for c in chaves[restantes:]:
+            ht.delete(c)
+        mostra(modo, ht)
+        if junta:
+            ht.compact()
+            mostra('junção + compact', ht)
+        ht.close()
+
+# Tamanho do diretório e quantidade de divisões para diferentes distribuições de chaves e funções de hash
+def bench_distribuicao_chaves(registros=20000, n=16):
+    print("\nDiretório e divisões x distribuição das chaves")
+    print(f"{'chaves':>14} {'hash':>11} {'entradas dir.':>14} {'cestos':>8} {'divisões':>9} {'ocupação':>9}")
+    aleatorio = random.Random(5)
+    distribuicoes = {
+        'sequenciais': list(range(registros)),
+        'múltiplos 1024': [i * 1024 for i in range(registros)],
+        'timestamps': [1700000000 + i * 60 for i in range(registros)],
+        'k e -k': [(i // 2 + 1) * (-1) ** i for i in range(registros)],
+        'aleatórias': aleatorio.sample(range(2 ** 31), registros),
+    }
+    for nome, chaves in distribuicoes.items():
+        for nome_hash, funcao in (('modulo', hash_modulo), ('splitmix64', hash_splitmix64)):
+            ht = nova_tabela('distribuicao', n, funcao_hash=funcao)
+            for chave in chaves:
+                ht.create(TestRecord(chave, "v"))
+            cestos = len(set(ht.diretorio.enderecos))
+            print(f"{nome:>14} {nome_hash:>11} {len(ht.diretorio.enderecos):>14} {cestos:>8} {cestos - 1:>9} "
+                  f"{registros / (cestos * n):>9.0%}")
+            ht.close()
+
+# Registro com um texto de tamanho variável, serializado sem preenchimento
+class TextoRecord(RegistroHashExtensivel):
+    def __init__(self, key: int = 0, value: str = ""):
+        self.key = key
+        self.value = value
+
+    def hash_code(self) -> int:
+        return self.key
+
+    def size(self) -> int:
+        return 4 + len(self.value.encode('utf-8'))
+
+    def to_byte_array(self) -> bytes:
+        return struct.pack('>i', self.key) + self.value.encode('utf-8')
+
+    def from_byte_array(self, ba: bytes):
+        self.key = struct.unpack('>i', ba[:4])[0]
+        self.value = bytes(ba[4:]).decode('utf-8')
+
+# O mesmo registro preenchido até o tamanho máximo do texto, para a tabela de tamanho fixo
+class TextoFixoRecord(TextoRecord):
+    maximo = 1000
+
+    def size(self) -> int:
+        return 6 + self.maximo
+
+    def to_byte_array(self) -> bytes:
+        dados = self.value.encode('utf-8')
+        return struct.pack('>ih', self.key, len(dados)) + dados.ljust(self.maximo, b'\0')
+
+    def from_byte_array(self, ba: bytes):
+        self.key, tamanho = struct.unpack_from('>ih', ba)
+        self.value = bytes(ba[6:6 + tamanho]).decode('utf-8')
+
+# Tamanho dos arquivos e vazão de inserções com registros de tamanho variável (a maioria curta, alguns
+# longos): registros preenchidos até o máximo x entradas fixas com os textos em um arquivo heap
+def bench_registros_variaveis(registros=20000, n=16, tamanho_inline=32):
+    print("\nRegistros de tamanho variável (textos de até 1000 bytes, mediana ~20)")
+    print(f"{'modo':>22} {'µs/inserção':>12} {'µs/leitura':>11} {'MB cestos':>10} {'MB heap':>8}")
+    aleatorio = random.Random(7)
+    textos = ['t' * min(TextoFixoRecord.maximo, int(aleatorio.paretovariate(1.2) * 12)) for _ in range(registros)]
+    chaves = list(range(registros))
+    nd, nc, nh = (os.path.join(cache_dir, f'bench_variavel_{sufixo}.bin') for sufixo in ('dir', 'buckets', 'heap'))
+    for modo in ('fixo preenchido', 'heap', 'heap + inline'):
+        for caminho in (nd, nc, nh):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        if modo == 'fixo preenchido':
+            ht = HashExtensivel(TextoFixoRecord, n, nd, nc)
+            cria = lambda c: ht.create(TextoFixoRecord(c, textos[c]))
+        else:
+            ht = HashExtensivelVariavel(TextoRecord, n, nd, nc, nh,
+                                        tamanho_inline=tamanho_inline if modo == 'heap + inline' else 0)
+            cria = lambda c: ht.create(TextoRecord(c, textos[c]))
+        insercao = cronometra(cria, chaves)
+        leitura = cronometra(ht.read, aleatorio.sample(chaves, 2000))
+        ht.flush()
+        heap = os.path.getsize(nh) / 2 ** 20 if os.path.exists(nh) else 0
+        print(f"{modo:>22} {insercao:>12.1f} {leitura:>11.1f} {os.path.getsize(nc) / 2 ** 20:>10.1f} {heap:>8.1f}")
+        ht.close()
+
+# O mesmo registro, declarando o formato completo para a conversão vetorizada dos cestos
+class TestRecordFormatado(TestRecord):
+    formato_registro = '>i20s'
+
+    def campos(self) -> tuple:
+        return self.key, self.value.encode('utf-8')[:20].ljust(20)
+
+    @classmethod
+    def de_campos(cls, campos: tuple):
+        return cls(campos[0], campos[1].decode('utf-8').rstrip())
+
+# Conversões originais, registro a registro e incluindo os espaços vazios, usadas como referência
+def codifica_cesto_original(c):
+    ba = bytearray([c.profundidade_local]) + struct.pack('>h', c.quantidade)
+    for i in range(c.quantidade):
+        ba += c.elementos[i].to_byte_array()
+    for i in range(c.quantidade, c.quantidade_maxima):
+        ba += bytes(c.bytes_por_elemento)
+    return bytes(ba)
+
+def decodifica_cesto_original(c, ba):
+    c.quantidade = struct.unpack('>h', ba[1:3])[0]
+    c.elementos = []
+    for i in range(c.quantidade_maxima):
+        elem = c.cls()
+        elem.from_byte_array(ba[3 + i * c.bytes_por_elemento:3 + (i + 1) * c.bytes_por_elemento])
+        c.elementos.append(elem)
+
+def codifica_diretorio_original(d):
+    ba = bytearray([d.profundidade_global])
+    for e in d.enderecos:
+        ba += struct.pack('>q', e)
+    return bytes(ba)
+
+def decodifica_diretorio_original(ba):
+    return [struct.unpack('>q', ba[1 + i * 8:9 + i * 8])[0] for i in range(2 ** ba[0])]
+
+# Tempo de serialização e desserialização de um cesto pela metade e do diretório
+def bench_codec(capacidades=(16, 256, 4096), profundidades=(10, 16, 20)):
+    print("\nConversão de um cesto pela metade (µs)")
+    print(f"{'capacidade':>10} {'modo':>12} {'codifica':>10} {'decodifica':>11}")
+    numpy_original = tabela_hash.numpy
+    for n in capacidades:
+        modos = [('original', TestRecord, None), ('por registro', TestRecord, None),
+                 ('struct', TestRecordFormatado, None)]
+        if numpy_original is not None:
+            modos.append(('numpy', TestRecordFormatado, numpy_original))
+        repeticoes = max(1, 20000 // n)
+        for modo, cls, numpy_modo in modos:
+            tabela_hash.numpy = numpy_modo
+            HashExtensivel.CodecRegistros.codecs.pop(cls, None)
+            c = HashExtensivel.Cesto(cls, n)
+            c.define_elementos([cls(k, f"v{k}") for k in range(n // 2)])
+            ba = c.to_byte_array()
+            if modo == 'original':
+                codifica = lambda _: codifica_cesto_original(c)
+                decodifica = lambda _: decodifica_cesto_original(c, ba)
+            else:
+                codifica = lambda _: c.to_byte_array()
+                decodifica = lambda _: c.from_byte_array(ba)
+            print(f"{n:>10} {modo:>12} {cronometra(codifica, range(repeticoes)):>10.1f} "
+                  f"{cronometra(decodifica, range(repeticoes)):>11.1f}")
+    tabela_hash.numpy = numpy_original
+    for cls in (TestRecord, TestRecordFormatado):
+        HashExtensivel.CodecRegistros.codecs.pop(cls, None)
+    print("\nConversão do diretório (ms)")
+    print(f"{'profundidade':>12} {'modo':>12} {'codifica':>10} {'decodifica':>11}")
+    for p in profundidades:
+        d = HashExtensivel.Diretorio()
+        d.profundidade_global = p
+        d.enderecos = array('q', range(0, 2 ** p * 99, 99))
+        ba = d.to_byte_array()
+        assert codifica_diretorio_original(d) == ba and decodifica_diretorio_original(ba) == list(d.enderecos)
+        for modo, codifica, decodifica in (('original', lambda _: codifica_diretorio_original(d),
+                                            lambda _: decodifica_diretorio_original(ba)),
+                                           ('array', lambda _: d.to_byte_array(), lambda _: d.from_byte_array(ba))):
+            repeticoes = max(1, 2 ** (20 - p))
+            print(f"{p:>12} {modo:>12} {cronometra(codifica, range(repeticoes)) / 1000:>10.2f} "
+                  f"{cronometra(decodifica, range(repeticoes)) / 1000:>11.2f}")
+
+# Chaves de cada distribuição: sequenciais, aleatórias e adversárias (todas com os bits baixos zerados)
+def gera_chaves(distribuicao: str, total: int, aleatorio):
+    if distribuicao == 'sequenciais':
+        return list(range(total))
+    if distribuicao == 'aleatórias':
+        return aleatorio.sample(range(2 ** 31), total)
+    deslocamento = 31 - total.bit_length()
+    return [i << deslocamento for i in range(total)]
+
+# Vazão, latências p50/p99 e bytes lidos e gravados por operação de inserção, leitura, atualização e
+# remoção, para cada capacidade de cesto, distribuição de chaves e tamanho da tabela
+# Retorna uma linha por combinação, gravada no JSON com --json e comparada com --compara
+def bench_operacoes(capacidades=(16, 256), distribuicoes=('sequenciais', 'aleatórias', 'adversárias'),
+                    tamanhos=(10 ** 3, 10 ** 4, 10 ** 5), amostras=5000):
+    print("\nOperações pontuais (latências em µs, bytes por operação)")
+    print(f"{'cap.':>5} {'chaves':>12} {'registros':>10} {'operação':>9} {'ops/s':>9} {'p50':>7} {'p99':>7} "
+          f"{'lidos':>8} {'gravados':>9}")
+    resultados = []
+    for n in capacidades:
+        for distribuicao in distribuicoes:
+            for total in tamanhos:
+                aleatorio = random.Random(total)
+                chaves = gera_chaves(distribuicao, total, aleatorio)
+                ht = nova_tabela('operacoes', n)
+                amostra = aleatorio.sample(chaves, min(amostras, total))
+                operacoes = (('create', ht.create, [TestRecord(c, "v") for c in chaves]),
+                             ('read', ht.read, amostra),
+                             ('update', ht.update, [TestRecord(c, "u") for c in amostra]),
+                             ('delete', ht.delete, amostra))
+                for operacao, funcao, argumentos in operacoes:
+                    ht.stats(zera=True)
+                    tempos = sorted(latencias(funcao, argumentos))
+                    contagem = ht.stats()
+                    linha = {'capacidade': n, 'distribuicao': distribuicao, 'registros': total, 'operacao': operacao,
+                             'ops_por_s': len(tempos) / (sum(tempos) / 1e9),
+                             'p50_us': percentil(tempos, 50) / 1000, 'p99_us': percentil(tempos, 99) / 1000,
+                             'bytes_lidos_por_op': contagem['bytes_lidos'] / len(tempos),
+                             'bytes_gravados_por_op': contagem['bytes_gravados'] / len(tempos),
+                             'divisoes': contagem['divisoes'], 'juncoes': contagem['juncoes']}
+                    if operacao == 'create':
+                        ht.flush()
+                        linha['bytes_cestos'] = os.path.getsize(ht.nome_arquivo_cestos)
+                        linha['bytes_diretorio'] = os.path.getsize(ht.nome_arquivo_diretorio)
+                    resultados.append(linha)
+                    print(f"{n:>5} {distribuicao:>12} {total:>10} {operacao:>9} {linha['ops_por_s']:>9.0f} "
+                          f"{linha['p50_us']:>7.1f} {linha['p99_us']:>7.1f} {linha['bytes_lidos_por_op']:>8.0f} "
+                          f"{linha['bytes_gravados_por_op']:>9.0f}")
+                ht.close()
+    return resultados
+
+# Compara os resultados com os de uma execução anterior e retorna as regressões encontradas:
+# linhas com vazão menor ou p50/p99 maior que a base além da tolerância relativa
+def compara_resultados(resultados, base, tolerancia: float):
+    regressoes = []
+    for nome, linhas in resultados.items():
+        campos_chave = ('capacidade', 'distribuicao', 'registros', 'operacao')
+        anteriores = {tuple(l[c] for c in campos_chave): l for l in base.get(nome, [])}
+        for linha in linhas:
+            anterior = anteriores.get(tuple(linha[c] for c in campos_chave))
+            if anterior is None:
+                continue
+            if linha['ops_por_s'] < anterior['ops_por_s'] / (1 + tolerancia):
+                regressoes.append((nome, linha, 'ops_por_s', anterior['ops_por_s']))
+            for metrica in ('p50_us', 'p99_us'):
+                if linha[metrica] > anterior[metrica] * (1 + tolerancia):
+                    regressoes.append((nome, linha, metrica, anterior[metrica]))
+    return regressoes
+
+# Leituras concorrentes a partir do asyncio: run_in_executor a cada leitura x AsyncHashExtensivel com lotes
+def bench_async(concorrencias=(1, 10, 100, 1000), registros=50000, leituras=20000, n=64):
+    print("\nLeituras por segundo a partir do asyncio")
+    print(f"{'concorrência':>13} {'executor':>10} {'lotes':>10} {'cestos lidos/leitura':>21}")
+    ht = nova_tabela('async', n)
+    ht.create_many(TestRecord(i, f"v{i}") for i in range(registros))
+    chaves = [random.Random(i).randrange(registros) for i in range(leituras)]
+
+    async def executa(concorrencia, leitura):
+        async def cliente(inicio):
+            for i in range(inicio, leituras, concorrencia):
+                await leitura(chaves[i])
+        inicio = time.perf_counter()
+        await asyncio.gather(*[cliente(i) for i in range(concorrencia)])
+        return leituras / (time.perf_counter() - inicio)
+
+    async def principal():
+        executor = ThreadPoolExecutor(max_workers=2)
+        loop = asyncio.get_running_loop()
+        aht = AsyncHashExtensivel(ht, max_threads=2)
+        for concorrencia in concorrencias:
+            simples = await executa(concorrencia, lambda c: loop.run_in_executor(executor, ht.read, c))
+            antes = ht.stats()['leituras_cestos']
+            em_lotes = await executa(concorrencia, aht.get)
+            por_leitura = (ht.stats()['leituras_cestos'] - antes) / leituras
+            print(f"{concorrencia:>13} {simples:>10.0f} {em_lotes:>10.0f} {por_leitura:>21.2f}")
+        await aht.close()
+        executor.shutdown()
+
+    asyncio.run(principal())
+
+# Operações sobre muitas chaves: uma a uma x read_many/update_many/delete_many (agrupadas por cesto)
+def bench_operacoes_em_lote(tamanhos_lote=(100, 1000, 10000), registros=100000, n=64):
+    print("\nOperações em lote (ms por lote)")
+    print(f"{'lote':>7} {'read':>8} {'read_many':>10} {'update':>8} {'update_many':>12} {'delete':>8} {'delete_many':>12}")
+    for tamanho in tamanhos_lote:
+        tempos = []
+        for em_lote in (False, True):
+            ht = nova_tabela('em_lote', n)
+            ht.create_many(TestRecord(i, f"v{i}") for i in range(registros))
+            chaves = random.Random(tamanho).sample(range(registros), tamanho)
+            if em_lote:
+                operacoes = ((ht.read_many, chaves), (ht.update_many, [TestRecord(c, "u") for c in chaves]),
+                             (ht.delete_many, chaves))
+            else:
+                operacoes = ((lambda l: [ht.read(c) for c in l], chaves),
+                             (lambda l: [ht.update(e) for e in l], [TestRecord(c, "u") for c in chaves]),
+                             (lambda l: [ht.delete(c) for c in l], chaves))
+            for funcao, argumento in operacoes:
+                inicio = time.perf_counter()
+                funcao(argumento)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            ht.close()
+        individual, agrupado = tempos[:3], tempos[3:]
+        print(f"{tamanho:>7} {individual[0]:>8.1f} {agrupado[0]:>10.1f} {individual[1]:>8.1f} {agrupado[1]:>12.1f} "
+              f"{individual[2]:>8.1f} {agrupado[2]:>12.1f}")
+
+# Escalabilidade da tabela particionada: operações em lote com 1 a N partições, no próprio processo
+# e com um processo trabalhador por partição
+def bench_particoes(quantidades=(1, 2, 4, 8), registros=200000, operacoes=100000, n=64):
+    print(f"\nTabela particionada (milhares de registros por segundo, {os.cpu_count()} núcleos)")
+    print(f"{'partições':>10} {'processos':>10} {'create_many':>12} {'read_many':>10} {'update_many':>12}")
+    nome = os.path.join(cache_dir, 'bench_particoes')
+    chaves = random.Random(3).sample(range(registros), operacoes)
+    for particoes in quantidades:
+        for processos in (0, particoes):
+            # Remove as partições da execução anterior, que pode ter usado outra quantidade
+            for i in range(max(quantidades)):
+                for sufixo in ('dir.bin', 'dir.bin.hash', 'cestos.bin'):
+                    if os.path.exists(f'{nome}.{i}.{sufixo}'):
+                        os.remove(f'{nome}.{i}.{sufixo}')
+            if os.path.exists(nome + '.particoes'):
+                os.remove(nome + '.particoes')
+            with HashExtensivelParticionada(TestRecord, n, nome, particoes, processos=processos) as ht:
+                vazoes = []
+                for funcao, argumento in ((ht.create_many, [TestRecord(i, "v") for i in range(registros)]),
+                                          (ht.read_many, chaves),
+                                          (ht.update_many, [TestRecord(c, "u") for c in chaves])):
+                    inicio = time.perf_counter()
+                    funcao(argumento)
+                    vazoes.append(len(argumento) / (time.perf_counter() - inicio) / 1000)
+            print(f"{particoes:>10} {processos:>10} {vazoes[0]:>12.0f} {vazoes[1]:>10.0f} {vazoes[2]:>12.0f}")
+
+# Impressões digitais das chaves: buscas em que a maioria das chaves não existe, com e sem impressões
+def bench_impressoes(capacidades=(16, 256, 4096), registros=100000, buscas=20000, proporcao_ausentes=0.9):
+    print(f"\nImpressões digitais ({proporcao_ausentes:.0%} das buscas por chaves ausentes)")
+    print(f"{'n':>6} {'impressões':>11} {'leituras/s':>11} {'cestos lidos/busca':>19} {'falsos positivos':>17}")
+    aleatorio = random.Random(5)
+    ausentes = int(buscas * proporcao_ausentes)
+    chaves = ([aleatorio.randrange(registros, 100 * registros) for _ in range(ausentes)] +
+              aleatorio.sample(range(registros), buscas - ausentes))
+    aleatorio.shuffle(chaves)
+    for n in capacidades:
+        for impressoes in (False, True):
+            ht = nova_tabela('impressoes', n, impressoes=impressoes)
+            ht.create_many(TestRecord(i, f"v{i}") for i in range(registros))
+            ht.stats(zera=True)
+            inicio = time.perf_counter()
+            for chave in chaves:
+                ht.read(chave)
+            decorrido = time.perf_counter() - inicio
+            s = ht.stats()
+            taxa = f"{s['falsos_positivos_impressoes'] / ausentes:.2%}" if impressoes else '-'
+            print(f"{n:>6} {'sim' if impressoes else 'não':>11} {buscas / decorrido:>11.0f} "
+                  f"{s['leituras_cestos'] / buscas:>19.3f} {taxa:>17}")
+            ht.close()
+
+# Processo do benchmark de leitores: faz as buscas e devolve a quantidade de repetições do seqlock
+def _busca_leitor(nd, nc, n, chaves, conexao):
+    with LeitorHashExtensivel(TestRecord, n, nd, nc) as leitor:
+        conexao.recv()
+        for chave in chaves:
+            leitor.read(chave)
+        conexao.send(leitor.repeticoes)
+
+# Leitores em outros processos: vazão total de buscas com 1 a N processos leitores, com a tabela parada
+# e com o processo principal inserindo registros ao mesmo tempo
+def bench_leitores(quantidades=(1, 2, 4, 8), registros=100000, buscas=50000, n=64):
+    print(f"\nLeitores em processos (milhares de buscas por segundo, {os.cpu_count()} núcleos)")
+    print(f"{'leitores':>9} {'escrita':>8} {'buscas/s':>9} {'repetições':>11}")
+    for escrita in (False, True):
+        ht = nova_tabela('leitores', n, leitores=True)
+        ht.create_many(TestRecord(i, f"v{i}") for i in range(registros))
+        nd, nc = ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos
+        proxima = registros
+        for quantidade in quantidades:
+            conexoes, processos = [], []
+            for i in range(quantidade):
+                chaves = random.Random(i).choices(range(registros), k=buscas)
+                local, remota = multiprocessing.Pipe()
+                processo = multiprocessing.Process(target=_busca_leitor, args=(nd, nc, n, chaves, remota))
+                processo.start()
+                conexoes.append(local)
+                processos.append(processo)
+            inicio = time.perf_counter()
+            for conexao in conexoes:
+                conexao.send(None)
+            repeticoes = 0
+            for conexao in conexoes:
+                while escrita and not conexao.poll():
+                    ht.create(TestRecord(proxima, "novo"))
+                    proxima += 1
+                repeticoes += conexao.recv()
+            decorrido = time.perf_counter() - inicio
+            for processo in processos:
+                processo.join()
+            print(f"{quantidade:>9} {'sim' if escrita else 'não':>8} {quantidade * buscas / decorrido / 1000:>9.0f} "
+                  f"{repeticoes:>11}")
+        ht.close()
+
+# Diretório em profundidades globais altas, residente ou paginado (sem diretorio_residente, com as páginas
+# lidas do arquivo sob demanda): memória após a abertura, duplicação e divisões de cestos rasos (que mudam
+# 2^(pg-2) entradas) e profundos (uma entrada). Com hash_modulo e um registro por cesto, duas chaves que
+# diferem só no bit p-1 bastam para levar o diretório à profundidade p
+def bench_diretorio_paginado(profundidades=(16, 20, 22)):
+    print("\nDiretório em profundidades altas (memória em MB, tempos em ms)")
+    print(f"{'pg':>4} {'modo':>10} {'memória':>8} {'abertura':>9} {'duplicação':>11} {'divisão rasa':>13} {'divisão profunda':>17}")
+    for pg in profundidades:
+        for modo, residente in (('residente', True), ('paginado', False)):
+            ht = nova_tabela('paginado', 1, funcao_hash=hash_modulo)
+            # As chaves pares abaixo de 2^13 ocupam 4096 cestos, para que as entradas apontem para endereços variados
+            ht.create_many([TestRecord(i, "a") for i in range(0, 1 << 13, 2)] + [TestRecord(1 << (pg - 1), "b")])
+            ht.close()
+            nd, nc = ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos
+            # A abertura é cronometrada sem o tracemalloc, que a deixaria muitas vezes mais lenta
+            inicio = time.perf_counter()
+            HashExtensivel(TestRecord, 1, nd, nc, diretorio_residente=residente, funcao_hash=hash_modulo).close()
+            abertura = (time.perf_counter() - inicio) * 1000
+            tracemalloc.start()
+            ht = HashExtensivel(TestRecord, 1, nd, nc, diretorio_residente=residente, funcao_hash=hash_modulo)
+            memoria = tracemalloc.get_traced_memory()[0] / 2 ** 20
+            tracemalloc.stop()
+            tempos = []
+            # Duplicação: 2^pg tem os pg bits finais iguais aos de 0, no cesto de profundidade local pg
+            # Divisão rasa: 1 e 3 caem no cesto dos ímpares (profundidade 1)
+            # Divisão profunda: 2^(pg-2) e 2^(pg-2) + 2^(pg-1) caem em um cesto de profundidade pg - 1
+            for chaves in ([1 << pg], [1, 3], [1 << (pg - 2), (1 << (pg - 2)) + (1 << (pg - 1))]):
+                for chave in chaves[:-1]:
+                    ht.create(TestRecord(chave, "x"))
+                inicio = time.perf_counter()
+                ht.create(TestRecord(chaves[-1], "x"))
+                tempos.append((time.perf_counter() - inicio) * 1000)
+            ht.close()
+            print(f"{pg:>4} {modo:>10} {memoria:>8.1f} {abertura:>9.1f} {tempos[0]:>11.1f} {tempos[1]:>13.1f} {tempos[2]:>17.2f}")
+
+BENCHMARKS = {
+    'diretorio_residente': bench_diretorio_residente,
+    'cestos_mapeados': bench_cestos_mapeados,
+    'carga_em_lote': bench_carga_em_lote,
+    'divisao_adversaria': bench_divisao_adversaria,
+    'cache_cestos': bench_cache_cestos,
+    'busca_no_cesto': bench_busca_no_cesto,
+    'scan': bench_scan,
+    'threads': bench_threads,
+    'log': bench_log,
+    'juncao': bench_juncao,
+    'distribuicao_chaves': bench_distribuicao_chaves,
+    'registros_variaveis': bench_registros_variaveis,
+    'codec': bench_codec,
+    'operacoes': bench_operacoes,
+    'async': bench_async,
+    'operacoes_em_lote': bench_operacoes_em_lote,
+    'particoes': bench_particoes,
+    'impressoes': bench_impressoes,
+    'leitores': bench_leitores,
+    'diretorio_paginado': bench_diretorio_paginado,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks da tabela hash extensível")
+    parser.add_argument('nomes', nargs='*', choices=[[]] + list(BENCHMARKS), metavar='benchmark',
+                        help=f"benchmarks a executar (padrão: todos): {', '.join(BENCHMARKS)}")
+    parser.add_argument('--json', help="grava os resultados em um arquivo JSON")
+    parser.add_argument('--compara', help="JSON de uma execução anterior, para apontar regressões")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="variação relativa aceita (padrão: 0.2)")
+    parser.add_argument('--tamanhos', type=int, nargs='+', help="tamanhos das tabelas do benchmark operacoes")
+    args = parser.parse_args()
+    opcoes = {'operacoes': {'tamanhos': args.tamanhos}} if args.tamanhos else {}
+    resultados = {}
+    for nome in args.nomes or list(BENCHMARKS):
+        linhas = BENCHMARKS[nome](**opcoes.get(nome, {}))
+        if linhas is not None:
+            resultados[nome] = linhas
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'plataforma': platform.platform(),
+                       'data': time.strftime('%Y-%m-%dT%H:%M:%S'), 'resultados': resultados}, f, indent=2, ensure_ascii=False)
+    if args.compara:
+        with open(args.compara, encoding='utf-8') as f:
+            base = json.load(f)['resultados']
+        regressoes = compara_resultados(resultados, base, args.tolerancia)
+        print(f"\n{len(regressoes)} regressões em relação a {args.compara}")
+        for nome, linha, metrica, anterior in regressoes:
+            print(f"{nome}: capacidade {linha['capacidade']}, {linha['distribuicao']}, {linha['registros']} registros, "
+                  f"{linha['operacao']}: {metrica} {anterior:.1f} -> {linha[metrica]:.1f}")
+        if regressoes:
+            sys.exit(1)
@@ -1,13 +1,164 @@
+import asyncio
+import heapq
+import mmap
+import multiprocessing
 import os
 import struct
+import sys
+import threading
+import time
+import zlib
 from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import List, Type, TypeVar, Generic
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 T = TypeVar('T', bound='RegistroHashExtensivel')
 
+MASCARA_64 = (1 << 64) - 1
+
+# Funções de hash da tabela: recebem a chave e retornam um inteiro não negativo,
+# do qual o diretório usa os bits mais baixos
+
+def hash_splitmix64(chave: int) -> int:
+    # Mistura os 64 bits da chave (finalizador do splitmix64), para que chaves sequenciais ou com os
+    # bits baixos em comum se espalhem pelo diretório e k e -k caiam em posições diferentes
+    z = (chave + 0x9E3779B97F4A7C15) & MASCARA_64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASCARA_64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASCARA_64
+    return z ^ (z >> 31)
+
+def hash_modulo(chave: int) -> int:
+    # Usa a própria chave, como a versão original (abs(chave) % 2^profundidade)
+    return abs(chave)
+
+# Nomes gravados em nd + '.hash' para as funções de hash conhecidas; funções próprias registradas aqui
+# também são escolhidas automaticamente ao reabrir a tabela sem informar funcao_hash
+FUNCOES_HASH = {'splitmix64': hash_splitmix64, 'modulo': hash_modulo}
+
+def _nome_funcao_hash(funcao) -> str:
+    for nome, conhecida in FUNCOES_HASH.items():
+        if conhecida is funcao:
+            return nome
+    return f'{funcao.__module__}.{funcao.__qualname__}'
+
+def _funcao_hash_tabela(nd: str, funcao_hash, nova: bool, somente_leitura: bool = False):
+    # Escolhe a função de hash de uma tabela pelo nome gravado em nd + '.hash'
+    # Uma tabela nova grava o nome da função informada (hash_splitmix64 se for None). Uma tabela existente
+    # sem o arquivo é anterior a esse registro e usa hash_modulo, a função original; em uma tabela com o
+    # arquivo, funcao_hash=None escolhe a função gravada, e uma função diferente da gravada é recusada
+    # Com somente_leitura, o arquivo nunca é criado
+    nome_arquivo = nd + '.hash'
+    if nova or not os.path.exists(nome_arquivo):
+        funcao = funcao_hash or (hash_splitmix64 if nova else hash_modulo)
+        if somente_leitura:
+            return funcao
+        with open(nome_arquivo, 'w') as f:
+            f.write(_nome_funcao_hash(funcao))
+        return funcao
+    with open(nome_arquivo) as f:
+        gravado = f.read().strip()
+    if funcao_hash is None:
+        if gravado not in FUNCOES_HASH:
+            raise Exception(f"A tabela usa a função de hash '{gravado}': informe-a em funcao_hash")
+        return FUNCOES_HASH[gravado]
+    if _nome_funcao_hash(funcao_hash) != gravado:
+        raise Exception(f"A tabela foi criada com a função de hash '{gravado}', "
+                        f"não com '{_nome_funcao_hash(funcao_hash)}'")
+    return funcao_hash
+
+def _confere_particoes(nome: str, particoes: int):
+    # Confere a quantidade de partições gravada em nome + '.particoes', gravando-a se a tabela for nova
+    # Tabelas anteriores a esse registro são conferidas pelos arquivos de diretório das partições existentes
+    nome_arquivo = nome + '.particoes'
+    if os.path.exists(nome_arquivo):
+        with open(nome_arquivo) as f:
+            gravadas = int(f.read())
+    else:
+        gravadas = 0
+        while os.path.exists(f'{nome}.{gravadas}.dir.bin'):
+            gravadas += 1
+    if gravadas and gravadas != particoes:
+        raise Exception(f"A tabela foi criada com {gravadas} partições, não com {particoes}")
+    if not os.path.exists(nome_arquivo):
+        with open(nome_arquivo, 'w') as f:
+            f.write(str(particoes))
+
+def impressao_chave(chave: int) -> int:
+    # Impressão digital de 16 bits da chave: os bits altos de um hash multiplicativo, independente da
+    # funcao_hash da tabela (cujos bits baixos escolhem o cesto)
+    return ((chave * 0x9E3779B97F4A7C15) & MASCARA_64) >> 48
+
+# Tipos do NumPy equivalentes aos códigos do struct com tamanhos padrão
+_TIPOS_NUMPY = {'b': 'i1', 'B': 'u1', '?': 'b1', 'h': 'i2', 'H': 'u2', 'i': 'i4', 'I': 'u4', 'l': 'i4',
+                'L': 'u4', 'q': 'i8', 'Q': 'u8', 'e': 'f2', 'f': 'f4', 'd': 'f8'}
+
+def _dtype_numpy(formato: str, deslocamento: int = 0, tamanho: int = None):
+    # Converte um formato struct com ordem de bytes explícita (ex.: '>i20s') em um dtype estruturado
+    # do NumPy, com os campos f0, f1... a partir do deslocamento e itemsize igual a tamanho
+    # Retorna None se o NumPy não estiver instalado ou se o formato usar códigos sem equivalente
+    if numpy is None or not formato or formato[0] not in '<>!=':
+        return None
+    ordem = '>' if formato[0] == '!' else formato[0]
+    formatos, posicoes = [], []
+    posicao = deslocamento
+    i = 1
+    while i < len(formato):
+        j = i
+        while j < len(formato) and formato[j].isdigit():
+            j += 1
+        if j == len(formato):
+            return None
+        contagem = int(formato[i:j]) if j > i else 1
+        codigo = formato[j]
+        i = j + 1
+        if codigo.isspace():
+            continue
+        if codigo == 'x':
+            posicao += contagem
+        elif codigo == 's':
+            formatos.append(f'V{contagem}')
+            posicoes.append(posicao)
+            posicao += contagem
+        elif codigo in _TIPOS_NUMPY:
+            for _ in range(contagem):
+                formatos.append(ordem + _TIPOS_NUMPY[codigo])
+                posicoes.append(posicao)
+                posicao += int(_TIPOS_NUMPY[codigo][1])
+        else:
+            return None
+    return numpy.dtype({'names': [f'f{k}' for k in range(len(formatos))], 'formats': formatos,
+                        'offsets': posicoes, 'itemsize': tamanho if tamanho is not None else posicao})
+
 # Classe base abstrata para registros que podem ser usados na tabela hash extensível
 # Deve ser herdada por qualquer classe de registro que será armazenada na tabela
 class RegistroHashExtensivel(ABC):
+    # Posição opcional da chave dentro dos bytes do registro, no formato (deslocamento, formato struct),
+    # por exemplo (0, '>i'). O valor gravado deve ser igual a hash_code(). Quando definido, a tabela
+    # pode buscar a chave diretamente nos bytes do cesto, sem desserializar os registros
+    formato_chave = None
+    # Formato struct opcional do registro inteiro, com ordem de bytes explícita (ex.: '>i20s'), de
+    # tamanho igual a size(). Quando definido, o registro implementa campos() e de_campos(), e os
+    # cestos são convertidos de uma vez, sem chamar to_byte_array()/from_byte_array() por registro
+    formato_registro = None
+
+    def campos(self) -> tuple:
+        # Retorna os valores dos campos, na ordem de formato_registro
+        raise NotImplementedError
+
+    @classmethod
+    def de_campos(cls, campos: tuple):
+        # Constrói um registro a partir dos valores dos campos
+        raise NotImplementedError
+
     @abstractmethod
     def hash_code(self) -> int:
         # Retorna a chave numérica do registro
@@ -31,6 +182,82 @@ class RegistroHashExtensivel(ABC):
 # Implementação da Tabela Hash Extensível
 # Permite criar, ler, atualizar e deletar registros de tamanho fixo em arquivos binários
 class HashExtensivel(Generic[T]):
+    class CodecRegistros:
+        # Converte os registros de um tipo entre objetos e os bytes dos cestos
+        # É criado uma única vez por tipo de registro e compartilhado pelos cestos
+        # Com formato_registro, usa um struct.Struct pré-compilado para todos os registros do cesto
+        # (e, se o NumPy estiver instalado, um dtype estruturado na gravação); com formato_chave, extrai a
+        # coluna de chaves sem desserializar os registros
+        CABECALHO = struct.Struct('>Bh')
+        codecs = {}
+
+        @classmethod
+        def de(cls, tipo):
+            # Retorna o codec do tipo de registro, criando-o no primeiro uso
+            codec = cls.codecs.get(tipo)
+            if codec is None:
+                codec = cls.codecs.setdefault(tipo, cls(tipo))
+            return codec
+
+        def __init__(self, tipo):
+            self.tipo = tipo
+            self.bytes_por_elemento = bpe = tipo().size()
+            self.struct_registro = self.dtype_registro = None
+            self.struct_chaves = self.dtype_chaves = None
+            if tipo.formato_registro is not None:
+                self.struct_registro = struct.Struct(tipo.formato_registro)
+                if self.struct_registro.size != bpe:
+                    raise Exception("formato_registro não corresponde ao tamanho do registro")
+                self.dtype_registro = _dtype_numpy(tipo.formato_registro)
+            if tipo.formato_chave is not None:
+                deslocamento, formato = tipo.formato_chave
+                ordem, codigo = (formato[0], formato[1:]) if formato[0] in '<>!=@' else ('@', formato)
+                # Cada registro vira um único campo (a chave) cercado de bytes ignorados
+                ordem = '=' if ordem == '@' else ordem
+                fim = deslocamento + struct.calcsize(ordem + codigo)
+                self.struct_chaves = struct.Struct(f'{ordem}{deslocamento}x{codigo}{bpe - fim}x')
+                self.dtype_chaves = _dtype_numpy(ordem + codigo, deslocamento, bpe)
+
+        def chaves(self, dados):
+            # Extrai a coluna de chaves dos bytes dos registros, ou retorna None sem formato_chave
+            if self.dtype_chaves is not None:
+                return array('q', numpy.frombuffer(dados, self.dtype_chaves)['f0'].astype(numpy.int64).tobytes())
+            if self.struct_chaves is not None:
+                return array('q', [chave for (chave,) in self.struct_chaves.iter_unpack(dados)])
+            return None
+
+        def decodifica(self, ba, quantidade: int) -> List[T]:
+            # Desserializa apenas os registros válidos do cesto (os espaços vazios não são lidos)
+            bpe = self.bytes_por_elemento
+            fim = 3 + quantidade * bpe
+            if self.struct_registro is not None:
+                de_campos = self.tipo.de_campos
+                return [de_campos(campos) for campos in self.struct_registro.iter_unpack(memoryview(ba)[3:fim])]
+            elementos = []
+            for inicio in range(3, fim, bpe):
+                elem = self.tipo()
+                elem.from_byte_array(bytes(ba[inicio:inicio + bpe]))
+                elementos.append(elem)
+            return elementos
+
+        def codifica(self, pl: int, elementos: List[T], bytes_por_cesto: int) -> bytes:
+            # Serializa o cabeçalho e os registros em um buffer pré-alocado, já zerado nos espaços vazios
+            ba = bytearray(bytes_por_cesto)
+            self.CABECALHO.pack_into(ba, 0, pl, len(elementos))
+            bpe = self.bytes_por_elemento
+            if self.dtype_registro is not None and elementos:
+                ba[3:3 + len(elementos) * bpe] = numpy.array([e.campos() for e in elementos], self.dtype_registro).tobytes()
+            elif self.struct_registro is not None:
+                pack_into = self.struct_registro.pack_into
+                for i, elem in enumerate(elementos):
+                    pack_into(ba, 3 + i * bpe, *elem.campos())
+            else:
+                dados = b''.join([elem.to_byte_array() for elem in elementos])
+                if len(dados) != len(elementos) * bpe:
+                    raise Exception("Registro serializado com tamanho diferente de size()")
+                ba[3:3 + len(dados)] = dados
+            return bytes(ba)
+
     class Cesto:
         # Cesto (bucket) armazena os registros e controla a profundidade local
         def __init__(self, cls: Type[T], qtdmax: int, pl: int = 0):
@@ -43,83 +270,71 @@ class HashExtensivel(Generic[T]):
             self.quantidade = 0
             self.quantidade_maxima = qtdmax
             self.elementos: List[T] = []
-            self.bytes_por_elemento = cls().size()
+            # Chaves dos elementos válidos, na mesma ordem, para busca binária sem chamar hash_code()
+            self.chaves = array('q')
+            self.codec = HashExtensivel.CodecRegistros.de(cls)
+            self.bytes_por_elemento = self.codec.bytes_por_elemento
             self.bytes_por_cesto = self.bytes_por_elemento * self.quantidade_maxima + 3
 
         def to_byte_array(self) -> bytes:
             # Serializa o cesto para bytes
-            ba = bytearray()
-            ba.append(self.profundidade_local)
-            ba += struct.pack('>h', self.quantidade)
-            i = 0
-            while i < self.quantidade:
-                ba += self.elementos[i].to_byte_array()
-                i += 1
-            vazio = bytes(self.bytes_por_elemento)
-            while i < self.quantidade_maxima:
-                ba += vazio
-                i += 1
-            return bytes(ba)
+            return self.codec.codifica(self.profundidade_local, self.elementos[:self.quantidade], self.bytes_por_cesto)
 
         def from_byte_array(self, ba: bytes):
-            # Carrega o cesto a partir de bytes
-            self.profundidade_local = ba[0]
-            self.quantidade = struct.unpack('>h', ba[1:3])[0]
-            self.elementos = []
-            offset = 3
-            for i in range(self.quantidade_maxima):
-                dados = ba[offset:offset+self.bytes_por_elemento]
-                elem = self.cls()
-                elem.from_byte_array(dados)
-                self.elementos.append(elem)
-                offset += self.bytes_por_elemento
+            # Carrega o cesto a partir de bytes, desserializando apenas os registros válidos
+            self.profundidade_local, self.quantidade = self.codec.CABECALHO.unpack_from(ba)
+            self.elementos = self.codec.decodifica(ba, self.quantidade)
+            chaves = self.codec.chaves(memoryview(ba)[3:3 + self.quantidade * self.bytes_por_elemento])
+            self.chaves = chaves if chaves is not None else array('q', [e.hash_code() for e in self.elementos])
+
+        def define_elementos(self, elementos: List[T]):
+            # Substitui o conteúdo do cesto pelos elementos informados, ordenados pela chave
+            self.elementos = sorted(elementos, key=lambda e: e.hash_code())
+            self.chaves = array('q', [e.hash_code() for e in self.elementos])
+            self.quantidade = len(self.elementos)
+
+        def _posicao(self, chave: int) -> int:
+            # Retorna a posição da chave no cesto, ou -1 se ela não estiver presente
+            i = bisect_left(self.chaves, chave)
+            if i < self.quantidade and self.chaves[i] == chave:
+                return i
+            return -1
 
         def create(self, elem: T) -> bool:
             # Insere um elemento ordenadamente no cesto
             if self.full():
                 return False
-            i = self.quantidade - 1
-            while i >= 0 and elem.hash_code() < self.elementos[i].hash_code():
-                i -= 1
-            self.elementos.insert(i+1, elem)
+            chave = elem.hash_code()
+            i = bisect_right(self.chaves, chave)
+            self.elementos.insert(i, elem)
+            self.chaves.insert(i, chave)
             self.quantidade += 1
             return True
 
         def read(self, chave: int):
             # Busca um elemento pela chave
-            if self.empty():
+            i = self._posicao(chave)
+            if i < 0:
                 return None
-            i = 0
-            while i < self.quantidade and chave > self.elementos[i].hash_code():
-                i += 1
-            if i < self.quantidade and chave == self.elementos[i].hash_code():
-                return self.elementos[i]
-            return None
+            return self.elementos[i]
 
         def update(self, elem: T) -> bool:
             # Atualiza um elemento existente
-            if self.empty():
+            i = self._posicao(elem.hash_code())
+            if i < 0:
                 return False
-            i = 0
-            while i < self.quantidade and elem.hash_code() > self.elementos[i].hash_code():
-                i += 1
-            if i < self.quantidade and elem.hash_code() == self.elementos[i].hash_code():
-                self.elementos[i] = elem
-                return True
-            return False
+            self.elementos[i] = elem
+            return True
 
         def delete(self, chave: int) -> bool:
             # Remove um elemento pela chave
-            if self.empty():
+            i = self._posicao(chave)
+            if i < 0:
                 return False
-            i = 0
-            while i < self.quantidade and chave > self.elementos[i].hash_code():
-                i += 1
-            if i < self.quantidade and chave == self.elementos[i].hash_code():
-                self.elementos.pop(i)
-                self.quantidade -= 1
-                return True
-            return False
+            self.elementos.pop(i)
+            del self.chaves[i]
+            self.quantidade -= 1
+            return True
 
         def empty(self):
             # Verifica se o cesto está vazio
@@ -144,200 +359,2662 @@ class HashExtensivel(Generic[T]):
 
     class Diretorio:
         # Diretório controla os endereços dos cestos e a profundidade global
-        def __init__(self):
+        # Os endereços ficam em um array('q') (8 bytes por entrada, sem um objeto int por posição), duplicado
+        # e reduzido com cópias em bloco. Para a gravação, o vetor é dividido em páginas de
+        # ENTRADAS_POR_PAGINA entradas: divisões e junções marcam apenas as páginas das posições alteradas
+        # Este é o diretório residente, com o vetor inteiro em memória; sem diretorio_residente, a tabela usa
+        # DiretorioPaginado, que lê as páginas do arquivo sob demanda
+        BITS_PAGINA = 9
+        ENTRADAS_POR_PAGINA = 1 << BITS_PAGINA
+        # Varreduras do vetor inteiro (faixas()) e gravações de trechos longos são feitas em faixas deste tamanho
+        ENTRADAS_POR_FAIXA = 1 << 18
+
+        def __init__(self, funcao_hash=hash_splitmix64, registra_log: bool = False):
+            self.funcao_hash = funcao_hash
             self.profundidade_global = 0
-            self.enderecos = [0]
+            self.enderecos = array('q', [0])
+            # Páginas alteradas e profundidade presente no arquivo desde a última gravação
+            self.paginas_alteradas = set()
+            self.profundidade_gravada = -1
+            # Menor profundidade desde a última gravação: após reduções seguidas de duplicações,
+            # a parte do vetor acima dela precisa ser regravada por inteiro
+            self.profundidade_minima = 0
+            # O mesmo controle, em relação ao último registro no log de operações (as posições alteradas
+            # só são guardadas com registra_log, isto é, quando a tabela tem um log)
+            self.registra_log = registra_log
+            self.alterados_log = set()
+            self.profundidade_registrada = 0
+            self.profundidade_minima_log = 0
 
         def atualiza_endereco(self, p, e):
             # Atualiza o endereço de um cesto no diretório
-            if p >= 2 ** self.profundidade_global:
+            if p >= len(self.enderecos):
                 return False
             self.enderecos[p] = e
+            self.paginas_alteradas.add(p >> self.BITS_PAGINA)
+            if self.registra_log:
+                self.alterados_log.add(p)
             return True
 
+        def atualiza_faixa(self, inicio, passo, e):
+            # Aponta para o endereço e as posições inicio, inicio + passo, inicio + 2 * passo... até o fim
+            # do vetor (as entradas de um cesto), com uma única atribuição de fatia
+            posicoes = range(inicio, len(self.enderecos), passo)
+            if not posicoes:
+                return
+            self.enderecos[inicio::passo] = array('q', [e]) * len(posicoes)
+            if passo >= self.ENTRADAS_POR_PAGINA:
+                self.paginas_alteradas.update(p >> self.BITS_PAGINA for p in posicoes)
+            else:
+                self.paginas_alteradas.update(range(inicio >> self.BITS_PAGINA, (posicoes[-1] >> self.BITS_PAGINA) + 1))
+            if self.registra_log:
+                self.alterados_log.update(posicoes)
+
+        def __len__(self):
+            return len(self.enderecos)
+
+        def faixa(self, inicio, fim) -> array:
+            # Retorna uma cópia dos endereços das posições [inicio, fim)
+            return self.enderecos[inicio:fim]
+
+        def faixas(self):
+            # Percorre o vetor em faixas de até ENTRADAS_POR_FAIXA entradas, gerando (início, endereços)
+            quantidade = len(self)
+            for inicio in range(0, quantidade, self.ENTRADAS_POR_FAIXA):
+                yield inicio, self.faixa(inicio, min(inicio + self.ENTRADAS_POR_FAIXA, quantidade))
+
+        def bytes_faixa(self, inicio, fim) -> bytes:
+            # Serializa os endereços das posições [inicio, fim) em big-endian
+            faixa = self.faixa(inicio, fim)
+            if sys.byteorder == 'little':
+                faixa.byteswap()
+            return faixa.tobytes()
+
         def to_byte_array(self) -> bytes:
             # Serializa o diretório para bytes
-            ba = bytearray()
-            ba.append(self.profundidade_global)
-            quantidade = 2 ** self.profundidade_global
-            for i in range(quantidade):
-                ba += struct.pack('>q', self.enderecos[i])
-            return bytes(ba)
+            return bytes([self.profundidade_global]) + self.bytes_faixa(0, len(self.enderecos))
 
         def from_byte_array(self, ba: bytes):
-            # Carrega o diretório a partir de bytes
+            # Carrega o diretório a partir de bytes (bytes após o vetor são ignorados)
             self.profundidade_global = ba[0]
-            quantidade = 2 ** self.profundidade_global
-            self.enderecos = []
-            offset = 1
-            for i in range(quantidade):
-                endereco = struct.unpack('>q', ba[offset:offset+8])[0]
-                self.enderecos.append(endereco)
-                offset += 8
+            enderecos = array('q')
+            enderecos.frombytes(ba[1:1 + 8 * 2 ** self.profundidade_global])
+            if sys.byteorder == 'little':
+                enderecos.byteswap()
+            self.enderecos = enderecos
+            self.limpa()
+            self.limpa_log()
 
         def __str__(self):
             # Retorna uma string representando o diretório
             s = f"\nProfundidade global: {self.profundidade_global}"
-            quantidade = 2 ** self.profundidade_global
-            for i in range(quantidade):
-                s += f"\n{i}: {self.enderecos[i]}"
+            for inicio, faixa in self.faixas():
+                for i, e in enumerate(faixa, inicio):
+                    s += f"\n{i}: {e}"
             return s
 
         def endereco(self, p):
             # Retorna o endereço do cesto correspondente
-            if p >= 2 ** self.profundidade_global:
+            if p >= len(self.enderecos):
                 return -1
             return self.enderecos[p]
 
         def duplica(self):
-            # Duplica o diretório quando necessário
+            # Duplica o diretório quando necessário: a posição i + 2^(p-1) aponta para o mesmo cesto que i,
+            # então a nova metade é uma cópia em bloco da antiga
             if self.profundidade_global == 127:
                 return False
             self.profundidade_global += 1
-            q1 = 2 ** (self.profundidade_global - 1)
-            q2 = 2 ** self.profundidade_global
-            novos_enderecos = [0] * q2
-            for i in range(q1):
-                novos_enderecos[i] = self.enderecos[i]
-            for i in range(q1, q2):
-                novos_enderecos[i] = self.enderecos[i - q1]
-            self.enderecos = novos_enderecos
+            self.enderecos *= 2
             return True
 
+        def reduz(self):
+            # Reduz o diretório à metade quando nenhum cesto usa a profundidade global inteira,
+            # isto é, quando as duas metades do vetor apontam para os mesmos cestos
+            if self.profundidade_global == 0:
+                return False
+            metade = 2 ** (self.profundidade_global - 1)
+            with memoryview(self.enderecos) as vetor:
+                iguais = vetor[:metade] == vetor[metade:]
+            if not iguais:
+                return False
+            self.profundidade_global -= 1
+            del self.enderecos[metade:]
+            self.profundidade_minima = min(self.profundidade_minima, self.profundidade_global)
+            self.profundidade_minima_log = min(self.profundidade_minima_log, self.profundidade_global)
+            return True
+
+        def sujo(self):
+            # Indica se há alterações ainda não gravadas no arquivo
+            return (self.profundidade_gravada != self.profundidade_global
+                    or self.profundidade_minima != self.profundidade_global or len(self.paginas_alteradas) > 0)
+
+        def limpa(self):
+            # Marca o diretório como sincronizado com o arquivo
+            self.paginas_alteradas = set()
+            self.profundidade_gravada = self.profundidade_global
+            self.profundidade_minima = self.profundidade_global
+
+        def limpa_log(self):
+            # Marca o diretório como totalmente registrado no log
+            self.alterados_log = set()
+            self.profundidade_registrada = self.profundidade_global
+            self.profundidade_minima_log = self.profundidade_global
+
+        def alteracoes_log(self):
+            # Retorna as posições (e seus endereços) alteradas desde o último registro no log,
+            # incluindo toda a parte nova do vetor após duplicações, e marca o log como atualizado
+            # Retorna None se nada mudou
+            pg = self.profundidade_global
+            if self.profundidade_registrada == pg and self.profundidade_minima_log == pg and not self.alterados_log:
+                return None
+            inicio = 2 ** min(self.profundidade_registrada, self.profundidade_minima_log)
+            quantidade = 2 ** pg
+            posicoes = sorted(p for p in self.alterados_log if p < min(inicio, quantidade))
+            posicoes += range(inicio, quantidade)
+            self.limpa_log()
+            return [(p, self.enderecos[p]) for p in posicoes]
+
+        def aplica(self, profundidade, alteracoes):
+            # Aplica alterações registradas no log, ajustando a profundidade global
+            quantidade = 2 ** profundidade
+            if len(self.enderecos) < quantidade:
+                self.enderecos.extend(array('q', [0]) * (quantidade - len(self.enderecos)))
+            else:
+                del self.enderecos[quantidade:]
+            self.profundidade_global = profundidade
+            for p, e in alteracoes:
+                self.enderecos[p] = e
+
         def hash(self, chave):
-            # Calcula o índice do diretório para uma chave
-            return abs(chave) % (2 ** self.profundidade_global)
+            # Calcula o índice do diretório para uma chave (os bits mais baixos do hash)
+            return self.funcao_hash(chave) & ((1 << self.profundidade_global) - 1)
 
         def hash2(self, chave, pl):
             # Calcula o índice para uma profundidade local
-            return abs(chave) % (2 ** pl)
+            return self.funcao_hash(chave) & ((1 << pl) - 1)
+
+    class DiretorioPaginado(Diretorio):
+        # Diretório sem o vetor em memória, usado sem diretorio_residente: guarda apenas a profundidade global
+        # e as páginas lidas do arquivo (com le(posição, tamanho)) desde a última gravação ou recarga
+        # As entradas do arquivo valem até 2^min(profundidade gravada, profundidade mínima); após duplicações
+        # ainda não gravadas, uma página além desse limite é a cópia da página correspondente do arquivo, e
+        # as páginas já lidas são copiadas na própria duplicação. A gravação (_salva_diretorio_arquivo)
+        # descarta as páginas, então a memória fica limitada às páginas usadas por uma operação
+        def __init__(self, funcao_hash, le):
+            super().__init__(funcao_hash)
+            self.le = le
+            self.enderecos = None
+            self.paginas = {}
+            self.profundidade_global = le(0, 1)[0]
+            self.limpa()
+
+        def recarrega(self):
+            # Relê a profundidade global e descarta as páginas lidas, a menos que haja alterações não gravadas
+            if self.sujo():
+                return
+            self.profundidade_global = self.le(0, 1)[0]
+            self.limpa()
+
+        def limpa(self):
+            super().limpa()
+            self.paginas = {}
+
+        def __len__(self):
+            return 1 << self.profundidade_global
+
+        def _le_entradas(self, inicio, fim) -> array:
+            # Lê do arquivo os endereços das posições [inicio, fim)
+            enderecos = array('q')
+            enderecos.frombytes(self.le(1 + 8 * inicio, 8 * (fim - inicio)))
+            if sys.byteorder == 'little':
+                enderecos.byteswap()
+            return enderecos
+
+        def _validas(self) -> int:
+            # Quantidade de entradas do início do arquivo que ainda correspondem ao diretório
+            return 1 << min(self.profundidade_gravada, self.profundidade_minima, self.profundidade_global)
+
+        def _pagina(self, k, guarda=True) -> array:
+            # Retorna a página k, lendo-a do arquivo (e guardando-a, com guarda) se ainda não foi lida
+            pagina = self.paginas.get(k)
+            if pagina is None:
+                inicio = k << self.BITS_PAGINA
+                fim = min(inicio + self.ENTRADAS_POR_PAGINA, len(self))
+                origem = inicio % self._validas()
+                pagina = self._le_entradas(origem, origem + fim - inicio)
+                if guarda:
+                    self.paginas[k] = pagina
+            return pagina
+
+        def endereco(self, p):
+            if p >= len(self):
+                return -1
+            return self._pagina(p >> self.BITS_PAGINA)[p & (self.ENTRADAS_POR_PAGINA - 1)]
+
+        def atualiza_endereco(self, p, e):
+            if p >= len(self):
+                return False
+            self._pagina(p >> self.BITS_PAGINA)[p & (self.ENTRADAS_POR_PAGINA - 1)] = e
+            self.paginas_alteradas.add(p >> self.BITS_PAGINA)
+            return True
+
+        def atualiza_faixa(self, inicio, passo, e):
+            # Como Diretorio.atualiza_faixa, página a página (com uma atribuição de fatia em cada uma)
+            quantidade = len(self)
+            if inicio >= quantidade:
+                return
+            epp = self.ENTRADAS_POR_PAGINA
+            if passo >= epp:
+                for p in range(inicio, quantidade, passo):
+                    self._pagina(p >> self.BITS_PAGINA)[p & (epp - 1)] = e
+                    self.paginas_alteradas.add(p >> self.BITS_PAGINA)
+                return
+            for k in range(inicio >> self.BITS_PAGINA, ((quantidade - 1) >> self.BITS_PAGINA) + 1):
+                base = k << self.BITS_PAGINA
+                primeira = inicio - base if inicio >= base else (inicio - base) % passo
+                pagina = self._pagina(k)
+                pagina[primeira::passo] = array('q', [e]) * len(range(primeira, len(pagina), passo))
+                self.paginas_alteradas.add(k)
+
+        def faixa(self, inicio, fim) -> array:
+            # Monta os endereços das posições [inicio, fim) sem guardar as páginas: as páginas já lidas vêm
+            # da memória, e os trechos entre elas, de uma única leitura do arquivo cada
+            epp = self.ENTRADAS_POR_PAGINA
+            validas = self._validas()
+            enderecos = array('q')
+            p = inicio
+            while p < fim:
+                k = p >> self.BITS_PAGINA
+                pagina = self.paginas.get(k)
+                if pagina is not None:
+                    ate = min((k + 1) * epp, fim)
+                    enderecos.extend(pagina[p - k * epp:ate - k * epp])
+                else:
+                    # Até a próxima página lida, o fim da faixa ou o fim de uma cópia das entradas do arquivo
+                    ate = min([fim, (p // validas + 1) * validas] +
+                              [j * epp for j in self.paginas if j * epp > p])
+                    origem = p % validas
+                    enderecos.extend(self._le_entradas(origem, origem + ate - p))
+                p = ate
+            return enderecos
+
+        def duplica(self):
+            # A nova metade não é lida nem copiada: suas páginas são cópias das páginas do arquivo, exceto as
+            # que já estão em memória, copiadas aqui
+            if self.profundidade_global == 127:
+                return False
+            quantidade = len(self)
+            if quantidade < self.ENTRADAS_POR_PAGINA:
+                pagina = self._pagina(0)
+                pagina *= 2
+            else:
+                paginas = quantidade >> self.BITS_PAGINA
+                for k, pagina in list(self.paginas.items()):
+                    self.paginas[k + paginas] = array('q', pagina)
+            self.profundidade_global += 1
+            return True
+
+        def reduz(self):
+            # Compara as duas metades faixa a faixa, sem guardar as páginas lidas
+            if self.profundidade_global == 0:
+                return False
+            metade = len(self) // 2
+            for inicio in range(0, metade, self.ENTRADAS_POR_FAIXA):
+                fim = min(inicio + self.ENTRADAS_POR_FAIXA, metade)
+                if self.faixa(inicio, fim) != self.faixa(metade + inicio, metade + fim):
+                    return False
+            self.profundidade_global -= 1
+            for k in [k for k in self.paginas if k * self.ENTRADAS_POR_PAGINA >= metade]:
+                del self.paginas[k]
+            if metade < self.ENTRADAS_POR_PAGINA and 0 in self.paginas:
+                del self.paginas[0][metade:]
+            self.profundidade_minima = min(self.profundidade_minima, self.profundidade_global)
+            return True
+
+    class CacheCestos:
+        # Cache LRU de cestos já desserializados, indexado pelo endereço do cesto
+        def __init__(self, capacidade: int):
+            self.capacidade = capacidade
+            self.paginas = OrderedDict()
+            # Endereços de cestos alterados em memória e ainda não gravados no arquivo
+            self.sujas = set()
+            self.acertos = 0
+            self.faltas = 0
+            self.despejos = 0
+
+        def busca(self, endereco: int):
+            # Retorna o cesto guardado no endereço, ou None se não estiver no cache
+            c = self.paginas.get(endereco)
+            if c is None:
+                self.faltas += 1
+                return None
+            self.paginas.move_to_end(endereco)
+            self.acertos += 1
+            return c
+
+        def insere(self, endereco: int, c, sujo: bool = False):
+            # Guarda o cesto como o mais recente e despeja os menos usados além da capacidade
+            # Retorna os cestos sujos despejados, que ainda precisam ser gravados
+            self.paginas[endereco] = c
+            self.paginas.move_to_end(endereco)
+            if sujo:
+                self.sujas.add(endereco)
+            despejados = []
+            while len(self.paginas) > self.capacidade:
+                e, antigo = self.paginas.popitem(last=False)
+                self.despejos += 1
+                if e in self.sujas:
+                    self.sujas.discard(e)
+                    despejados.append((e, antigo))
+            return despejados
+
+        def esvazia(self):
+            # Descarta todos os cestos guardados (que não podem estar sujos)
+            self.paginas.clear()
+
+        def retira_sujas(self):
+            # Retorna os cestos sujos em ordem de endereço e os marca como gravados
+            sujas = [(e, self.paginas[e]) for e in sorted(self.sujas)]
+            self.sujas = set()
+            return sujas
+
+        def estatisticas(self):
+            # Retorna os contadores do cache
+            return {
+                'capacidade': self.capacidade,
+                'ocupacao': len(self.paginas),
+                'sujas': len(self.sujas),
+                'acertos': self.acertos,
+                'faltas': self.faltas,
+                'despejos': self.despejos,
+            }
+
+    class LogOperacoes:
+        # Log de escrita antecipada (write-ahead log) com as imagens dos cestos e as posições
+        # do diretório gravadas por cada operação. Cada operação vira um grupo de entradas
+        # terminado por uma marca de confirmação com CRC32; grupos incompletos são descartados
+        CESTO = b'C'
+        DIRETORIO = b'D'
+        CONFIRMA = b'F'
+
+        def __init__(self, nome: str, intervalo_sync: float):
+            self.nome = nome
+            self.intervalo_sync = intervalo_sync
+            self.arquivo = open(nome, 'r+b') if os.path.exists(nome) else open(nome, 'w+b')
+            self.grupo = bytearray()
+            self.nao_sincronizados = 0
+            self.ultimo_sync = time.monotonic()
+            # Quantidade de grupos confirmados desde a última sincronização que força a gravação
+            self.max_pendentes = 1024
+
+        def registra_cesto(self, endereco: int, ba: bytes):
+            # Acrescenta a imagem de um cesto ao grupo da operação atual
+            self.grupo += self.CESTO + struct.pack('>qI', endereco, len(ba)) + ba
 
-    def __init__(self, cls: Type[T], n: int, nd: str, nc: str):
+        def registra_diretorio(self, profundidade: int, alteracoes):
+            # Acrescenta as posições alteradas do diretório ao grupo da operação atual
+            self.grupo += self.DIRETORIO + struct.pack('>BI', profundidade, len(alteracoes))
+            for p, e in alteracoes:
+                self.grupo += struct.pack('>qq', p, e)
+
+        def confirma(self) -> bool:
+            # Grava o grupo da operação atual no fim do log
+            # Retorna True se o log deve ser sincronizado agora
+            if not self.grupo:
+                return False
+            self.grupo += self.CONFIRMA + struct.pack('>I', zlib.crc32(self.grupo))
+            self.arquivo.seek(0, 2)
+            self.arquivo.write(self.grupo)
+            self.grupo = bytearray()
+            self.nao_sincronizados += 1
+            return (self.intervalo_sync <= 0 or self.nao_sincronizados >= self.max_pendentes
+                    or time.monotonic() - self.ultimo_sync >= self.intervalo_sync)
+
+        def sincroniza(self):
+            # Garante que os grupos confirmados estão no disco (group commit)
+            self.arquivo.flush()
+            os.fsync(self.arquivo.fileno())
+            self.nao_sincronizados = 0
+            self.ultimo_sync = time.monotonic()
+
+        def trunca(self):
+            # Esvazia o log (após um checkpoint)
+            self.arquivo.seek(0)
+            self.arquivo.truncate()
+            self.arquivo.flush()
+            os.fsync(self.arquivo.fileno())
+
+        def grupos(self):
+            # Lê os grupos completos do log, na ordem em que foram gravados
+            # Gera listas de entradas (tipo, dados); para no primeiro grupo incompleto ou corrompido
+            self.arquivo.seek(0)
+            ba = self.arquivo.read()
+            inicio = offset = 0
+            entradas = []
+            while offset < len(ba):
+                tipo = ba[offset:offset + 1]
+                if tipo == self.CESTO and offset + 13 <= len(ba):
+                    endereco, tamanho = struct.unpack_from('>qI', ba, offset + 1)
+                    fim = offset + 13 + tamanho
+                    entradas.append((tipo, (endereco, ba[offset + 13:fim])))
+                elif tipo == self.DIRETORIO and offset + 6 <= len(ba):
+                    profundidade, quantidade = struct.unpack_from('>BI', ba, offset + 1)
+                    fim = offset + 6 + 16 * quantidade
+                    pares = struct.unpack_from(f'>{2 * quantidade}q', ba, offset + 6) if fim <= len(ba) else ()
+                    entradas.append((tipo, (profundidade, list(zip(pares[::2], pares[1::2])))))
+                elif tipo == self.CONFIRMA and offset + 5 <= len(ba):
+                    if struct.unpack_from('>I', ba, offset + 1)[0] != zlib.crc32(ba[inicio:offset]):
+                        return
+                    yield entradas
+                    entradas = []
+                    inicio = offset = offset + 5
+                    continue
+                else:
+                    return
+                if fim > len(ba):
+                    return
+                offset = fim
+
+        def close(self):
+            self.arquivo.close()
+
+    class TravaLeituraEscrita:
+        # Trava que permite vários leitores simultâneos ou um único escritor
+        # Escritores esperando têm prioridade, para que divisões não fiquem bloqueadas por leituras
+        def __init__(self):
+            self.condicao = threading.Condition(threading.Lock())
+            self.leitores = 0
+            self.escritor = False
+            self.escritores_esperando = 0
+
+        @contextmanager
+        def leitura(self):
+            with self.condicao:
+                while self.escritor or self.escritores_esperando:
+                    self.condicao.wait()
+                self.leitores += 1
+            try:
+                yield
+            finally:
+                with self.condicao:
+                    self.leitores -= 1
+                    if self.leitores == 0:
+                        self.condicao.notify_all()
+
+        @contextmanager
+        def escrita(self):
+            with self.condicao:
+                self.escritores_esperando += 1
+                while self.escritor or self.leitores:
+                    self.condicao.wait()
+                self.escritores_esperando -= 1
+                self.escritor = True
+            try:
+                yield
+            finally:
+                with self.condicao:
+                    self.escritor = False
+                    self.condicao.notify_all()
+
+    # Contadores retornados por stats()
+    CONTADORES = ('leituras', 'gravacoes', 'bytes_lidos', 'bytes_gravados', 'leituras_diretorio',
+                  'gravacoes_diretorio', 'leituras_cestos', 'gravacoes_cestos', 'buscas_diretas', 'divisoes',
+                  'duplicacoes', 'juncoes', 'reducoes', 'profundidade_divisao_maxima', 'negativos_impressoes',
+                  'falsos_positivos_impressoes')
+
+    def __init__(self, cls: Type[T], n: int, nd: str, nc: str, diretorio_residente: bool = True,
+                 mmap_cestos: bool = False, cache_cestos: int = 0, escrita_adiada: bool = True,
+                 arquivo_log: str = None, intervalo_sync: float = 0.0, junta_cestos: bool = True,
+                 funcao_hash=None, impressoes: bool = False, leitores: bool = False):
         # Inicializa a tabela hash extensível, criando arquivos se necessário
+        # Com diretorio_residente, o diretório é lido uma única vez e mantido em memória; sem ele, cada
+        # operação relê a profundidade global e as páginas que usa (DiretorioPaginado), e a lista de cestos
+        # livres é gravada em nd + '.livres' no close() para evitar percorrer o diretório na abertura
+        # Com mmap_cestos, o arquivo de cestos é mapeado em memória e as buscas leem as chaves
+        # diretamente do mapeamento (requer cls.formato_chave para evitar desserializar o cesto)
+        # Com cache_cestos > 0, até essa quantidade de cestos fica em um cache LRU; com escrita_adiada,
+        # os cestos alterados só são gravados quando despejados, em flush() ou em close()
+        # (write-back); sem ela, cada alteração é gravada imediatamente (write-through)
+        # A tabela pode ser compartilhada entre threads: os arquivos são lidos e gravados com
+        # os.pread/os.pwrite (sem cursor compartilhado), cada cesto é protegido por uma trava própria
+        # e o diretório só é travado com exclusividade durante divisões e duplicações
+        # Com arquivo_log, cada operação é registrada antes em um log de escrita antecipada, e as
+        # gravações nos arquivos da tabela só acontecem depois que o log é sincronizado com o disco
+        # (a cada intervalo_sync segundos, ou a cada operação se for 0; com intervalo_sync > 0, uma thread
+        # sincroniza os grupos confirmados mesmo sem novas operações). Ao abrir, os grupos do log
+        # são reaplicados, o que também recupera divisões interrompidas; checkpoint() esvazia o log
+        # Nesse modo o diretório precisa ser residente e o cache de cestos é sempre write-through
+        # Com junta_cestos, remoções juntam cestos irmãos que passam a caber em um único cesto e
+        # reduzem o diretório à metade quando possível; os cestos liberados são reutilizados por
+        # divisões futuras, e compact() regrava os dois arquivos sem espaços livres
+        # funcao_hash escolhe a função de hash das chaves (hash_splitmix64 por padrão em tabelas novas). O nome
+        # da função é gravado em nd + '.hash': ao reabrir, None escolhe a função gravada (hash_modulo em
+        # tabelas anteriores a esse registro) e uma função diferente da gravada é recusada
+        # stats() retorna contadores de E/S e de mudanças estruturais, e adiciona_gancho() registra funções
+        # chamadas a cada E/S e a cada divisão, duplicação, junção ou redução
+        # Com impressoes, a tabela mantém em memória uma impressão digital de 16 bits de cada chave, por
+        # cesto, e responde sem ler o cesto às leituras, atualizações e remoções de chaves ausentes na
+        # maioria dos casos. As impressões são gravadas em nc + '.impressoes' no close() e recarregadas na
+        # abertura; se o arquivo não existir ou estiver desatualizado, são refeitas percorrendo os cestos
+        # Com leitores, a tabela publica em nd + '.versao' um contador de sequência (seqlock), ímpar enquanto
+        # uma operação altera os arquivos, e uma época, incrementada pelo compact(). Processos com um
+        # LeitorHashExtensivel consultam os mesmos arquivos mapeados em memória e repetem as buscas que
+        # coincidem com uma alteração. Nesse modo o cache de cestos é sempre write-through e o arquivo do
+        # diretório não é encurtado, pois os leitores podem ter mapeado o trecho final
         self.cls = cls
+        self.contadores = dict.fromkeys(self.CONTADORES, 0)
+        self.ganchos = []
         self.quantidade_dados_por_cesto = n
         self.nome_arquivo_diretorio = nd
         self.nome_arquivo_cestos = nc
+        self.diretorio_residente = diretorio_residente
+        self.mapa = None
+        # Impressões digitais das chaves de cada cesto: {endereço: array('H')}, ou None se desativadas
+        self.impressoes = None
+        self.nome_arquivo_impressoes = nc + '.impressoes'
+        self.cache = self.CacheCestos(cache_cestos) if cache_cestos > 0 else None
+        self.escrita_adiada = escrita_adiada and arquivo_log is None and not leitores
+        self.junta_cestos = junta_cestos
+        if arquivo_log is not None and not diretorio_residente:
+            raise Exception("O log de operações requer o diretório residente")
+        self.log = None
+        # Imagens de cestos já registradas no log e ainda não gravadas no arquivo de cestos
+        self.pendentes = {}
+        self.fim_pendente = 0
+        # Funções chamadas antes de cada sincronização do log, para tornar duráveis os arquivos para os
+        # quais as entradas registradas apontam (o heap da HashExtensivelVariavel)
+        self.antes_sincronizar_log = []
+        self.trava_diretorio = self.TravaLeituraEscrita()
+        # Travas dos cestos, distribuídas pelo endereço; com o cache ativo, uma única trava protege o cache
+        self.travas_cestos = [threading.Lock() for _ in range(64)]
+        self.trava_cache = threading.Lock()
+        self.trava_total = threading.Lock()
+        # Contador de gerações: cada alteração de cesto recebe a próxima geração, para que visualizadores
+        # releiam apenas os cestos alterados desde a última consulta (ver alteracoes_desde())
+        self.geracao = 0
+        self.geracoes_cestos = {}
+        self.geracao_diretorio = 0
+        # Gerações anteriores a esta não podem ser comparadas (os endereços mudaram no compact())
+        self.geracao_base = 0
+        self.trava_geracao = threading.Lock()
+        # Usada apenas onde os.pread/os.pwrite não existem (Windows), para proteger o cursor dos arquivos
+        self.trava_cursor = threading.Lock()
+        # Contadores publicados para os leitores [sequência, época], ou None se desativados; com várias
+        # threads alterando cestos ao mesmo tempo, a sequência fica ímpar até a última terminar
+        self.versao = None
+        self.mapa_versao = None
+        self.alteracoes_ativas = 0
+        self.trava_versao = threading.Lock()
+        if leitores:
+            self._abre_versao()
+        nova = not (os.path.exists(nd) and os.path.getsize(nd) > 0 and os.path.exists(nc) and os.path.getsize(nc) > 0)
+        self.funcao_hash = _funcao_hash_tabela(nd, funcao_hash, nova)
         self.arq_diretorio = open(self.nome_arquivo_diretorio, 'r+b') if os.path.exists(self.nome_arquivo_diretorio) else open(self.nome_arquivo_diretorio, 'w+b')
         self.arq_cestos = open(self.nome_arquivo_cestos, 'r+b') if os.path.exists(self.nome_arquivo_cestos) else open(self.nome_arquivo_cestos, 'w+b')
-        if os.path.getsize(self.nome_arquivo_diretorio) == 0 or os.path.getsize(self.nome_arquivo_cestos) == 0:
-            self.diretorio = self.Diretorio()
-            bd = self.diretorio.to_byte_array()
-            self.arq_diretorio.write(bd)
+        if arquivo_log is not None:
+            self.log = self.LogOperacoes(arquivo_log, intervalo_sync)
+            if nova:
+                # Uma tabela nova é sincronizada com o disco antes da primeira operação registrada, então um
+                # log encontrado ao lado de arquivos vazios ou ausentes é de outra tabela e é descartado
+                self.log.trunca()
+            else:
+                self._reaplica_log()
+        if nova:
+            # Cestos deixados por uma tabela cujo diretório se perdeu não pertencem à nova tabela
+            self.arq_cestos.truncate(0)
+            self.diretorio = self._novo_diretorio()
+            self._salva_diretorio_arquivo()
             c = self.Cesto(self.cls, self.quantidade_dados_por_cesto)
-            bd = c.to_byte_array()
-            self.arq_cestos.seek(0)
-            self.arq_cestos.write(bd)
+            self._grava_arquivo(self.arq_cestos, 0, c.to_byte_array())
+            self.total = 0
+            if self.log is not None:
+                os.fsync(self.arq_cestos.fileno())
+                os.fsync(self.arq_diretorio.fileno())
+            if not diretorio_residente:
+                self._abre_diretorio()
+        else:
+            self._abre_diretorio()
+            # Em uma tabela existente, o total de registros é contado no primeiro uso de len()
+            self.total = None
+        self.bytes_por_elemento = cls().size()
+        self.bytes_por_cesto = self.bytes_por_elemento * n + 3
+        if cls.formato_chave is not None:
+            self.struct_chave = struct.Struct(cls.formato_chave[1])
+            self.deslocamento_chave = cls.formato_chave[0]
+        if mmap_cestos:
+            self.mapa = mmap.mmap(self.arq_cestos.fileno(), 0)
+        self._calcula_livres()
+        if impressoes:
+            self._carrega_impressoes()
+        # Com group commit, sincroniza periodicamente o log mesmo que nenhuma operação nova aconteça
+        self.parar_sync = threading.Event()
+        self.thread_sync = None
+        if self.log is not None and intervalo_sync > 0:
+            self.thread_sync = threading.Thread(target=self._sincroniza_periodicamente, daemon=True,
+                                                name='hash_extensivel_sync')
+            self.thread_sync.start()
+
+    def _sincroniza_periodicamente(self):
+        # Laço da thread de sincronização: a cada intervalo_sync segundos, sincroniza o log e grava nos
+        # arquivos da tabela os grupos confirmados que ainda não foram sincronizados
+        intervalo = self.log.intervalo_sync
+        while not self.parar_sync.wait(intervalo):
+            with self.trava_diretorio.escrita():
+                if self.arq_diretorio.closed:
+                    return
+                if self.log.nao_sincronizados and time.monotonic() - self.log.ultimo_sync >= intervalo:
+                    with self._publica():
+                        self._sincroniza_log()
+
+    def _abre_versao(self):
+        # Mapeia o arquivo de versão (criando-o se necessário); uma sequência ímpar deixada por uma
+        # interrupção é tornada par, pois a abertura da tabela já reaplicou o log, se houver
+        nome = self.nome_arquivo_diretorio + '.versao'
+        with open(nome, 'a+b') as f:
+            if os.path.getsize(nome) < LeitorHashExtensivel.TAMANHO_VERSAO:
+                f.truncate(LeitorHashExtensivel.TAMANHO_VERSAO)
+            self.mapa_versao = mmap.mmap(f.fileno(), LeitorHashExtensivel.TAMANHO_VERSAO)
+        self.versao = memoryview(self.mapa_versao).cast('Q')
+        if self.versao[0] & 1:
+            self.versao[0] += 1
+
+    @contextmanager
+    def _publica(self):
+        # Delimita uma alteração dos arquivos para os leitores: a sequência fica ímpar durante o trecho
+        if self.versao is None:
+            yield
+            return
+        with self.trava_versao:
+            if self.alteracoes_ativas == 0:
+                self.versao[0] += 1
+            self.alteracoes_ativas += 1
+        try:
+            yield
+        finally:
+            with self.trava_versao:
+                self.alteracoes_ativas -= 1
+                if self.alteracoes_ativas == 0:
+                    self.versao[0] += 1
+
+    def _trunca_diretorio(self, tamanho: int):
+        # Ajusta o tamanho do arquivo do diretório; com leitores, o arquivo só cresce
+        if self.versao is not None and tamanho < self._tamanho_arquivo(self.arq_diretorio):
+            return
+        self.arq_diretorio.truncate(tamanho)
+
+    def _carrega_impressoes(self):
+        # Carrega as impressões gravadas no último close(), se o arquivo de cestos não mudou desde então,
+        # ou as refaz percorrendo os cestos. O arquivo é removido em seguida: só um close() completo o
+        # recria, então uma interrupção nunca deixa impressões desatualizadas para a próxima abertura
+        info = os.stat(self.nome_arquivo_cestos)
+        impressoes = None
+        if os.path.exists(self.nome_arquivo_impressoes):
+            with open(self.nome_arquivo_impressoes, 'rb') as f:
+                ba = f.read()
+            os.remove(self.nome_arquivo_impressoes)
+            if len(ba) >= 28 and ba[:4] == b'IMP1' and struct.unpack_from('>qq', ba, 4) == (info.st_size, info.st_mtime_ns):
+                impressoes = {}
+                posicao = 28
+                for _ in range(struct.unpack_from('>q', ba, 20)[0]):
+                    endereco, quantidade = struct.unpack_from('>qh', ba, posicao)
+                    posicao += 10
+                    impressoes[endereco] = array('H', struct.unpack_from(f'>{quantidade}H', ba, posicao))
+                    posicao += 2 * quantidade
+        if impressoes is None:
+            impressoes = {}
+            usados = self._enderecos_usados()
+            codec = self.CodecRegistros.de(self.cls)
+            bpe = self.bytes_por_elemento
+            for endereco, ba in self._percorre_cestos(self._tamanho_arquivo_cestos()):
+                if endereco in usados:
+                    quantidade = struct.unpack_from('>h', ba, 1)[0]
+                    chaves = codec.chaves(ba[3:3 + quantidade * bpe])
+                    if chaves is None:
+                        chaves = [e.hash_code() for e in codec.decodifica(ba, quantidade)]
+                    impressoes[endereco] = self._impressoes_de(chaves)
+        self.impressoes = impressoes
+
+    def _salva_impressoes(self, usados):
+        # Grava as impressões dos cestos usados junto com o tamanho e a data de modificação do arquivo de
+        # cestos já fechado
+        info = os.stat(self.nome_arquivo_cestos)
+        usados = sorted(usados)
+        partes = [b'IMP1', struct.pack('>qqq', info.st_size, info.st_mtime_ns, len(usados))]
+        for endereco in usados:
+            impressoes = self.impressoes.get(endereco, array('H'))
+            partes.append(struct.pack(f'>qh{len(impressoes)}H', endereco, len(impressoes), *impressoes))
+        with open(self.nome_arquivo_impressoes, 'wb') as f:
+            f.write(b''.join(partes))
+
+    @staticmethod
+    def _impressoes_de(chaves):
+        return array('H', map(impressao_chave, chaves))
+
+    def _ausente(self, endereco: int, chave: int) -> bool:
+        # Indica, pelas impressões, que a chave certamente não está no cesto
+        if self.impressoes is None or impressao_chave(chave) in self.impressoes.get(endereco, ()):
+            return False
+        self.contadores['negativos_impressoes'] += 1
+        return True
+
+    def _enderecos_usados(self) -> set:
+        # Endereços dos cestos referenciados pelo diretório, percorrido em faixas
+        usados = set()
+        for _, faixa in self.diretorio.faixas():
+            usados.update(faixa)
+        return usados
+
+    def _calcula_livres(self):
+        # Monta a lista de cestos livres: os endereços do arquivo que o diretório não referencia
+        # (os cestos liberados são gravados vazios, então a varredura sequencial os ignora)
+        # Sem o diretório residente, usa a lista gravada no último close(), se os arquivos não mudaram
+        # desde então, para não percorrer o diretório inteiro na abertura
+        livres = None if self.diretorio_residente else self._carrega_livres()
+        if livres is None:
+            usados = self._enderecos_usados()
+            livres = [e for e in range(0, self._tamanho_arquivo_cestos(), self.bytes_por_cesto) if e not in usados]
+        self.livres = livres
+        heapq.heapify(self.livres)
+
+    def _identificacao_arquivos(self) -> tuple:
+        # Tamanho e data de modificação dos arquivos do diretório e de cestos
+        info_diretorio = os.stat(self.nome_arquivo_diretorio)
+        info_cestos = os.stat(self.nome_arquivo_cestos)
+        return info_diretorio.st_size, info_diretorio.st_mtime_ns, info_cestos.st_size, info_cestos.st_mtime_ns
+
+    def _carrega_livres(self):
+        # Retorna a lista de cestos livres gravada em nd + '.livres', ou None se não houver uma válida
+        # O arquivo é removido em seguida, como o das impressões (ver _carrega_impressoes)
+        nome = self.nome_arquivo_diretorio + '.livres'
+        if not os.path.exists(nome):
+            return None
+        with open(nome, 'rb') as f:
+            ba = f.read()
+        os.remove(nome)
+        if len(ba) < 44 or ba[:4] != b'LIV1' or struct.unpack_from('>qqqq', ba, 4) != self._identificacao_arquivos():
+            return None
+        quantidade = struct.unpack_from('>q', ba, 36)[0]
+        return list(struct.unpack_from(f'>{quantidade}q', ba, 44))
+
+    def _salva_livres(self):
+        # Grava a lista de cestos livres com a identificação dos arquivos da tabela já fechados
+        with open(self.nome_arquivo_diretorio + '.livres', 'wb') as f:
+            f.write(b'LIV1' + struct.pack('>qqqqq', *self._identificacao_arquivos(), len(self.livres)) +
+                    struct.pack(f'>{len(self.livres)}q', *self.livres))
+
+    def _le_arquivo(self, arquivo, posicao: int, tamanho: int) -> bytes:
+        # Lê bytes de uma posição do arquivo sem depender do cursor compartilhado
+        inicio = time.perf_counter() if self.ganchos else 0.0
+        if hasattr(os, 'pread'):
+            ba = os.pread(arquivo.fileno(), tamanho, posicao)
+        else:
+            with self.trava_cursor:
+                arquivo.seek(posicao)
+                ba = arquivo.read(tamanho)
+        self._conta_es('leituras', 'bytes_lidos', len(ba))
+        if self.ganchos:
+            self._notifica('leitura', arquivo=arquivo.name, posicao=posicao, tamanho=len(ba),
+                           duracao=time.perf_counter() - inicio)
+        return ba
+
+    def _grava_arquivo(self, arquivo, posicao: int, ba: bytes):
+        # Grava bytes em uma posição do arquivo sem depender do cursor compartilhado
+        inicio = time.perf_counter() if self.ganchos else 0.0
+        if hasattr(os, 'pwrite'):
+            os.pwrite(arquivo.fileno(), ba, posicao)
+        else:
+            with self.trava_cursor:
+                arquivo.seek(posicao)
+                arquivo.write(ba)
+        self._conta_es('gravacoes', 'bytes_gravados', len(ba))
+        if self.ganchos:
+            self._notifica('gravacao', arquivo=arquivo.name, posicao=posicao, tamanho=len(ba),
+                           duracao=time.perf_counter() - inicio)
+
+    def _conta_es(self, operacoes: str, quantidade_bytes: str, tamanho: int):
+        # Atualiza os contadores de uma leitura ou gravação
+        contadores = self.contadores
+        contadores[operacoes] += 1
+        contadores[quantidade_bytes] += tamanho
+
+    def _notifica(self, evento: str, **dados):
+        # Chama os ganchos registrados com o nome do evento e os seus dados
+        for gancho in self.ganchos:
+            gancho(evento, dados)
+
+    def adiciona_gancho(self, gancho):
+        # Registra gancho(evento, dados), chamado a cada E/S nos arquivos ('leitura', 'gravacao', com o
+        # arquivo, a posição, o tamanho e a duração em segundos) e a cada mudança estrutural ('divisao',
+        # 'duplicacao', 'juncao', 'reducao'). Sem ganchos, os eventos não são montados nem cronometrados
+        self.ganchos = self.ganchos + [gancho]
+
+    def remove_gancho(self, gancho):
+        # Remove um gancho registrado com adiciona_gancho()
+        self.ganchos = [g for g in self.ganchos if g is not gancho]
+
+    def _tamanho_arquivo(self, arquivo) -> int:
+        # Retorna o tamanho atual do arquivo
+        if hasattr(os, 'pwrite'):
+            return os.fstat(arquivo.fileno()).st_size
+        with self.trava_cursor:
+            arquivo.seek(0, 2)
+            return arquivo.tell()
+
+    def _carrega_diretorio(self):
+        # Lê e desserializa o diretório completo a partir do arquivo
+        self.contadores['leituras_diretorio'] += 1
+        bd = self._le_arquivo(self.arq_diretorio, 0, self._tamanho_arquivo(self.arq_diretorio))
+        diretorio = self._novo_diretorio()
+        diretorio.from_byte_array(bd)
+        self.diretorio = diretorio
+
+    def _abre_diretorio(self):
+        # Com o diretório residente, lê o vetor inteiro; sem ele, lê apenas a profundidade global, e as
+        # páginas do vetor são lidas sob demanda
+        if self.diretorio_residente:
+            self._carrega_diretorio()
+            return
+        self.contadores['leituras_diretorio'] += 1
+        self.diretorio = self.DiretorioPaginado(
+            self.funcao_hash, lambda posicao, tamanho: self._le_arquivo(self.arq_diretorio, posicao, tamanho))
+
+    def _novo_diretorio(self):
+        # Cria um diretório vazio; as posições alteradas só são guardadas para o log quando ele existe
+        return self.Diretorio(self.funcao_hash, self.log is not None)
+
+    def _diretorio_atual(self):
+        # Retorna o diretório; sem o diretório residente, relê a profundidade global e descarta as páginas lidas
+        if not self.diretorio_residente:
+            self.contadores['leituras_diretorio'] += 1
+            self.diretorio.recarrega()
+        return self.diretorio
+
+    def _reaplica_log(self):
+        # Reaplica nos arquivos da tabela os grupos completos do log e o esvazia
+        d = None
+        for entradas in self.log.grupos():
+            for tipo, dados in entradas:
+                if tipo == self.LogOperacoes.CESTO:
+                    self._grava_arquivo(self.arq_cestos, dados[0], dados[1])
+                else:
+                    if d is None:
+                        # Um arquivo do diretório vazio equivale ao diretório inicial (profundidade 0)
+                        d = self.Diretorio(self.funcao_hash)
+                        ba = self._le_arquivo(self.arq_diretorio, 0, self._tamanho_arquivo(self.arq_diretorio))
+                        if ba:
+                            d.from_byte_array(ba)
+                    d.aplica(*dados)
+        if d is not None:
+            ba = d.to_byte_array()
+            self._grava_arquivo(self.arq_diretorio, 0, ba)
+            self._trunca_diretorio(len(ba))
+        os.fsync(self.arq_cestos.fileno())
+        os.fsync(self.arq_diretorio.fileno())
+        self.log.trunca()
+
+    def _salva_diretorio(self):
+        # Grava as partes do diretório que mudaram (no modo com log, apenas as registra no log)
+        if self.log is None:
+            self._salva_diretorio_arquivo()
+            return
+        alteracoes = self.diretorio.alteracoes_log()
+        if alteracoes is not None:
+            self.log.registra_diretorio(self.diretorio.profundidade_global, alteracoes)
+
+    def _salva_diretorio_arquivo(self):
+        # Grava no arquivo apenas as partes do diretório que mudaram
+        d = self.diretorio
+        if not d.sujo():
+            return
+        self.contadores['gravacoes_diretorio'] += 1
+        if d.profundidade_gravada < 0:
+            ba = d.to_byte_array()
+            self._grava_arquivo(self.arq_diretorio, 0, ba)
+            self._trunca_diretorio(len(ba))
+            d.limpa()
+            return
+        if d.profundidade_gravada != d.profundidade_global or d.profundidade_minima != d.profundidade_global:
+            # Após duplicações ou reduções, grava a nova profundidade, regrava a parte nova do vetor
+            # e ajusta o tamanho do arquivo
+            self._grava_arquivo(self.arq_diretorio, 0, bytes([d.profundidade_global]))
+            inicio = 2 ** min(d.profundidade_gravada, d.profundidade_minima)
+            for faixa in range(inicio, len(d), d.ENTRADAS_POR_FAIXA):
+                self._grava_arquivo(self.arq_diretorio, 1 + 8 * faixa,
+                                    d.bytes_faixa(faixa, min(faixa + d.ENTRADAS_POR_FAIXA, len(d))))
+            self._trunca_diretorio(1 + 8 * len(d))
+            limite = min(inicio, len(d))
+        else:
+            limite = len(d)
+        # Regrava só as páginas alteradas, juntando as páginas consecutivas em uma única gravação
+        epp = d.ENTRADAS_POR_PAGINA
+        paginas = sorted(p for p in d.paginas_alteradas if p * epp < limite)
+        i = 0
+        while i < len(paginas):
+            j = i
+            while j + 1 < len(paginas) and paginas[j + 1] == paginas[j] + 1:
+                j += 1
+            inicio_faixa = paginas[i] * epp
+            self._grava_arquivo(self.arq_diretorio, 1 + 8 * inicio_faixa,
+                                d.bytes_faixa(inicio_faixa, min((paginas[j] + 1) * epp, limite)))
+            i = j + 1
+        d.limpa()
+
+    def _le_bytes_cestos(self, endereco: int, tamanho: int) -> bytes:
+        # Lê bytes do arquivo de cestos (ou do mapeamento em memória)
+        if endereco in self.pendentes:
+            return self.pendentes[endereco][:tamanho]
+        if self.mapa is not None:
+            return self.mapa[endereco:endereco + tamanho]
+        return self._le_arquivo(self.arq_cestos, endereco, tamanho)
+
+    def _tamanho_arquivo_cestos(self) -> int:
+        # Retorna o tamanho atual do arquivo de cestos
+        if self.mapa is not None:
+            return max(len(self.mapa), self.fim_pendente)
+        return max(self._tamanho_arquivo(self.arq_cestos), self.fim_pendente)
+
+    def _le_cesto(self, endereco: int):
+        # Lê e desserializa o cesto que começa no endereço informado (ou o obtém do cache)
+        if self.cache is not None:
+            c = self.cache.busca(endereco)
+            if c is not None:
+                return c
+        c = self.Cesto(self.cls, self.quantidade_dados_por_cesto)
+        c.from_byte_array(self._le_bytes_cestos(endereco, c.size()))
+        self.contadores['leituras_cestos'] += 1
+        if self.cache is not None:
+            self._grava_despejados(self.cache.insere(endereco, c))
+        return c
+
+    def _marca_cesto(self, endereco: int):
+        # Registra a alteração do cesto na próxima geração
+        with self.trava_geracao:
+            self.geracao += 1
+            self.geracoes_cestos[endereco] = self.geracao
+
+    def _marca_diretorio(self):
+        # Registra uma alteração do diretório na próxima geração
+        with self.trava_geracao:
+            self.geracao += 1
+            self.geracao_diretorio = self.geracao
+
+    def alteracoes_desde(self, geracao: int):
+        # Retorna (geração atual, endereços dos cestos alterados depois da geração informada, se o diretório
+        # mudou depois dela). Os endereços vêm como None quando tudo precisa ser relido (primeira consulta,
+        # geração negativa ou compact() posterior)
+        with self.trava_geracao:
+            if geracao < self.geracao_base or geracao < 0:
+                return self.geracao, None, True
+            alterados = [e for e, g in self.geracoes_cestos.items() if g > geracao]
+            return self.geracao, alterados, self.geracao_diretorio > geracao
+
+    def _escreve_cesto(self, endereco: int, c):
+        # Grava o cesto no endereço informado (no modo write-back, apenas o marca como sujo no cache)
+        self._marca_cesto(endereco)
+        if self.impressoes is not None:
+            self.impressoes[endereco] = self._impressoes_de(c.chaves)
+        if self.cache is not None:
+            self._grava_despejados(self.cache.insere(endereco, c, self.escrita_adiada))
+            if self.escrita_adiada:
+                return
+        self._grava_cesto(endereco, c)
+
+    def _grava_despejados(self, despejados):
+        # Grava no arquivo os cestos sujos despejados do cache
+        for endereco, c in despejados:
+            self._grava_cesto(endereco, c)
+
+    def _grava_cesto(self, endereco: int, c):
+        # Grava o cesto diretamente no arquivo (ou no mapeamento em memória)
+        # No modo com log, registra a imagem do cesto e adia a gravação até a sincronização do log
+        ba = c.to_byte_array()
+        self.contadores['gravacoes_cestos'] += 1
+        if self.log is not None:
+            self.log.registra_cesto(endereco, ba)
+            self.pendentes[endereco] = ba
+            self.fim_pendente = max(self.fim_pendente, endereco + len(ba))
+            return
+        self._grava_bytes_cestos(endereco, ba)
+
+    def _grava_bytes_cestos(self, endereco: int, ba: bytes):
+        # Grava bytes no arquivo de cestos (ou no mapeamento em memória)
+        if self.mapa is not None:
+            self.mapa[endereco:endereco + len(ba)] = ba
+            return
+        self._grava_arquivo(self.arq_cestos, endereco, ba)
+
+    def _acrescenta_cesto(self, c) -> int:
+        # Grava o cesto no fim do arquivo e retorna o seu endereço
+        endereco = self._tamanho_arquivo_cestos()
+        self._marca_cesto(endereco)
+        if self.impressoes is not None:
+            self.impressoes[endereco] = self._impressoes_de(c.chaves)
+        if self.mapa is not None:
+            self.mapa.resize(endereco + c.size())
+        # O cesto novo vai sempre para o arquivo, para que o tamanho do arquivo reflita os endereços usados
+        self._grava_cesto(endereco, c)
+        if self.cache is not None:
+            self._grava_despejados(self.cache.insere(endereco, c))
+        return endereco
+
+    def _busca_mapa(self, endereco: int, chave: int) -> int:
+        # Busca binária da chave diretamente nos bytes mapeados do cesto
+        # Retorna a posição do registro no cesto, ou -1 se a chave não estiver presente
+        self.contadores['buscas_diretas'] += 1
+        quantidade = struct.unpack_from('>h', self.mapa, endereco + 1)[0]
+        base = endereco + 3 + self.deslocamento_chave
+        unpack_from = self.struct_chave.unpack_from
+        bpe = self.bytes_por_elemento
+        inicio, fim = 0, quantidade
+        while inicio < fim:
+            meio = (inicio + fim) // 2
+            atual = unpack_from(self.mapa, base + meio * bpe)[0]
+            if atual < chave:
+                inicio = meio + 1
+            elif atual > chave:
+                fim = meio
+            else:
+                return meio
+        return -1
+
+    def _acesso_direto(self) -> bool:
+        # Indica se as buscas podem ser feitas diretamente nos bytes mapeados
+        # (com o cache ativo, os cestos em memória é que são a versão mais recente)
+        return (self.mapa is not None and self.cls.formato_chave is not None and self.cache is None
+                and self.log is None)
+
+    def estatisticas_cache(self):
+        # Retorna os contadores de acertos, faltas e despejos do cache de cestos (ou None sem cache)
+        if self.cache is None:
+            return None
+        return self.cache.estatisticas()
+
+    def stats(self, zera: bool = False) -> dict:
+        # Retorna uma cópia dos contadores de E/S e de mudanças estruturais desde a abertura da tabela
+        # (ou desde a última chamada com zera=True), com o tamanho do diretório e os dados do cache
+        # Os contadores não são travados: com várias threads, os valores são aproximados
+        resultado = dict(self.contadores)
+        if zera:
+            self.contadores = dict.fromkeys(self.CONTADORES, 0)
+        resultado['profundidade_global'] = self.diretorio.profundidade_global
+        resultado['entradas_diretorio'] = len(self.diretorio)
+        resultado['cestos_livres'] = len(self.livres)
+        resultado['cache'] = self.estatisticas_cache()
+        return resultado
+
+    def estrutura(self) -> dict:
+        # Resume a estrutura da tabela lendo apenas os cabeçalhos dos cestos, sem desserializar registros:
+        # fator de carga, histograma das profundidades locais, quantidade de cestos vazios e cheios e,
+        # em 'cestos', o endereço, a profundidade local e a quantidade de registros de cada cesto
+        with self.trava_diretorio.escrita():
+            self._prepara_varredura()
+            d = self._diretorio_atual()
+            cabecalhos = self._cabecalhos(self._enderecos_usados())
+            resumo = resume_cestos(cabecalhos, self.quantidade_dados_por_cesto)
+            self.total = resumo['registros']
+            resumo.update(profundidade_global=d.profundidade_global, entradas_diretorio=len(d),
+                          cestos_livres=len(self.livres),
+                          cestos=[{'endereco': e, 'profundidade_local': pl, 'quantidade': q}
+                                  for e, (pl, q) in cabecalhos.items()])
+            return resumo
+
+    def cabecalhos_cestos(self, enderecos=None) -> dict:
+        # Retorna {endereço: (profundidade local, quantidade)} dos cestos informados, ou de todos os cestos
+        # do diretório, lendo apenas os 3 bytes de cabeçalho de cada um
+        with self.trava_diretorio.escrita():
+            self._prepara_varredura()
+            if enderecos is None:
+                self._diretorio_atual()
+                enderecos = self._enderecos_usados()
+            return self._cabecalhos(enderecos)
+
+    def _cabecalhos(self, enderecos) -> dict:
+        unpack = self.CodecRegistros.CABECALHO.unpack
+        return {e: unpack(self._le_bytes_cestos(e, 3)) for e in sorted(enderecos)}
+
+    def registros_cesto(self, endereco: int) -> list:
+        # Retorna os registros do cesto do endereço informado
+        with self.trava_diretorio.leitura():
+            with self._trava_cesto(endereco):
+                c = self._le_cesto(endereco)
+                return c.elementos[:c.quantidade]
+
+    def _descarrega_cache(self):
+        # Grava no arquivo os cestos alterados que estão apenas no cache
+        if self.cache is not None:
+            self._grava_despejados(self.cache.retira_sujas())
+
+    def _trava_cesto(self, endereco: int):
+        # Retorna a trava que protege o cesto do endereço informado
+        if self.cache is not None:
+            return self.trava_cache
+        return self.travas_cestos[(endereco // self.bytes_por_cesto) % len(self.travas_cestos)]
+
+    def _endereco_cesto(self, chave: int) -> int:
+        # Retorna o endereço do cesto onde a chave deve estar
+        self._diretorio_atual()
+        return self.diretorio.endereco(self.diretorio.hash(chave))
+
+    def _localiza_cesto(self, chave: int) -> int:
+        # Como _endereco_cesto, para operações que não alteram o diretório: sem o diretório residente, lê
+        # do arquivo apenas a profundidade global e a posição da chave, em vez do diretório inteiro
+        if self.diretorio_residente:
+            return self.diretorio.endereco(self.diretorio.hash(chave))
+        self.contadores['leituras_diretorio'] += 1
+        pg = self._le_arquivo(self.arq_diretorio, 0, 1)[0]
+        p = self.funcao_hash(chave) & ((1 << pg) - 1)
+        return struct.unpack('>q', self._le_arquivo(self.arq_diretorio, 1 + 8 * p, 8))[0]
+
+    def _confirma_log(self):
+        # Encerra o grupo de entradas da operação atual no log e sincroniza se for a hora
+        if self.log.confirma():
+            self._sincroniza_log()
+
+    def _sincroniza_log(self):
+        # Sincroniza o log com o disco e só então grava nos arquivos da tabela o que ele cobre
+        self.log.confirma()
+        for funcao in self.antes_sincronizar_log:
+            funcao()
+        self.log.sincroniza()
+        for endereco in sorted(self.pendentes):
+            self._grava_bytes_cestos(endereco, self.pendentes[endereco])
+        self.pendentes = {}
+        self.fim_pendente = 0
+        self._salva_diretorio_arquivo()
+
+    def _flush(self):
+        # Grava as alterações pendentes (deve ser chamado com o diretório travado para escrita)
+        self._descarrega_cache()
+        self._salva_diretorio()
+        if self.log is not None:
+            self._sincroniza_log()
+        self.arq_diretorio.flush()
+        if self.mapa is not None:
+            self.mapa.flush()
+        self.arq_cestos.flush()
+
+    def flush(self):
+        # Grava as alterações pendentes e descarrega os buffers dos arquivos
+        with self.trava_diretorio.escrita(), self._publica():
+            self._flush()
+
+    def _checkpoint(self):
+        # Grava tudo nos arquivos da tabela, sincroniza-os com o disco e esvazia o log
+        self._flush()
+        os.fsync(self.arq_cestos.fileno())
+        os.fsync(self.arq_diretorio.fileno())
+        self.log.trunca()
+
+    def checkpoint(self):
+        # Torna os arquivos da tabela completos e duráveis e esvazia o log de operações
+        if self.log is None:
+            return
+        with self.trava_diretorio.escrita(), self._publica():
+            self._checkpoint()
+
+    def close(self):
+        # Grava as alterações pendentes e fecha os arquivos (com log, faz antes um checkpoint)
+        # A thread de sincronização é encerrada antes, fora da trava que ela também usa
+        if self.thread_sync is not None:
+            self.parar_sync.set()
+            self.thread_sync.join()
+            self.thread_sync = None
+        with self.trava_diretorio.escrita():
+            if self.arq_diretorio.closed:
+                return
+            with self._publica():
+                if self.log is not None:
+                    self._checkpoint()
+                    self.log.close()
+                else:
+                    self._flush()
+            if self.versao is not None:
+                self.versao.release()
+                self.mapa_versao.close()
+                self.versao = None
+            if self.mapa is not None:
+                self.mapa.close()
+                self.mapa = None
+            usados = self._enderecos_usados() if self.impressoes is not None else None
+            self.arq_diretorio.close()
+            self.arq_cestos.close()
+            if self.impressoes is not None:
+                self._salva_impressoes(usados)
+            if not self.diretorio_residente:
+                self._salva_livres()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def create(self, elem: T) -> bool:
         # Insere um novo registro na tabela
-        self.arq_diretorio.seek(0)
-        bd = self.arq_diretorio.read()
-        self.diretorio = self.Diretorio()
-        self.diretorio.from_byte_array(bd)
-        i = self.diretorio.hash(elem.hash_code())
-        endereco_cesto = self.diretorio.endereco(i)
-        c = self.Cesto(self.cls, self.quantidade_dados_por_cesto)
-        self.arq_cestos.seek(endereco_cesto)
-        ba = self.arq_cestos.read(c.size())
-        c.from_byte_array(ba)
+        if self.log is None:
+            with self.trava_diretorio.leitura():
+                endereco_cesto = self._localiza_cesto(elem.hash_code())
+                with self._trava_cesto(endereco_cesto), self._publica():
+                    if self._insere(endereco_cesto, elem, False):
+                        return True
+        # O cesto está cheio: a divisão altera o diretório e exige acesso exclusivo
+        return self._altera_exclusivo(elem.hash_code(), self._insere, elem, True)
+
+    def _altera(self, chave: int, operacao, *args):
+        # Executa uma operação que altera o cesto da chave, com as travas adequadas
+        if self.log is not None:
+            return self._altera_exclusivo(chave, operacao, *args)
+        with self.trava_diretorio.leitura():
+            endereco_cesto = self._localiza_cesto(chave)
+            with self._trava_cesto(endereco_cesto), self._publica():
+                return operacao(endereco_cesto, *args)
+
+    def _altera_exclusivo(self, chave: int, operacao, *args):
+        # Executa uma operação com o diretório travado para escrita, registrando-a no log se houver
+        with self.trava_diretorio.escrita(), self._publica():
+            try:
+                return operacao(self._endereco_cesto(chave), *args)
+            finally:
+                if self.log is not None:
+                    self._confirma_log()
+
+    def _insere(self, endereco_cesto: int, elem: T, divide: bool) -> bool:
+        # Insere o registro no cesto do endereço informado
+        # Se o cesto estiver cheio e a divisão não for permitida, retorna False sem alterar nada
+        c = self._le_cesto(endereco_cesto)
         if c.read(elem.hash_code()) is not None:
             raise Exception("Elemento já existe")
         if not c.full():
             c.create(elem)
-            self.arq_cestos.seek(endereco_cesto)
-            self.arq_cestos.write(c.to_byte_array())
+            self._escreve_cesto(endereco_cesto, c)
+            self._conta(1)
             return True
-        pl = c.profundidade_local
-        if pl >= self.diretorio.profundidade_global:
-            self.diretorio.duplica()
-        pg = self.diretorio.profundidade_global
-        c1 = self.Cesto(self.cls, self.quantidade_dados_por_cesto, pl + 1)
-        self.arq_cestos.seek(endereco_cesto)
-        self.arq_cestos.write(c1.to_byte_array())
-        c2 = self.Cesto(self.cls, self.quantidade_dados_por_cesto, pl + 1)
-        self.arq_cestos.seek(0, 2)
-        novo_endereco = self.arq_cestos.tell()
-        self.arq_cestos.write(c2.to_byte_array())
-        inicio = self.diretorio.hash2(elem.hash_code(), c.profundidade_local)
-        deslocamento = 2 ** pl
-        maximo = 2 ** pg
-        troca = False
-        for j in range(inicio, maximo, deslocamento):
-            if troca:
-                self.diretorio.atualiza_endereco(j, novo_endereco)
-            troca = not troca
-        bd = self.diretorio.to_byte_array()
-        self.arq_diretorio.seek(0)
-        self.arq_diretorio.write(bd)
-        for j in range(c.quantidade):
-            self.create(c.elementos[j])
-        self.create(elem)
+        if not divide:
+            return False
+        # Cesto cheio: divide em memória, sem recursão, e grava o diretório uma única vez
+        self._distribui(endereco_cesto, c.profundidade_local, c.elementos[:c.quantidade] + [elem])
+        self._salva_diretorio()
+        self._conta(1)
         return True
 
+    def create_many(self, elementos, tamanho_lote: int = 100000) -> int:
+        # Insere vários registros de uma vez (carga em lote)
+        # Os registros são consumidos em lotes de tamanho_lote, o que permite receber um gerador
+        # maior que a memória. Em cada lote, os registros são agrupados por cesto, cada cesto
+        # é lido uma vez, dividido em memória se necessário e gravado uma única vez
+        # Retorna a quantidade de registros inseridos
+        total = 0
+        lote = []
+        for elem in elementos:
+            lote.append(elem)
+            if len(lote) >= tamanho_lote:
+                total += self._insere_lote_exclusivo(lote)
+                lote = []
+        if lote:
+            total += self._insere_lote_exclusivo(lote)
+        return total
+
+    def _insere_lote_exclusivo(self, lote) -> int:
+        # Insere um lote com o diretório travado para escrita (cada lote é um grupo no log)
+        with self.trava_diretorio.escrita(), self._publica():
+            try:
+                return self._insere_lote(lote)
+            finally:
+                if self.log is not None:
+                    self._confirma_log()
+
+    bulk_load = create_many
+
+    def _insere_lote(self, lote) -> int:
+        # Insere um lote de registros, gravando cada cesto e o diretório uma única vez
+        # Se alguma chave já existir, nenhum registro do lote é gravado
+        self._diretorio_atual()
+        grupos = {}
+        for elem in lote:
+            endereco = self.diretorio.endereco(self.diretorio.hash(elem.hash_code()))
+            grupos.setdefault(endereco, []).append(elem)
+        cestos = []
+        for endereco, novos in grupos.items():
+            c = self._le_cesto(endereco)
+            elementos = c.elementos[:c.quantidade]
+            chaves = set(c.chaves)
+            for elem in novos:
+                if elem.hash_code() in chaves:
+                    raise Exception("Elemento já existe")
+                chaves.add(elem.hash_code())
+                elementos.append(elem)
+            cestos.append((endereco, c.profundidade_local, elementos))
+        for endereco, pl, elementos in cestos:
+            self._distribui(endereco, pl, elementos)
+        self._salva_diretorio()
+        self._conta(len(lote))
+        return len(lote)
+
+    def _distribui(self, endereco: int, pl: int, elementos):
+        # Grava os elementos no cesto do endereço informado, dividindo-o em memória
+        # (sem recursão) até que todas as partes caibam em um cesto
+        n = self.quantidade_dados_por_cesto
+        # Endereços dos novos cestos vêm da lista de livres ou são reservados em sequência no fim do arquivo
+        fim = self._tamanho_arquivo_cestos()
+        proximo = fim
+        novos_cestos = []
+        pl_inicial = pl
+        dividiu = False
+        pendentes = [(endereco, pl, elementos)]
+        while pendentes:
+            endereco, pl, elementos = pendentes.pop()
+            if len(elementos) <= n:
+                c = self.Cesto(self.cls, n, pl)
+                c.define_elementos(elementos)
+                if endereco >= fim:
+                    novos_cestos.append((endereco, c))
+                else:
+                    self._escreve_cesto(endereco, c)
+                continue
+            if pl >= 127:
+                raise Exception("Profundidade local máxima de 127 bits")
+            if pl >= self.diretorio.profundidade_global:
+                self.diretorio.duplica()
+                self.contadores['duplicacoes'] += 1
+                if self.ganchos:
+                    self._notifica('duplicacao', profundidade_global=self.diretorio.profundidade_global)
+            if self.livres:
+                novo_endereco = heapq.heappop(self.livres)
+            else:
+                novo_endereco = proximo
+                proximo += self.bytes_por_cesto
+            # As entradas do cesto são inicio, inicio + 2^pl, ...; as alternadas passam para o novo cesto
+            inicio = self.diretorio.hash2(elementos[0].hash_code(), pl)
+            self.diretorio.atualiza_faixa(inicio + 2 ** pl, 2 ** (pl + 1), novo_endereco)
+            # O próximo bit da chave decide em qual das metades o elemento fica
+            antigos, movidos = [], []
+            for elem in elementos:
+                if self.diretorio.hash2(elem.hash_code(), pl + 1) == inicio:
+                    antigos.append(elem)
+                else:
+                    movidos.append(elem)
+            pendentes.append((endereco, pl + 1, antigos))
+            pendentes.append((novo_endereco, pl + 1, movidos))
+            dividiu = True
+            # Quantos níveis de divisão uma única inserção (ou lote) precisou, antes feitos por recursão
+            contadores = self.contadores
+            contadores['divisoes'] += 1
+            contadores['profundidade_divisao_maxima'] = max(contadores['profundidade_divisao_maxima'], pl + 1 - pl_inicial)
+            if self.ganchos:
+                self._notifica('divisao', endereco=endereco, novo_endereco=novo_endereco, profundidade_local=pl + 1)
+        if dividiu:
+            self._marca_diretorio()
+        # Acrescenta os novos cestos na ordem em que os endereços foram reservados
+        for endereco, c in sorted(novos_cestos, key=lambda x: x[0]):
+            if self._acrescenta_cesto(c) != endereco:
+                raise Exception("Endereço de cesto inconsistente")
+
     def read(self, chave: int):
         # Lê um registro pela chave
-        self.arq_diretorio.seek(0)
-        bd = self.arq_diretorio.read()
-        self.diretorio = self.Diretorio()
-        self.diretorio.from_byte_array(bd)
-        i = self.diretorio.hash(chave)
-        endereco_cesto = self.diretorio.endereco(i)
-        c = self.Cesto(self.cls, self.quantidade_dados_por_cesto)
-        self.arq_cestos.seek(endereco_cesto)
-        ba = self.arq_cestos.read(c.size())
-        c.from_byte_array(ba)
+        with self.trava_diretorio.leitura():
+            endereco_cesto = self._localiza_cesto(chave)
+            with self._trava_cesto(endereco_cesto):
+                return self._read(endereco_cesto, chave)
+
+    def _read(self, endereco_cesto: int, chave: int):
+        # Lê um registro no cesto do endereço informado
+        if self._ausente(endereco_cesto, chave):
+            return None
+        elem = self._le_registro(endereco_cesto, chave)
+        if elem is None and self.impressoes is not None:
+            self.contadores['falsos_positivos_impressoes'] += 1
+        return elem
+
+    def _le_registro(self, endereco_cesto: int, chave: int):
+        if self._acesso_direto():
+            # Constrói apenas o registro encontrado, a partir dos bytes mapeados
+            p = self._busca_mapa(endereco_cesto, chave)
+            if p < 0:
+                return None
+            inicio = endereco_cesto + 3 + p * self.bytes_por_elemento
+            elem = self.cls()
+            elem.from_byte_array(self.mapa[inicio:inicio + self.bytes_por_elemento])
+            return elem
+        c = self._le_cesto(endereco_cesto)
         return c.read(chave)
 
+    def _agrupa_por_cesto(self, chaves) -> dict:
+        # Resolve as chaves no diretório de uma só vez e retorna {endereço do cesto: [índices das chaves]}
+        d = self._diretorio_atual()
+        grupos = {}
+        for i, chave in enumerate(chaves):
+            grupos.setdefault(d.endereco(d.hash(chave)), []).append(i)
+        return grupos
+
+    def read_many(self, chaves) -> list:
+        # Lê várias chaves resolvendo-as no diretório uma única vez e visitando os cestos em ordem
+        # crescente de endereço, cada um lido uma única vez; retorna os registros (ou None) na ordem das chaves
+        chaves = list(chaves)
+        resultados = [None] * len(chaves)
+        with self.trava_diretorio.leitura():
+            grupos = self._agrupa_por_cesto(chaves)
+            for endereco in sorted(grupos):
+                indices = [i for i in grupos[endereco] if not self._ausente(endereco, chaves[i])]
+                if not indices:
+                    continue
+                with self._trava_cesto(endereco):
+                    if self._acesso_direto():
+                        for i in indices:
+                            resultados[i] = self._read(endereco, chaves[i])
+                    else:
+                        c = self._le_cesto(endereco)
+                        for i in indices:
+                            resultados[i] = c.read(chaves[i])
+        return resultados
+
+    def _altera_agrupado(self, chaves, altera_cesto) -> list:
+        # Chama altera_cesto(endereço, índices, resultados) para cada cesto das chaves, em ordem crescente
+        # de endereço e com as travas adequadas; no modo com log, todas as alterações formam um único grupo
+        resultados = [False] * len(chaves)
+        if self.log is not None:
+            with self.trava_diretorio.escrita(), self._publica():
+                try:
+                    for endereco, indices in self._grupos_presentes(chaves):
+                        altera_cesto(endereco, indices, resultados)
+                finally:
+                    self._confirma_log()
+            return resultados
+        with self.trava_diretorio.leitura():
+            for endereco, indices in self._grupos_presentes(chaves):
+                with self._trava_cesto(endereco), self._publica():
+                    altera_cesto(endereco, indices, resultados)
+        return resultados
+
+    def _grupos_presentes(self, chaves):
+        # Pares (endereço, índices) em ordem de endereço, sem as chaves que as impressões descartam
+        for endereco, indices in sorted(self._agrupa_por_cesto(chaves).items()):
+            indices = [i for i in indices if not self._ausente(endereco, chaves[i])]
+            if indices:
+                yield endereco, indices
+
+    def update_many(self, elementos) -> list:
+        # Atualiza vários registros lendo e gravando cada cesto uma única vez
+        # Retorna, na ordem dos registros, se cada um foi encontrado
+        elementos = list(elementos)
+
+        def atualiza_cesto(endereco, indices, resultados):
+            if self._acesso_direto():
+                for i in indices:
+                    resultados[i] = self._update(endereco, elementos[i])
+                return
+            c = self._le_cesto(endereco)
+            for i in indices:
+                resultados[i] = c.update(elementos[i])
+            if any(resultados[i] for i in indices):
+                self._escreve_cesto(endereco, c)
+
+        return self._altera_agrupado([e.hash_code() for e in elementos], atualiza_cesto)
+
+    def delete_many(self, chaves) -> list:
+        # Remove várias chaves lendo e gravando cada cesto uma única vez; as junções de cestos são
+        # feitas no fim, em uma única seção exclusiva. Retorna, na ordem das chaves, se cada uma foi removida
+        chaves = list(chaves)
+        representantes = []
+
+        def remove_cesto(endereco, indices, resultados):
+            if self._acesso_direto():
+                for i in indices:
+                    resultados[i] = self._delete(endereco, chaves[i])
+            else:
+                c = self._le_cesto(endereco)
+                for i in indices:
+                    resultados[i] = c.delete(chaves[i])
+                removidas = sum(1 for i in indices if resultados[i])
+                if removidas:
+                    self._escreve_cesto(endereco, c)
+                    self._conta(-removidas)
+            if any(resultados[i] for i in indices) and self._pode_juntar(endereco, chaves[indices[0]]):
+                representantes.append(chaves[indices[0]])
+
+        resultados = self._altera_agrupado(chaves, remove_cesto)
+        if self.junta_cestos and representantes:
+            with self.trava_diretorio.escrita(), self._publica():
+                try:
+                    for chave in representantes:
+                        self._junta(self._endereco_cesto(chave), chave)
+                finally:
+                    if self.log is not None:
+                        self._confirma_log()
+        return resultados
+
     def update(self, elem: T) -> bool:
         # Atualiza um registro existente
-        self.arq_diretorio.seek(0)
-        bd = self.arq_diretorio.read()
-        self.diretorio = self.Diretorio()
-        self.diretorio.from_byte_array(bd)
-        i = self.diretorio.hash(elem.hash_code())
-        endereco_cesto = self.diretorio.endereco(i)
-        c = self.Cesto(self.cls, self.quantidade_dados_por_cesto)
-        self.arq_cestos.seek(endereco_cesto)
-        ba = self.arq_cestos.read(c.size())
-        c.from_byte_array(ba)
+        return self._altera(elem.hash_code(), self._update, elem)
+
+    def _update(self, endereco_cesto: int, elem: T) -> bool:
+        # Atualiza um registro no cesto do endereço informado
+        if self._ausente(endereco_cesto, elem.hash_code()):
+            return False
+        if self._acesso_direto():
+            # Sobrescreve apenas os bytes do registro encontrado
+            p = self._busca_mapa(endereco_cesto, elem.hash_code())
+            if p < 0:
+                return False
+            inicio = endereco_cesto + 3 + p * self.bytes_por_elemento
+            self.mapa[inicio:inicio + self.bytes_por_elemento] = elem.to_byte_array()
+            self._marca_cesto(endereco_cesto)
+            return True
+        c = self._le_cesto(endereco_cesto)
         if not c.update(elem):
             return False
-        self.arq_cestos.seek(endereco_cesto)
-        self.arq_cestos.write(c.to_byte_array())
+        self._escreve_cesto(endereco_cesto, c)
         return True
 
     def delete(self, chave: int) -> bool:
         # Remove um registro pela chave
-        self.arq_diretorio.seek(0)
-        bd = self.arq_diretorio.read()
-        self.diretorio = self.Diretorio()
-        self.diretorio.from_byte_array(bd)
-        i = self.diretorio.hash(chave)
-        endereco_cesto = self.diretorio.endereco(i)
-        c = self.Cesto(self.cls, self.quantidade_dados_por_cesto)
-        self.arq_cestos.seek(endereco_cesto)
-        ba = self.arq_cestos.read(c.size())
-        c.from_byte_array(ba)
+        resultado = self._altera(chave, self._delete_verifica_juncao, chave)
+        if resultado is None:
+            return False
+        if resultado:
+            # A junção altera o diretório e exige acesso exclusivo, que só é pedido se ela for possível
+            self._altera_exclusivo(chave, self._junta, chave)
+        return True
+
+    def _delete_verifica_juncao(self, endereco_cesto: int, chave: int):
+        # Remove o registro e, ainda com a trava do cesto, indica se o cesto pode ser juntado ao irmão
+        # Retorna None se a chave não existe
+        if not self._delete(endereco_cesto, chave):
+            return None
+        return self.junta_cestos and self._pode_juntar(endereco_cesto, chave)
+
+    def _cabecalho_cesto(self, endereco: int):
+        # Retorna (profundidade local, quantidade) do cesto, pelo cache ou lendo só os 3 bytes de cabeçalho
+        if self.cache is not None:
+            c = self.cache.paginas.get(endereco)
+            if c is not None:
+                return c.profundidade_local, c.quantidade
+        return struct.unpack('>Bh', self._le_bytes_cestos(endereco, 3))
+
+    def _endereco_posicao(self, p: int) -> int:
+        # Endereço da posição p do diretório; sem o diretório residente, lê apenas essa posição
+        if self.diretorio_residente:
+            return self.diretorio.endereco(p)
+        return struct.unpack('>q', self._le_arquivo(self.arq_diretorio, 1 + 8 * p, 8))[0]
+
+    def _pode_juntar(self, endereco_cesto: int, chave: int) -> bool:
+        # Indica, pelos cabeçalhos, se o cesto e o seu irmão cabem em um único cesto
+        # A verificação é repetida por _junta() com o diretório travado para escrita
+        pl, quantidade = self._cabecalho_cesto(endereco_cesto)
+        if pl == 0:
+            return False
+        endereco_irmao = self._endereco_posicao(self.diretorio.hash2(chave, pl) ^ (1 << (pl - 1)))
+        if endereco_irmao == endereco_cesto:
+            return False
+        pl_irmao, quantidade_irmao = self._cabecalho_cesto(endereco_irmao)
+        return pl_irmao == pl and quantidade + quantidade_irmao <= self.quantidade_dados_por_cesto
+
+    def _junta(self, endereco_cesto: int, chave: int):
+        # Junta o cesto da chave com o seu irmão enquanto os dois couberem em um único cesto,
+        # liberando um deles, e reduz o diretório à metade quando possível
+        n = self.quantidade_dados_por_cesto
+        juntou = False
+        while True:
+            c = self._le_cesto(endereco_cesto)
+            pl = c.profundidade_local
+            if pl == 0:
+                break
+            # O irmão difere apenas no bit mais alto da profundidade local
+            endereco_irmao = self.diretorio.endereco(self.diretorio.hash2(chave, pl) ^ (1 << (pl - 1)))
+            if endereco_irmao == endereco_cesto:
+                break
+            irmao = self._le_cesto(endereco_irmao)
+            if irmao.profundidade_local != pl or c.quantidade + irmao.quantidade > n:
+                break
+            mantido, liberado = min(endereco_cesto, endereco_irmao), max(endereco_cesto, endereco_irmao)
+            junto = self.Cesto(self.cls, n, pl - 1)
+            junto.define_elementos(c.elementos[:c.quantidade] + irmao.elementos[:irmao.quantidade])
+            self.diretorio.atualiza_faixa(self.diretorio.hash2(chave, pl - 1), 2 ** (pl - 1), mantido)
+            self._escreve_cesto(mantido, junto)
+            self._escreve_cesto(liberado, self.Cesto(self.cls, n))
+            heapq.heappush(self.livres, liberado)
+            endereco_cesto = mantido
+            juntou = True
+            self.contadores['juncoes'] += 1
+            if self.ganchos:
+                self._notifica('juncao', endereco=mantido, liberado=liberado, profundidade_local=pl - 1)
+        if juntou:
+            self._reduz_diretorio()
+            self._salva_diretorio()
+            self._marca_diretorio()
+
+    def _reduz_diretorio(self):
+        # Reduz o diretório à metade enquanto nenhum cesto usar a profundidade global inteira
+        while self.diretorio.reduz():
+            self.contadores['reducoes'] += 1
+            if self.ganchos:
+                self._notifica('reducao', profundidade_global=self.diretorio.profundidade_global)
+
+    def compact(self):
+        # Regrava os arquivos de cestos e do diretório sem cestos livres, na ordem dos endereços
+        # Os arquivos são montados em arquivos temporários e só então substituem os originais
+        # Os leitores continuam com os arquivos antigos mapeados até perceberem a nova época
+        with self.trava_diretorio.escrita(), self._publica():
+            if self.log is not None:
+                self._checkpoint()
+            else:
+                self._flush()
+            self._reduz_diretorio()
+            d = self.diretorio
+            bpc = self.bytes_por_cesto
+            vivos = sorted(self._enderecos_usados())
+            novos = {e: i * bpc for i, e in enumerate(vivos)}
+            temporario_cestos = self.nome_arquivo_cestos + '.tmp'
+            with open(temporario_cestos, 'wb') as f:
+                for e in vivos:
+                    f.write(self._le_bytes_cestos(e, bpc))
+                f.flush()
+                os.fsync(f.fileno())
+            if self.impressoes is not None:
+                self.impressoes = {novos[e]: self.impressoes.get(e, array('H')) for e in vivos}
+            # O diretório é regravado faixa a faixa (sem o diretório residente, as faixas vêm do arquivo antigo)
+            temporario_diretorio = self.nome_arquivo_diretorio + '.tmp'
+            with open(temporario_diretorio, 'wb') as f:
+                f.write(bytes([d.profundidade_global]))
+                for _, faixa in d.faixas():
+                    faixa = array('q', map(novos.__getitem__, faixa))
+                    if sys.byteorder == 'little':
+                        faixa.byteswap()
+                    f.write(faixa.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            if self.diretorio_residente:
+                d.enderecos = array('q', map(novos.__getitem__, d.enderecos))
+            mapeado = self.mapa is not None
+            if mapeado:
+                self.mapa.close()
+                self.mapa = None
+            self.arq_cestos.close()
+            self.arq_diretorio.close()
+            os.replace(temporario_cestos, self.nome_arquivo_cestos)
+            os.replace(temporario_diretorio, self.nome_arquivo_diretorio)
+            self.arq_cestos = open(self.nome_arquivo_cestos, 'r+b')
+            self.arq_diretorio = open(self.nome_arquivo_diretorio, 'r+b')
+            if mapeado:
+                self.mapa = mmap.mmap(self.arq_cestos.fileno(), 0)
+            d.limpa()
+            d.limpa_log()
+            if self.cache is not None:
+                self.cache.esvazia()
+            self.livres = []
+            if self.versao is not None:
+                self.versao[1] += 1
+            with self.trava_geracao:
+                self.geracao += 1
+                self.geracoes_cestos = {}
+                self.geracao_diretorio = self.geracao_base = self.geracao
+
+    def _delete(self, endereco_cesto: int, chave: int) -> bool:
+        # Remove um registro do cesto do endereço informado
+        if self._ausente(endereco_cesto, chave):
+            return False
+        if self._acesso_direto():
+            # Desloca os registros seguintes uma posição para trás, direto no mapeamento
+            p = self._busca_mapa(endereco_cesto, chave)
+            if p < 0:
+                return False
+            bpe = self.bytes_por_elemento
+            quantidade = struct.unpack_from('>h', self.mapa, endereco_cesto + 1)[0]
+            destino = endereco_cesto + 3 + p * bpe
+            self.mapa.move(destino, destino + bpe, (quantidade - p - 1) * bpe)
+            ultimo = endereco_cesto + 3 + (quantidade - 1) * bpe
+            self.mapa[ultimo:ultimo + bpe] = bytes(bpe)
+            struct.pack_into('>h', self.mapa, endereco_cesto + 1, quantidade - 1)
+            self._marca_cesto(endereco_cesto)
+            if self.impressoes is not None:
+                self.impressoes[endereco_cesto].remove(impressao_chave(chave))
+            self._conta(-1)
+            return True
+        c = self._le_cesto(endereco_cesto)
         if not c.delete(chave):
             return False
-        self.arq_cestos.seek(endereco_cesto)
-        self.arq_cestos.write(c.to_byte_array())
+        self._escreve_cesto(endereco_cesto, c)
+        self._conta(-1)
         return True
 
+    def _conta(self, delta: int):
+        # Atualiza o total de registros, se ele já tiver sido contado
+        with self.trava_total:
+            if self.total is not None:
+                self.total += delta
+
+    def __len__(self):
+        # Retorna o total de registros, contando pelos cabeçalhos dos cestos apenas na primeira vez
+        if self.total is None:
+            with self.trava_diretorio.escrita():
+                if self.total is None:
+                    tamanho = self._prepara_varredura()
+                    self.total = sum(struct.unpack_from('>h', ba, 1)[0] for _, ba in self._percorre_cestos(tamanho))
+        return self.total
+
+    def _prepara_varredura(self) -> int:
+        # Grava os cestos pendentes do cache e do log e retorna o tamanho do arquivo de cestos a percorrer
+        with self._publica():
+            self._descarrega_cache()
+            if self.log is not None:
+                self._sincroniza_log()
+        return self._tamanho_arquivo_cestos()
+
+    def _percorre_cestos(self, tamanho: int = None, tamanho_bloco: int = 1 << 20):
+        # Percorre o arquivo de cestos sequencialmente, lendo vários cestos por vez
+        # Gera pares (endereço, bytes do cesto)
+        if tamanho is None:
+            with self.trava_diretorio.escrita():
+                tamanho = self._prepara_varredura()
+        bpc = self.bytes_por_cesto
+        por_bloco = max(1, tamanho_bloco // bpc) * bpc
+        endereco = 0
+        while endereco < tamanho:
+            bloco = memoryview(self._le_bytes_cestos(endereco, min(por_bloco, tamanho - endereco)))
+            for inicio in range(0, len(bloco), bpc):
+                yield endereco + inicio, bloco[inicio:inicio + bpc]
+            endereco += len(bloco)
+
+    def scan(self, chave_min: int = None, chave_max: int = None, tamanho_bloco: int = 1 << 20):
+        # Gera cada registro da tabela exatamente uma vez, na ordem do arquivo de cestos
+        # Com chave_min e/ou chave_max, gera apenas as chaves no intervalo fechado [chave_min, chave_max]
+        # Os espaços vazios dos cestos são ignorados e, se o registro declarar formato_chave,
+        # apenas os registros dentro do intervalo são desserializados
+        # A tabela não deve ser alterada enquanto o gerador estiver em uso
+        bpe = self.bytes_por_elemento
+        filtra = chave_min is not None or chave_max is not None
+        direto = filtra and self.cls.formato_chave is not None
+        codec = self.CodecRegistros.de(self.cls)
+        for _, ba in self._percorre_cestos(tamanho_bloco=tamanho_bloco):
+            quantidade = struct.unpack_from('>h', ba, 1)[0]
+            if not filtra:
+                yield from codec.decodifica(ba, quantidade)
+                continue
+            for inicio in range(3, 3 + quantidade * bpe, bpe):
+                if direto:
+                    chave = self.struct_chave.unpack_from(ba, inicio + self.deslocamento_chave)[0]
+                    if (chave_min is not None and chave < chave_min) or (chave_max is not None and chave > chave_max):
+                        continue
+                elem = self.cls()
+                elem.from_byte_array(bytes(ba[inicio:inicio + bpe]))
+                if filtra and not direto:
+                    chave = elem.hash_code()
+                    if (chave_min is not None and chave < chave_min) or (chave_max is not None and chave > chave_max):
+                        continue
+                yield elem
+
+    def items(self, chave_min: int = None, chave_max: int = None):
+        # Gera pares (chave, registro) de todos os registros, ou dos que estão no intervalo de chaves
+        for elem in self.scan(chave_min, chave_max):
+            yield elem.hash_code(), elem
+
+    def keys(self, chave_min: int = None, chave_max: int = None):
+        # Gera as chaves de todos os registros, ou das que estão no intervalo
+        # Se o registro declarar formato_chave, as chaves são lidas sem desserializar os registros
+        if self.cls.formato_chave is None:
+            for elem in self.scan(chave_min, chave_max):
+                yield elem.hash_code()
+            return
+        bpe = self.bytes_por_elemento
+        codec = self.CodecRegistros.de(self.cls)
+        for _, ba in self._percorre_cestos():
+            quantidade = struct.unpack_from('>h', ba, 1)[0]
+            for chave in codec.chaves(ba[3:3 + quantidade * bpe]):
+                if (chave_min is None or chave >= chave_min) and (chave_max is None or chave <= chave_max):
+                    yield chave
+
     def print(self):
         # Imprime o estado atual do diretório e dos cestos
-        self.arq_diretorio.seek(0)
-        bd = self.arq_diretorio.read()
-        self.diretorio = self.Diretorio()
-        self.diretorio.from_byte_array(bd)
+        with self.trava_diretorio.escrita():
+            self._print()
+
+    def _print(self):
+        # Imprime o diretório e os cestos (deve ser chamado com o diretório travado para escrita)
+        self._diretorio_atual()
         print("\nDIRETÓRIO ------------------")
         print(self.diretorio)
         print("\nCESTOS ---------------------")
-        self.arq_cestos.seek(0)
-        while self.arq_cestos.tell() < os.path.getsize(self.nome_arquivo_cestos):
-            print(f"Endereço: {self.arq_cestos.tell()}")
-            c = self.Cesto(self.cls, self.quantidade_dados_por_cesto)
-            ba = self.arq_cestos.read(c.size())
-            c.from_byte_array(ba)
-            print(c)
\ No newline at end of file
+        endereco = 0
+        tamanho = self._tamanho_arquivo_cestos()
+        while endereco < tamanho:
+            print(f"Endereço: {endereco}")
+            c = self._le_cesto(endereco)
+            print(c)
+            endereco += c.size()
+
+# Resume cabeçalhos {endereço: (profundidade local, quantidade)} de cestos com capacidade n
+def resume_cestos(cabecalhos: dict, n: int) -> dict:
+    histograma = {}
+    registros = vazios = cheios = 0
+    for pl, quantidade in cabecalhos.values():
+        histograma[pl] = histograma.get(pl, 0) + 1
+        registros += quantidade
+        vazios += quantidade == 0
+        cheios += quantidade == n
+    return {
+        'capacidade_cesto': n,
+        'registros': registros,
+        'fator_carga': registros / (len(cabecalhos) * n) if cabecalhos else 0.0,
+        'histograma_profundidades': dict(sorted(histograma.items())),
+        'cestos_vazios': vazios,
+        'cestos_cheios': cheios,
+    }
+
+# Visão incremental da estrutura de uma HashExtensivel, para visualizadores como o app.py
+# Guarda os cabeçalhos de todos os cestos e os registros dos cestos já exibidos; atualiza() consulta
+# o contador de gerações da tabela e relê apenas os cestos alterados desde a atualização anterior
+# As entradas do diretório que apontam para o mesmo cesto têm os mesmos bits finais (a profundidade
+# local do cesto), então são agrupadas em uma linha por cesto em vez de listadas uma a uma
+class VisaoEstrutura:
+    def __init__(self, tabela: HashExtensivel):
+        self.tabela = tabela
+        self.geracao = -1
+        self.cabecalhos = {}
+        self.registros = {}
+        self.profundidade_global = 0
+        self.entradas_diretorio = 0
+        # Endereços dos cestos em ordem e a primeira entrada do diretório de cada um
+        self.enderecos = []
+        self.primeira_entrada = {}
+        # Quantidade de cestos relidos na última atualização
+        self.relidos = 0
+
+    def atualiza(self) -> int:
+        # Relê o diretório (se mudou) e os cabeçalhos dos cestos alterados; retorna quantos cestos relidos
+        geracao, alterados, diretorio_mudou = self.tabela.alteracoes_desde(self.geracao)
+        if diretorio_mudou:
+            with self.tabela.trava_diretorio.leitura():
+                d = self.tabela._diretorio_atual()
+                self.profundidade_global = d.profundidade_global
+                self.entradas_diretorio = len(d)
+                primeira = {}
+                for inicio, faixa in d.faixas():
+                    for p, e in enumerate(faixa, inicio):
+                        if e not in primeira:
+                            primeira[e] = p
+            self.primeira_entrada = primeira
+            self.enderecos = sorted(primeira)
+        if alterados is None:
+            self.cabecalhos = self.tabela.cabecalhos_cestos(self.enderecos)
+            self.registros = {}
+            self.relidos = len(self.cabecalhos)
+        else:
+            alterados = [e for e in alterados if e in self.primeira_entrada]
+            self.cabecalhos.update(self.tabela.cabecalhos_cestos(alterados) if alterados else {})
+            for e in alterados:
+                self.registros.pop(e, None)
+            self.relidos = len(alterados)
+        if diretorio_mudou:
+            # Cestos que surgiram depois da consulta das gerações também precisam do cabeçalho
+            faltando = [e for e in self.enderecos if e not in self.cabecalhos]
+            if faltando:
+                self.cabecalhos.update(self.tabela.cabecalhos_cestos(faltando))
+            self.cabecalhos = {e: self.cabecalhos[e] for e in self.enderecos}
+            # Cestos liberados por junções deixam o diretório: seus registros guardados são descartados
+            self.registros = {e: r for e, r in self.registros.items() if e in self.primeira_entrada}
+        self.geracao = geracao
+        return self.relidos
+
+    def resumo(self) -> dict:
+        # Fator de carga, histograma das profundidades locais e cestos vazios e cheios
+        resumo = resume_cestos(self.cabecalhos, self.tabela.quantidade_dados_por_cesto)
+        resumo.update(profundidade_global=self.profundidade_global, entradas_diretorio=self.entradas_diretorio,
+                      cestos=len(self.cabecalhos))
+        return resumo
+
+    def _entradas_no_intervalo(self, endereco: int, entrada_min: int, entrada_max: int):
+        # Retorna (primeira entrada, quantidade de entradas) do cesto no intervalo fechado de entradas
+        passo = 2 ** self.cabecalhos[endereco][0]
+        sufixo = self.primeira_entrada[endereco] % passo
+        primeira = entrada_min + (sufixo - entrada_min) % passo
+        if primeira > entrada_max:
+            return primeira, 0
+        return primeira, (entrada_max - primeira) // passo + 1
+
+    def diretorio_agrupado(self, entrada_min: int = 0, entrada_max: int = None) -> list:
+        # Uma linha por cesto referenciado no intervalo de entradas do diretório: os bits finais comuns às
+        # suas entradas, a primeira delas no intervalo, quantas são e o endereço do cesto
+        if entrada_max is None:
+            entrada_max = self.entradas_diretorio - 1
+        linhas = []
+        for e in self.enderecos:
+            primeira, quantidade = self._entradas_no_intervalo(e, entrada_min, entrada_max)
+            if quantidade:
+                pl = self.cabecalhos[e][0]
+                linhas.append({'bits_finais': format(primeira % 2 ** pl, f'0{pl}b') if pl else '*',
+                               'primeira_entrada': primeira, 'entradas': quantidade, 'endereco': e})
+        linhas.sort(key=lambda l: l['primeira_entrada'])
+        return linhas
+
+    def pagina(self, numero: int, por_pagina: int, entrada_min: int = 0, entrada_max: int = None):
+        # Retorna (cestos da página, total de cestos) dos cestos referenciados pelo intervalo de entradas,
+        # em ordem de endereço; cada cesto vem com o endereço, a profundidade local e a quantidade
+        if entrada_min > 0 or (entrada_max is not None and entrada_max < self.entradas_diretorio - 1):
+            fim = self.entradas_diretorio - 1 if entrada_max is None else entrada_max
+            enderecos = [e for e in self.enderecos if self._entradas_no_intervalo(e, entrada_min, fim)[1]]
+        else:
+            enderecos = self.enderecos
+        inicio = numero * por_pagina
+        cestos = [{'endereco': e, 'profundidade_local': self.cabecalhos[e][0], 'quantidade': self.cabecalhos[e][1]}
+                  for e in enderecos[inicio:inicio + por_pagina]]
+        return cestos, len(enderecos)
+
+    def registros_cesto(self, endereco: int) -> list:
+        # Registros do cesto, lidos da tabela só se ainda não estiverem guardados ou se o cesto mudou
+        if endereco not in self.registros:
+            self.registros[endereco] = self.tabela.registros_cesto(endereco)
+        return self.registros[endereco]
+
+# Interface asyncio para uma HashExtensivel
+# As operações de disco rodam em um executor próprio com poucas threads, sem bloquear o laço de eventos.
+# As leituras feitas na mesma volta do laço (e as que chegam enquanto um lote está em andamento) são
+# juntadas em um lote, resolvido com os cestos agrupados por endereço: várias chaves do mesmo cesto
+# custam uma única leitura do cesto. Gravações e remoções são enviadas ao executor uma a uma
+class AsyncHashExtensivel(Generic[T]):
+    def __init__(self, tabela: HashExtensivel, max_threads: int = 2, tamanho_lote: int = 1024):
+        self.tabela = tabela
+        self.max_threads = max_threads
+        self.tamanho_lote = tamanho_lote
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='hash_extensivel')
+        # Leituras esperando o próximo lote: pares (chave, futuro)
+        self.pendentes = []
+        self.lotes_em_andamento = 0
+        self.agendado = False
+        # Futuros das leituras ainda sem resultado (na fila ou em um lote em andamento), esperados por close()
+        self.leituras_abertas = set()
+        # Quantidade de lotes de leitura executados e de chaves lidas neles
+        self.lotes = 0
+        self.chaves_lidas = 0
+
+    async def get(self, chave: int):
+        # Lê um registro pela chave (ou None), juntando a leitura às demais do mesmo lote
+        return await self._enfileira(chave)
+
+    async def get_many(self, chaves) -> list:
+        # Lê várias chaves e retorna os registros (ou None) na ordem informada
+        return list(await asyncio.gather(*[self._enfileira(chave) for chave in chaves]))
+
+    async def put(self, elem: T) -> bool:
+        # Insere o registro ou, se a chave já existir, atualiza-o
+        return await self._executa(self._put, elem)
+
+    async def delete(self, chave: int) -> bool:
+        # Remove um registro pela chave
+        return await self._executa(self.tabela.delete, chave)
+
+    async def flush(self):
+        # Grava as alterações pendentes da tabela
+        await self._executa(self.tabela.flush)
+
+    async def close(self):
+        # Espera as leituras pendentes, fecha a tabela e encerra o executor
+        while self.leituras_abertas:
+            await asyncio.gather(*self.leituras_abertas, return_exceptions=True)
+        await self._executa(self.tabela.close)
+        self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _put(self, elem: T) -> bool:
+        # Atualiza o registro ou o insere (executado no executor)
+        if self.tabela.update(elem):
+            return True
+        try:
+            return self.tabela.create(elem)
+        except Exception as e:
+            # Só uma chave inserida por outra thread entre as duas operações leva de volta ao update; qualquer
+            # outro erro, ou um update que ainda não encontre a chave, é relançado
+            if str(e) != "Elemento já existe" or not self.tabela.update(elem):
+                raise
+            return True
+
+    async def _executa(self, funcao, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, funcao, *args)
+
+    def _enfileira(self, chave: int):
+        # Acrescenta a chave ao próximo lote e agenda o envio do lote, se ainda não estiver agendado
+        loop = asyncio.get_running_loop()
+        futuro = loop.create_future()
+        self.leituras_abertas.add(futuro)
+        futuro.add_done_callback(self.leituras_abertas.discard)
+        self.pendentes.append((chave, futuro))
+        if not self.agendado and self.lotes_em_andamento < self.max_threads:
+            self.agendado = True
+            loop.call_soon(self._despacha)
+        return futuro
+
+    def _despacha(self):
+        # Envia ao executor um lote com as leituras pendentes
+        self.agendado = False
+        if not self.pendentes or self.lotes_em_andamento >= self.max_threads:
+            return
+        lote, self.pendentes = self.pendentes[:self.tamanho_lote], self.pendentes[self.tamanho_lote:]
+        self.lotes_em_andamento += 1
+        self.lotes += 1
+        self.chaves_lidas += len(lote)
+        loop = asyncio.get_running_loop()
+        tarefa = loop.run_in_executor(self.executor, self.tabela.read_many, [chave for chave, _ in lote])
+        tarefa.add_done_callback(lambda t: self._conclui(lote, t))
+        if self.pendentes:
+            self.agendado = True
+            loop.call_soon(self._despacha)
+
+    def _conclui(self, lote, tarefa):
+        # Entrega os resultados de um lote e envia o próximo, se houver leituras esperando
+        self.lotes_em_andamento -= 1
+        erro = None if tarefa.cancelled() else tarefa.exception()
+        for i, (_, futuro) in enumerate(lote):
+            if futuro.done():
+                continue
+            if tarefa.cancelled():
+                futuro.cancel()
+            elif erro is not None:
+                futuro.set_exception(erro)
+            else:
+                futuro.set_result(tarefa.result()[i])
+        if self.pendentes and not self.agendado:
+            self.agendado = True
+            asyncio.get_running_loop().call_soon(self._despacha)
+
+# Leitor somente leitura de uma HashExtensivel aberta com leitores=True, para uso em outros processos
+# Os arquivos do diretório e dos cestos são mapeados em memória só para leitura (as páginas são
+# compartilhadas com o processo que grava e com os demais leitores) e cada busca é feita diretamente nos
+# bytes mapeados. O arquivo nd + '.versao' funciona como um seqlock: a busca só é aceita se a sequência
+# era par no início e não mudou no fim; caso contrário, é repetida. Assim um leitor nunca vê uma divisão,
+# junção ou duplicação pela metade. Quando a época muda (compact()), os arquivos são reabertos
+class LeitorHashExtensivel(Generic[T]):
+    # Tamanho do arquivo de versão: sequência e época, inteiros de 64 bits na ordem nativa da máquina
+    TAMANHO_VERSAO = 16
+
+    def __init__(self, cls: Type[T], n: int, nd: str, nc: str, funcao_hash=None):
+        self.cls = cls
+        self.quantidade_dados_por_cesto = n
+        self.nome_arquivo_diretorio = nd
+        self.nome_arquivo_cestos = nc
+        self.funcao_hash = _funcao_hash_tabela(nd, funcao_hash, False, somente_leitura=True)
+        self.bytes_por_elemento = cls().size()
+        self.bytes_por_cesto = self.bytes_por_elemento * n + 3
+        if cls.formato_chave is not None:
+            self.struct_chave = struct.Struct(cls.formato_chave[1])
+            self.deslocamento_chave = cls.formato_chave[0]
+        # Buscas repetidas por coincidirem com uma alteração
+        self.repeticoes = 0
+        with open(nd + '.versao', 'rb') as f:
+            self.mapa_versao = mmap.mmap(f.fileno(), self.TAMANHO_VERSAO, access=mmap.ACCESS_READ)
+        self.versao = memoryview(self.mapa_versao).cast('Q')
+        self.mapa_diretorio = None
+        self.mapa_cestos = None
+        self._abre()
+
+    def _abre(self):
+        # Mapeia os arquivos atuais do diretório e dos cestos
+        self._fecha_mapas()
+        self.epoca = self.versao[1]
+        with open(self.nome_arquivo_diretorio, 'rb') as f:
+            self.mapa_diretorio = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.nome_arquivo_cestos, 'rb') as f:
+            self.mapa_cestos = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _fecha_mapas(self):
+        for mapa in (self.mapa_diretorio, self.mapa_cestos):
+            if mapa is not None:
+                mapa.close()
+
+    def _remapeia(self, mapa, nome: str, tamanho: int):
+        # Mapeia de novo um arquivo que cresceu além do trecho mapeado
+        if tamanho <= len(mapa):
+            return mapa
+        with open(nome, 'rb') as f:
+            novo = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if tamanho > len(novo):
+            novo.close()
+            raise Exception("Posição além do fim do arquivo")
+        mapa.close()
+        return novo
+
+    def _consistente(self, funcao, *args):
+        # Executa funcao até que nenhuma alteração tenha ocorrido durante a execução (seqlock)
+        versao = self.versao
+        while True:
+            sequencia = versao[0]
+            if sequencia & 1:
+                # Uma alteração está em andamento
+                time.sleep(0)
+                continue
+            if versao[1] != self.epoca:
+                self._abre()
+                continue
+            try:
+                resultado = funcao(*args)
+            except Exception:
+                # Bytes lidos durante uma alteração podem ser inválidos; só é um erro real se nada mudou
+                if versao[0] == sequencia:
+                    raise
+                self.repeticoes += 1
+                continue
+            if versao[0] == sequencia:
+                return resultado
+            self.repeticoes += 1
+
+    def _busca(self, chave: int):
+        # Busca a chave nos bytes mapeados: posição no diretório, endereço do cesto e busca binária
+        mapa = self.mapa_diretorio
+        p = self.funcao_hash(chave) & ((1 << mapa[0]) - 1)
+        if 9 + 8 * p > len(mapa):
+            mapa = self.mapa_diretorio = self._remapeia(mapa, self.nome_arquivo_diretorio, 9 + 8 * p)
+        endereco = struct.unpack_from('>q', mapa, 1 + 8 * p)[0]
+        bpe = self.bytes_por_elemento
+        if endereco + self.bytes_por_cesto > len(self.mapa_cestos):
+            self.mapa_cestos = self._remapeia(self.mapa_cestos, self.nome_arquivo_cestos,
+                                              endereco + self.bytes_por_cesto)
+        cestos = self.mapa_cestos
+        if self.cls.formato_chave is None:
+            c = HashExtensivel.Cesto(self.cls, self.quantidade_dados_por_cesto)
+            c.from_byte_array(cestos[endereco:endereco + self.bytes_por_cesto])
+            return c.read(chave)
+        quantidade = struct.unpack_from('>h', cestos, endereco + 1)[0]
+        if not 0 <= quantidade <= self.quantidade_dados_por_cesto:
+            raise Exception("Cesto inválido")
+        base = endereco + 3 + self.deslocamento_chave
+        unpack_from = self.struct_chave.unpack_from
+        inicio, fim = 0, quantidade
+        while inicio < fim:
+            meio = (inicio + fim) // 2
+            atual = unpack_from(cestos, base + meio * bpe)[0]
+            if atual < chave:
+                inicio = meio + 1
+            elif atual > chave:
+                fim = meio
+            else:
+                posicao = endereco + 3 + meio * bpe
+                elem = self.cls()
+                elem.from_byte_array(cestos[posicao:posicao + bpe])
+                return elem
+        return None
+
+    def read(self, chave: int):
+        # Lê um registro pela chave
+        return self._consistente(self._busca, chave)
+
+    def read_many(self, chaves, tamanho_lote: int = 256) -> list:
+        # Lê várias chaves; cada grupo de tamanho_lote chaves é validado por uma única leitura da sequência
+        chaves = list(chaves)
+        resultados = []
+        for i in range(0, len(chaves), tamanho_lote):
+            resultados += self._consistente(lambda lote: [self._busca(c) for c in lote], chaves[i:i + tamanho_lote])
+        return resultados
+
+    def close(self):
+        # Desfaz os mapeamentos
+        if self.versao is None:
+            return
+        self._fecha_mapas()
+        self.mapa_diretorio = self.mapa_cestos = None
+        self.versao.release()
+        self.mapa_versao.close()
+        self.versao = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Laço de um processo trabalhador de HashExtensivelParticionada: abre as partições que lhe cabem e
+# executa as listas de chamadas recebidas pela conexão, respondendo com a lista de resultados
+def _trabalhador_particoes(conexao, cls, n, arquivos, opcoes):
+    tabelas = {p: HashExtensivel(cls, n, nd, nc, **opcoes) for p, (nd, nc) in arquivos.items()}
+    while True:
+        chamadas = conexao.recv()
+        if chamadas is None:
+            for tabela in tabelas.values():
+                tabela.close()
+            conexao.send(None)
+            return
+        resultados = []
+        for particao, metodo, args in chamadas:
+            try:
+                resultado = getattr(tabelas[particao], metodo)(*args)
+                if metodo in ('scan', 'items', 'keys'):
+                    resultado = list(resultado)
+                resultados.append((True, resultado))
+            except Exception as e:
+                resultados.append((False, e))
+        conexao.send(resultados)
+
+# Tabela particionada: as chaves são distribuídas pelos bits mais altos do hash entre várias
+# HashExtensivel independentes, cada uma com os seus arquivos (o diretório de cada partição usa os bits
+# mais baixos). Com processos > 0, as partições são abertas em processos trabalhadores (cada partição
+# pertence a um único processo) e as operações em lote são executadas em paralelo nas partições
+# A função de hash precisa espalhar as chaves pelos 64 bits (como hash_splitmix64); com hash_modulo,
+# chaves pequenas iriam todas para a primeira partição
+class HashExtensivelParticionada(Generic[T]):
+    def __init__(self, cls: Type[T], n: int, nome: str, particoes: int, processos: int = 0,
+                 funcao_hash=hash_splitmix64, **opcoes):
+        # Os arquivos da partição i são f'{nome}.{i}.dir.bin' e f'{nome}.{i}.cestos.bin'; as demais opções
+        # são repassadas para cada HashExtensivel. A quantidade de partições não pode mudar depois: ela é
+        # gravada em nome + '.particoes', e reabrir a tabela com outra quantidade gera um erro
+        _confere_particoes(nome, particoes)
+        self.cls = cls
+        self.particoes = particoes
+        self.funcao_hash = funcao_hash
+        self.arquivos = [(f'{nome}.{i}.dir.bin', f'{nome}.{i}.cestos.bin') for i in range(particoes)]
+        self.tabelas = None
+        self.conexoes = []
+        self.processos = []
+        if processos <= 0:
+            self.tabelas = [HashExtensivel(cls, n, nd, nc, funcao_hash=funcao_hash, **opcoes) for nd, nc in self.arquivos]
+            return
+        self.dono = [p % processos for p in range(particoes)]
+        for t in range(min(processos, particoes)):
+            arquivos = {p: self.arquivos[p] for p in range(particoes) if self.dono[p] == t}
+            local, remota = multiprocessing.Pipe()
+            processo = multiprocessing.Process(target=_trabalhador_particoes, daemon=True,
+                                               args=(remota, cls, n, arquivos, dict(opcoes, funcao_hash=funcao_hash)))
+            processo.start()
+            self.conexoes.append(local)
+            self.processos.append(processo)
+
+    def particao(self, chave: int) -> int:
+        # Partição da chave, dada pelos bits mais altos do hash de 64 bits
+        return ((self.funcao_hash(chave) & MASCARA_64) * self.particoes) >> 64
+
+    def _executa_varias(self, chamadas) -> list:
+        # Executa chamadas (partição, método, argumentos) e retorna os resultados na mesma ordem
+        # Com processos, cada trabalhador recebe de uma vez as chamadas das suas partições e todos
+        # trabalham em paralelo; a primeira exceção encontrada é relançada
+        if self.tabelas is not None:
+            return [getattr(self.tabelas[p], metodo)(*args) for p, metodo, args in chamadas]
+        por_trabalhador = {}
+        for i, (p, metodo, args) in enumerate(chamadas):
+            por_trabalhador.setdefault(self.dono[p], []).append(i)
+        for t, indices in por_trabalhador.items():
+            self.conexoes[t].send([chamadas[i] for i in indices])
+        resultados = [None] * len(chamadas)
+        erro = None
+        for t, indices in por_trabalhador.items():
+            for i, (sucesso, resultado) in zip(indices, self.conexoes[t].recv()):
+                resultados[i] = resultado
+                if not sucesso and erro is None:
+                    erro = resultado
+        if erro is not None:
+            raise erro
+        return resultados
+
+    def _executa(self, particao: int, metodo: str, *args):
+        return self._executa_varias([(particao, metodo, args)])[0]
+
+    def _agrupa_por_particao(self, chaves) -> dict:
+        # Retorna {partição: [índices das chaves]}
+        grupos = {}
+        for i, chave in enumerate(chaves):
+            grupos.setdefault(self.particao(chave), []).append(i)
+        return grupos
+
+    def _em_lote(self, metodo: str, itens, chaves) -> list:
+        # Divide os itens por partição, executa o método em lote em cada uma e junta os resultados na
+        # ordem dos itens
+        grupos = self._agrupa_por_particao(chaves)
+        chamadas = [(p, metodo, ([itens[i] for i in indices],)) for p, indices in grupos.items()]
+        resultados = [None] * len(itens)
+        for indices, parcial in zip(grupos.values(), self._executa_varias(chamadas)):
+            for i, resultado in zip(indices, parcial):
+                resultados[i] = resultado
+        return resultados
+
+    def create(self, elem: T) -> bool:
+        # Insere um novo registro na partição da chave
+        return self._executa(self.particao(elem.hash_code()), 'create', elem)
+
+    def create_many(self, elementos, tamanho_lote: int = 100000) -> int:
+        # Insere vários registros, carregando as partições em paralelo no modo com processos
+        elementos = list(elementos)
+        grupos = self._agrupa_por_particao([e.hash_code() for e in elementos])
+        chamadas = [(p, 'create_many', ([elementos[i] for i in indices], tamanho_lote)) for p, indices in grupos.items()]
+        return sum(self._executa_varias(chamadas))
+
+    def read(self, chave: int):
+        # Lê um registro pela chave
+        return self._executa(self.particao(chave), 'read', chave)
+
+    def read_many(self, chaves) -> list:
+        # Lê várias chaves; retorna os registros (ou None) na ordem das chaves
+        chaves = list(chaves)
+        return self._em_lote('read_many', chaves, chaves)
+
+    def update(self, elem: T) -> bool:
+        # Atualiza um registro existente
+        return self._executa(self.particao(elem.hash_code()), 'update', elem)
+
+    def update_many(self, elementos) -> list:
+        # Atualiza vários registros; retorna, na ordem dos registros, se cada um foi encontrado
+        elementos = list(elementos)
+        return self._em_lote('update_many', elementos, [e.hash_code() for e in elementos])
+
+    def delete(self, chave: int) -> bool:
+        # Remove um registro pela chave
+        return self._executa(self.particao(chave), 'delete', chave)
+
+    def delete_many(self, chaves) -> list:
+        # Remove várias chaves; retorna, na ordem das chaves, se cada uma foi removida
+        chaves = list(chaves)
+        return self._em_lote('delete_many', chaves, chaves)
+
+    def __len__(self):
+        return sum(self._executa_varias([(p, '__len__', ()) for p in range(self.particoes)]))
+
+    def scan(self, chave_min: int = None, chave_max: int = None):
+        # Gera os registros de todas as partições, uma partição por vez
+        # No modo com processos, os registros de cada partição são transferidos de uma só vez
+        for p in range(self.particoes):
+            yield from self._executa(p, 'scan', chave_min, chave_max)
+
+    def items(self, chave_min: int = None, chave_max: int = None):
+        # Gera pares (chave, registro) de todas as partições
+        for p in range(self.particoes):
+            yield from self._executa(p, 'items', chave_min, chave_max)
+
+    def keys(self, chave_min: int = None, chave_max: int = None):
+        # Gera as chaves de todas as partições
+        for p in range(self.particoes):
+            yield from self._executa(p, 'keys', chave_min, chave_max)
+
+    def flush(self):
+        # Grava as alterações pendentes de todas as partições
+        self._executa_varias([(p, 'flush', ()) for p in range(self.particoes)])
+
+    def close(self):
+        # Fecha todas as partições e encerra os processos trabalhadores
+        if self.tabelas is not None:
+            for tabela in self.tabelas:
+                tabela.close()
+            return
+        for conexao in self.conexoes:
+            if not conexao.closed:
+                conexao.send(None)
+        for conexao, processo in zip(self.conexoes, self.processos):
+            if not conexao.closed:
+                conexao.recv()
+                conexao.close()
+            processo.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Entradas de tamanho fixo guardadas nos cestos de uma HashExtensivelVariavel: a chave, a posição e o
+# tamanho do registro no arquivo heap (posição -1 indica que os bytes estão guardados na própria entrada)
+_classes_entrada = {}
+
+def classe_entrada_heap(tamanho_inline: int):
+    # Retorna a classe de entrada com espaço para tamanho_inline bytes guardados na própria entrada
+    if tamanho_inline in _classes_entrada:
+        return _classes_entrada[tamanho_inline]
+
+    class EntradaHeap(RegistroHashExtensivel):
+        formato_chave = (0, '>q')
+        formato_registro = f'>qqI{tamanho_inline}s'
+
+        def __init__(self, chave: int = 0, posicao: int = -1, dados: bytes = b'', tamanho: int = 0):
+            self.chave = chave
+            self.posicao = posicao
+            self.dados = dados
+            self.tamanho = len(dados) if posicao < 0 else tamanho
+
+        def hash_code(self) -> int:
+            return self.chave
+
+        def size(self) -> int:
+            return 20 + tamanho_inline
+
+        def to_byte_array(self) -> bytes:
+            return struct.pack('>qqI', self.chave, self.posicao, self.tamanho) + self.dados.ljust(tamanho_inline, b'\0')
+
+        def from_byte_array(self, ba: bytes):
+            self.chave, self.posicao, self.tamanho = struct.unpack_from('>qqI', ba)
+            self.dados = bytes(ba[20:20 + self.tamanho]) if self.posicao < 0 else b''
+
+        def campos(self) -> tuple:
+            return self.chave, self.posicao, self.tamanho, self.dados
+
+        @classmethod
+        def de_campos(cls, campos: tuple):
+            chave, posicao, tamanho, dados = campos
+            return cls(chave, posicao, dados[:tamanho] if posicao < 0 else b'', tamanho)
+
+        def __str__(self):
+            if self.posicao < 0:
+                return f"({self.chave}, {self.tamanho} bytes na entrada)"
+            return f"({self.chave}, {self.tamanho} bytes em {self.posicao})"
+
+    _classes_entrada[tamanho_inline] = EntradaHeap
+    return EntradaHeap
+
+# Tabela hash extensível para registros de tamanho variável
+# Os cestos guardam apenas entradas pequenas de tamanho fixo (chave, posição, tamanho) e os bytes dos
+# registros ficam em um arquivo heap, onde são sempre acrescentados no fim. Registros com até
+# tamanho_inline bytes ficam na própria entrada, sem acesso ao heap
+# Os registros implementam RegistroHashExtensivel, mas size() não é usado
+class HashExtensivelVariavel(Generic[T]):
+    def __init__(self, cls: Type[T], n: int, nd: str, nc: str, nh: str, tamanho_inline: int = 0, **opcoes):
+        # nh é o arquivo heap; as demais opções são repassadas para a HashExtensivel das entradas
+        self.cls = cls
+        self.tamanho_inline = tamanho_inline
+        self.nome_arquivo_heap = nh
+        self.entrada = classe_entrada_heap(tamanho_inline)
+        self.tabela = HashExtensivel(self.entrada, n, nd, nc, **opcoes)
+        self.arq_heap = open(nh, 'r+b') if os.path.exists(nh) else open(nh, 'w+b')
+        self.fim_heap = self.tabela._tamanho_arquivo(self.arq_heap)
+        self.trava_heap = threading.Lock()
+        # No modo com log, os bytes do heap precisam estar no disco antes das entradas que apontam para eles
+        self.tabela.antes_sincronizar_log.append(self._sincroniza_heap)
+        # Um compact() interrompido é concluído (ver _conclui_compactacao); sem o marcador, o heap
+        # temporário é de uma compactação que não chegou a alterar as entradas e é descartado
+        if os.path.exists(nh + '.compactando'):
+            with open(nh + '.compactando', 'rb') as f:
+                marcador = f.read()
+            tamanho = self.entrada().size()
+            novas = []
+            for inicio in range(0, len(marcador), tamanho):
+                entrada = self.entrada()
+                entrada.from_byte_array(marcador[inicio:inicio + tamanho])
+                novas.append(entrada)
+            self._conclui_compactacao(novas)
+        elif os.path.exists(nh + '.tmp'):
+            os.remove(nh + '.tmp')
+
+    def _entrada(self, elem: T):
+        # Monta a entrada do registro, acrescentando os bytes no fim do heap se não couberem na entrada
+        # Os bytes vão para o heap antes de a entrada ser gravada, então uma entrada nunca aponta para
+        # um trecho ainda não escrito
+        dados = elem.to_byte_array()
+        if len(dados) <= self.tamanho_inline:
+            return self.entrada(elem.hash_code(), -1, dados)
+        with self.trava_heap:
+            posicao = self.fim_heap
+            self.fim_heap += len(dados)
+        self.tabela._grava_arquivo(self.arq_heap, posicao, dados)
+        return self.entrada(elem.hash_code(), posicao, tamanho=len(dados))
+
+    def _libera(self, entrada):
+        # Devolve o trecho de uma entrada que não foi gravada, se ele ainda for o último do heap
+        if entrada.posicao < 0:
+            return
+        with self.trava_heap:
+            if self.fim_heap == entrada.posicao + entrada.tamanho:
+                self.fim_heap = entrada.posicao
+
+    def _sincroniza_heap(self):
+        # Sincroniza o heap com o disco (chamada pela tabela antes de sincronizar o log)
+        os.fsync(self.arq_heap.fileno())
+
+    def _registro(self, entrada):
+        # Constrói o registro a partir da entrada, lendo o heap se necessário
+        if entrada.posicao < 0:
+            dados = entrada.dados
+        else:
+            dados = self.tabela._le_arquivo(self.arq_heap, entrada.posicao, entrada.tamanho)
+        elem = self.cls()
+        elem.from_byte_array(dados)
+        return elem
+
+    def create(self, elem: T) -> bool:
+        # Insere um novo registro na tabela; se a chave já existir, o trecho acrescentado no heap é devolvido
+        entrada = self._entrada(elem)
+        try:
+            return self.tabela.create(entrada)
+        except Exception:
+            self._libera(entrada)
+            raise
+
+    def create_many(self, elementos, tamanho_lote: int = 100000) -> int:
+        # Insere vários registros de uma vez (carga em lote), nos mesmos lotes da tabela das entradas
+        # As chaves de cada lote são verificadas antes de os bytes irem para o heap, para que um lote
+        # recusado por uma chave repetida não deixe trechos sem uso
+        total = 0
+        lote = []
+        for elem in elementos:
+            lote.append(elem)
+            if len(lote) >= tamanho_lote:
+                total += self._insere_lote(lote)
+                lote = []
+        if lote:
+            total += self._insere_lote(lote)
+        return total
+
+    def _insere_lote(self, lote) -> int:
+        # Recusa o lote se alguma chave se repetir nele ou já existir, e só então grava o heap e as entradas
+        chaves = [elem.hash_code() for elem in lote]
+        if len(set(chaves)) < len(chaves) or any(e is not None for e in self.tabela.read_many(chaves)):
+            raise Exception("Elemento já existe")
+        return self.tabela.create_many([self._entrada(elem) for elem in lote], len(lote))
+
+    def read(self, chave: int):
+        # Lê um registro pela chave
+        entrada = self.tabela.read(chave)
+        if entrada is None:
+            return None
+        return self._registro(entrada)
+
+    def update(self, elem: T) -> bool:
+        # Atualiza um registro existente; os bytes antigos no heap ficam sem uso até o compact()
+        entrada = self._entrada(elem)
+        if self.tabela.update(entrada):
+            return True
+        self._libera(entrada)
+        return False
+
+    def delete(self, chave: int) -> bool:
+        # Remove um registro pela chave
+        return self.tabela.delete(chave)
+
+    def read_many(self, chaves) -> list:
+        # Lê várias chaves com os cestos agrupados e os trechos do heap lidos em ordem de posição
+        entradas = self.tabela.read_many(chaves)
+        resultados = [None] * len(entradas)
+        for i in sorted((i for i, e in enumerate(entradas) if e is not None), key=lambda i: entradas[i].posicao):
+            resultados[i] = self._registro(entradas[i])
+        return resultados
+
+    def update_many(self, elementos) -> list:
+        # Atualiza vários registros; os bytes de registros não encontrados ficam sem uso até o compact()
+        return self.tabela.update_many([self._entrada(elem) for elem in elementos])
+
+    def delete_many(self, chaves) -> list:
+        # Remove várias chaves
+        return self.tabela.delete_many(chaves)
+
+    def scan(self, chave_min: int = None, chave_max: int = None):
+        # Gera todos os registros, ou os que estão no intervalo fechado de chaves
+        for entrada in self.tabela.scan(chave_min, chave_max):
+            yield self._registro(entrada)
+
+    def items(self, chave_min: int = None, chave_max: int = None):
+        # Gera pares (chave, registro)
+        for entrada in self.tabela.scan(chave_min, chave_max):
+            yield entrada.chave, self._registro(entrada)
+
+    def keys(self, chave_min: int = None, chave_max: int = None):
+        # Gera as chaves dos registros, sem ler o heap
+        return self.tabela.keys(chave_min, chave_max)
+
+    def __len__(self):
+        return len(self.tabela)
+
+    def flush(self):
+        # Grava as alterações pendentes da tabela e descarrega o buffer do heap
+        self.arq_heap.flush()
+        self.tabela.flush()
+
+    def checkpoint(self):
+        # Sincroniza o heap com o disco antes do checkpoint da tabela, que esvazia o log
+        self.arq_heap.flush()
+        os.fsync(self.arq_heap.fileno())
+        self.tabela.checkpoint()
+
+    def close(self):
+        # Fecha a tabela e o heap; o heap é sincronizado antes, pois as entradas apontam para ele
+        if self.arq_heap.closed:
+            return
+        self.arq_heap.flush()
+        os.fsync(self.arq_heap.fileno())
+        self.tabela.close()
+        self.arq_heap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def compact(self):
+        # Regrava o heap apenas com os registros vivos, na ordem do arquivo de cestos, e compacta a tabela
+        # O novo heap é montado em um arquivo temporário, e as novas entradas são gravadas em
+        # nh + '.compactando' antes de a tabela ser alterada: se a compactação for interrompida, a próxima
+        # abertura reaplica as entradas do marcador e conclui a troca, de modo que as entradas nunca apontam
+        # para o heap errado. A tabela não deve ser usada por outras threads durante a compactação
+        temporario = self.nome_arquivo_heap + '.tmp'
+        novas = []
+        posicao = 0
+        with open(temporario, 'wb') as f:
+            for entrada in self.tabela.scan():
+                if entrada.posicao >= 0:
+                    f.write(self.tabela._le_arquivo(self.arq_heap, entrada.posicao, entrada.tamanho))
+                    novas.append(self.entrada(entrada.chave, posicao, tamanho=entrada.tamanho))
+                    posicao += entrada.tamanho
+            f.flush()
+            os.fsync(f.fileno())
+        # O marcador só passa a existir completo (os.replace), e a partir dele a compactação é concluída
+        marcador = self.nome_arquivo_heap + '.compactando'
+        with open(marcador + '.tmp', 'wb') as f:
+            f.write(b''.join(entrada.to_byte_array() for entrada in novas))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(marcador + '.tmp', marcador)
+        self._conclui_compactacao(novas)
+        self.tabela.compact()
+
+    def _conclui_compactacao(self, novas):
+        # Aponta as entradas para o novo heap, torna a tabela durável e só então troca o heap e remove o
+        # marcador. Pode ser repetida: as entradas regravadas são as mesmas, e se o heap temporário não
+        # existir mais, a troca já foi feita
+        self.tabela.update_many(novas)
+        if self.tabela.log is not None:
+            self.tabela.checkpoint()
+        else:
+            self.tabela.flush()
+            os.fsync(self.tabela.arq_cestos.fileno())
+            os.fsync(self.tabela.arq_diretorio.fileno())
+        temporario = self.nome_arquivo_heap + '.tmp'
+        if os.path.exists(temporario):
+            self.arq_heap.close()
+            os.replace(temporario, self.nome_arquivo_heap)
+            self.arq_heap = open(self.nome_arquivo_heap, 'r+b')
+        self.fim_heap = self.tabela._tamanho_arquivo(self.arq_heap)
+        os.remove(self.nome_arquivo_heap + '.compactando')
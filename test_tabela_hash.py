@@ -1,9 +1,19 @@
+import asyncio
+import multiprocessing
 import os
 import struct
-from tabela_hash import HashExtensivel, RegistroHashExtensivel
+import time
+from array import array
+import tabela_hash
+from tabela_hash import AsyncHashExtensivel, HashExtensivel, HashExtensivelParticionada, HashExtensivelVariavel, LeitorHashExtensivel, RegistroHashExtensivel, VisaoEstrutura, hash_modulo, hash_splitmix64
 
 # Classe de teste para demonstrar o uso da tabela hash extensível
 class TestRecord(RegistroHashExtensivel):
+    # Evita que o pytest tente coletar esta classe como teste
+    __test__ = False
+    # A chave é o inteiro gravado nos 4 primeiros bytes
+    formato_chave = (0, '>i')
+
     def __init__(self, key: int = 0, value: str = ""):
         self.key = key
         self.value = value
@@ -35,6 +45,7 @@ class TestRecord(RegistroHashExtensivel):
 cache_dir = os.path.join(os.path.dirname(__file__), '__pycache__')
 dir_path = os.path.join(cache_dir, 'test_dir.bin')
 buckets_path = os.path.join(cache_dir, 'test_buckets.bin')
+os.makedirs(cache_dir, exist_ok=True)
 if os.path.exists(dir_path):
     os.remove(dir_path)
 if os.path.exists(buckets_path):
@@ -72,3 +83,987 @@ print(f"Read key 3 after delete: {hash_table.read(3)}")
 # Testa impressão do diretório e dos cestos
 print('\nTesting print:')
 hash_table.print()
+
+
+# Cria uma tabela nova em arquivos próprios, removendo restos de execuções anteriores
+def nova_tabela(nome: str, n: int = 3, **kwargs):
+    nd = os.path.join(cache_dir, f'{nome}_dir.bin')
+    nc = os.path.join(cache_dir, f'{nome}_buckets.bin')
+    for caminho in (nd, nc, nc + '.impressoes', nd + '.versao', nd + '.livres'):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    return HashExtensivel(TestRecord, n, nd, nc, **kwargs)
+
+# Testa se o diretório residente é gravado corretamente e recarregado ao reabrir
+def test_diretorio_residente():
+    ht = nova_tabela('residente')
+    for i in range(200):
+        ht.create(TestRecord(i, f"v{i}"))
+    ht.close()
+    ht = HashExtensivel(TestRecord, 3, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos)
+    assert ht.diretorio.profundidade_global > 0
+    for i in range(200):
+        assert ht.read(i).value == f"v{i}"
+    # O modo não residente deve enxergar exatamente o mesmo diretório
+    nr = HashExtensivel(TestRecord, 3, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, diretorio_residente=False)
+    assert nr.read(150).value == "v150"
+    assert nr.diretorio.faixa(0, len(nr.diretorio)) == ht.diretorio.enderecos
+    nr.close()
+    ht.close()
+
+# Testa o modo com arquivo de cestos mapeado em memória, comparando com o modo tradicional
+def test_cestos_mapeados():
+    ht = nova_tabela('mapa', 4, mmap_cestos=True)
+    ref = nova_tabela('mapa_ref', 4)
+    for t in (ht, ref):
+        for i in range(0, 300, 3):
+            t.create(TestRecord(i, f"v{i}"))
+        for i in range(0, 300, 9):
+            assert t.update(TestRecord(i, f"u{i}"))
+        for i in range(0, 300, 6):
+            assert t.delete(i)
+        assert not t.delete(1)
+        assert not t.update(TestRecord(2, "x"))
+    for i in range(300):
+        a, b = ht.read(i), ref.read(i)
+        assert (a is None and b is None) or (a.key, a.value) == (b.key, b.value)
+    ht.close()
+    ref.close()
+    with open(ht.nome_arquivo_cestos, 'rb') as f1, open(ref.nome_arquivo_cestos, 'rb') as f2:
+        assert f1.read() == f2.read()
+
+# Testa a carga em lote, comparando com inserções individuais
+def test_create_many():
+    ht = nova_tabela('lote')
+    ref = nova_tabela('lote_ref')
+    chaves = [(i * 37) % 1000 for i in range(500)]
+    for chave in chaves:
+        ref.create(TestRecord(chave, f"v{chave}"))
+    # Um gerador consumido em lotes pequenos, com cestos já existentes entre os lotes
+    assert ht.create_many((TestRecord(c, f"v{c}") for c in chaves), tamanho_lote=64) == 500
+    assert ht.diretorio.profundidade_global == ref.diretorio.profundidade_global
+    for i in range(1000):
+        a, b = ht.read(i), ref.read(i)
+        assert (a is None and b is None) or (a.key, a.value) == (b.key, b.value)
+    # Uma chave repetida rejeita o lote inteiro
+    try:
+        ht.create_many([TestRecord(1001, "novo"), TestRecord(chaves[0], "dup")])
+        assert False
+    except Exception as e:
+        assert str(e) == "Elemento já existe"
+    assert ht.read(1001) is None
+    ht.close()
+    ref.close()
+    ht = HashExtensivel(TestRecord, 3, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos)
+    assert all(ht.read(c).value == f"v{c}" for c in chaves)
+    ht.close()
+
+# Testa a divisão de cestos com chaves que compartilham os bits baixos (várias divisões seguidas)
+def test_divisao_chaves_adversarias():
+    ht = nova_tabela('adversaria', 2, funcao_hash=hash_modulo)
+    chaves = [i << 6 for i in range(40)]
+    for chave in chaves:
+        ht.create(TestRecord(chave, f"v{chave}"))
+    assert ht.diretorio.profundidade_global >= 6
+    ht.close()
+    ht = HashExtensivel(TestRecord, 2, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, funcao_hash=hash_modulo)
+    for chave in chaves:
+        assert ht.read(chave).value == f"v{chave}"
+    assert ht.read(1) is None
+    ht.close()
+
+# Testa o cache de cestos nos modos write-back e write-through, com um cache menor que a tabela
+def test_cache_cestos():
+    for adiada in (True, False):
+        ht = nova_tabela('cache', 3, cache_cestos=2, escrita_adiada=adiada)
+        ref = nova_tabela('cache_ref', 3)
+        for t in (ht, ref):
+            for i in range(120):
+                t.create(TestRecord(i, f"v{i}"))
+            for i in range(0, 120, 4):
+                assert t.update(TestRecord(i, f"u{i}"))
+            for i in range(0, 120, 5):
+                assert t.delete(i)
+        for i in range(120):
+            a, b = ht.read(i), ref.read(i)
+            assert (a is None and b is None) or (a.key, a.value) == (b.key, b.value)
+        ht.read(1)
+        ht.read(1)
+        estatisticas = ht.estatisticas_cache()
+        assert estatisticas['acertos'] > 0 and estatisticas['faltas'] > 0 and estatisticas['despejos'] > 0
+        assert estatisticas['ocupacao'] <= 2
+        if not adiada:
+            assert estatisticas['sujas'] == 0
+        ht.close()
+        ref.close()
+        with open(ht.nome_arquivo_cestos, 'rb') as f1, open(ref.nome_arquivo_cestos, 'rb') as f2:
+            assert f1.read() == f2.read()
+
+# Testa as operações de um cesto grande contra um dicionário de referência
+def test_cesto_busca_binaria():
+    import random
+    aleatorio = random.Random(7)
+    c = HashExtensivel.Cesto(TestRecord, 500)
+    ref = {}
+    for chave in aleatorio.sample(range(-5000, 5000), 500):
+        assert c.create(TestRecord(chave, f"v{chave}"))
+        ref[chave] = f"v{chave}"
+    assert c.full() and not c.create(TestRecord(9999, "x"))
+    for chave in aleatorio.sample(sorted(ref), 200):
+        assert c.delete(chave)
+        del ref[chave]
+    for chave in aleatorio.sample(sorted(ref), 100):
+        assert c.update(TestRecord(chave, f"u{chave}"))
+        ref[chave] = f"u{chave}"
+    assert list(c.chaves) == sorted(ref)
+    # Recarrega a partir dos bytes e confere o conteúdo
+    d = HashExtensivel.Cesto(TestRecord, 500)
+    d.from_byte_array(c.to_byte_array())
+    for chave in range(-5000, 5000, 7):
+        elem = d.read(chave)
+        assert (elem is None and chave not in ref) or elem.value == ref[chave]
+    assert not d.delete(5001) and not d.update(TestRecord(5001, "x"))
+
+# Testa a varredura completa, o filtro por intervalo de chaves e o total de registros
+def test_scan():
+    ht = nova_tabela('scan', 4, cache_cestos=4)
+    chaves = set(range(-150, 450, 3))
+    for chave in sorted(chaves):
+        ht.create(TestRecord(chave, f"v{chave}"))
+    for chave in range(0, 300, 9):
+        assert ht.delete(chave)
+        chaves.discard(chave)
+    assert len(ht) == len(chaves)
+    assert sorted(e.key for e in ht.scan()) == sorted(chaves)
+    assert sorted(ht.keys()) == sorted(chaves)
+    assert {k: e.value for k, e in ht.items()} == {k: f"v{k}" for k in chaves}
+    intervalo = sorted(k for k in chaves if -10 <= k <= 100)
+    assert sorted(e.key for e in ht.scan(-10, 100, tamanho_bloco=1)) == intervalo
+    assert sorted(ht.keys(chave_min=-10, chave_max=100)) == intervalo
+    assert sorted(ht.keys(chave_min=400)) == sorted(k for k in chaves if k >= 400)
+    ht.close()
+    # O total é recontado ao reabrir a tabela e mantido pelas operações seguintes
+    ht = HashExtensivel(TestRecord, 4, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, mmap_cestos=True)
+    assert len(ht) == len(chaves)
+    ht.create(TestRecord(1000, "novo"))
+    ht.delete(-150)
+    assert len(ht) == len(chaves)
+    assert sorted(ht.keys()) == sorted(chaves - {-150} | {1000})
+    ht.close()
+
+# Testa o uso simultâneo da mesma tabela por várias threads, com divisões acontecendo durante as leituras
+def test_concorrencia():
+    import threading
+    for nome, opcoes in (('threads', {}), ('threads_mapa', {'mmap_cestos': True}),
+                         ('threads_cache', {'cache_cestos': 8})):
+        ht = nova_tabela(nome, 4, **opcoes)
+        erros = []
+
+        def trabalha(t):
+            try:
+                chaves = range(t, 2400, 8)
+                for chave in chaves:
+                    ht.create(TestRecord(chave, f"v{chave}"))
+                    assert ht.read(chave).value == f"v{chave}"
+                for chave in chaves[::2]:
+                    assert ht.update(TestRecord(chave, f"u{chave}"))
+                for chave in chaves[::3]:
+                    assert ht.delete(chave)
+            except Exception as e:
+                erros.append(e)
+
+        threads = [threading.Thread(target=trabalha, args=(t,)) for t in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert erros == []
+        esperado = {}
+        for t in range(8):
+            chaves = range(t, 2400, 8)
+            for i, chave in enumerate(chaves):
+                if i % 3 != 0:
+                    esperado[chave] = f"u{chave}" if i % 2 == 0 else f"v{chave}"
+        assert len(ht) == len(esperado)
+        assert {k: e.value for k, e in ht.items()} == esperado
+        ht.close()
+
+# Copia os arquivos da tabela no estado atual do disco, como se o processo tivesse sido interrompido
+def copia_arquivos(ht, nome: str):
+    import shutil
+    destinos = []
+    for origem, sufixo in ((ht.nome_arquivo_diretorio, 'dir'), (ht.nome_arquivo_cestos, 'buckets'),
+                           (ht.log.nome, 'log')):
+        destino = os.path.join(cache_dir, f'{nome}_{sufixo}.bin')
+        shutil.copyfile(origem, destino)
+        destinos.append(destino)
+    shutil.copyfile(ht.nome_arquivo_diretorio + '.hash', destinos[0] + '.hash')
+    return destinos
+
+# Testa a recuperação pelo log de operações após interrupções em diferentes pontos
+def test_log_recuperacao():
+    log_path = os.path.join(cache_dir, 'log_wal.bin')
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    ht = nova_tabela('log', 3, arquivo_log=log_path, intervalo_sync=3600)
+    for i in range(300):
+        ht.create(TestRecord(i, f"v{i}"))
+    for i in range(0, 300, 7):
+        ht.delete(i)
+    esperado = {i: f"v{i}" for i in range(300) if i % 7}
+    # Com sincronização adiada, nada foi gravado nos arquivos da tabela ainda
+    assert ht.pendentes
+    ht.log.sincroniza()
+    # Interrupção antes de gravar as imagens pendentes, e no meio da gravação, com lixo no fim do log
+    for nome, parte in (('log_antes', 0), ('log_meio', len(ht.pendentes) // 2)):
+        for endereco in sorted(ht.pendentes)[:parte]:
+            ht._grava_bytes_cestos(endereco, ht.pendentes[endereco])
+        nd, nc, nl = copia_arquivos(ht, nome)
+        with open(nl, 'ab') as f:
+            f.write(b'C\x00\x01')
+        rec = HashExtensivel(TestRecord, 3, nd, nc, arquivo_log=nl)
+        assert os.path.getsize(nl) == 0
+        assert {k: e.value for k, e in rec.items()} == esperado
+        assert rec.read(8).value == "v8" and rec.read(7) is None
+        rec.close()
+    # Um checkpoint grava tudo e esvazia o log
+    ht.update(TestRecord(1, "u1"))
+    ht.checkpoint()
+    assert os.path.getsize(log_path) == 0 and not ht.pendentes
+    ht.close()
+    ht = HashExtensivel(TestRecord, 3, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos)
+    assert ht.read(1).value == "u1" and len(ht) == len(esperado)
+    ht.close()
+    # Com group commit, uma tabela parada sincroniza sozinha os grupos confirmados após o intervalo
+    ht = HashExtensivel(TestRecord, 3, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, arquivo_log=log_path,
+                        intervalo_sync=0.3)
+    ht.update(TestRecord(2, "u2"))
+    assert ht.pendentes and ht.log.nao_sincronizados == 1
+    for _ in range(200):
+        if not ht.pendentes:
+            break
+        time.sleep(0.02)
+    assert not ht.pendentes and ht.log.nao_sincronizados == 0
+    ht.close()
+    assert ht.thread_sync is None
+
+# Confere se cada cesto é referenciado por exatamente 2^(pg - pl) posições do diretório
+def confere_estrutura(ht):
+    d = ht.diretorio
+    referencias = {}
+    for e in d.enderecos:
+        referencias[e] = referencias.get(e, 0) + 1
+    for e, quantidade in referencias.items():
+        assert quantidade == 2 ** (d.profundidade_global - ht._le_cesto(e).profundidade_local)
+
+# Testa a junção de cestos, a redução do diretório, o reaproveitamento de cestos livres e a compactação
+def test_juncao_e_compactacao():
+    import random
+    aleatorio = random.Random(3)
+    ht = nova_tabela('juncao', 4)
+    chaves = aleatorio.sample(range(100000), 600)
+    ht.create_many(TestRecord(c, f"v{c}") for c in chaves)
+    profundidade = ht.diretorio.profundidade_global
+    # Uma remoção que não permite junção lê só o próprio cesto (e os cabeçalhos), sem a seção exclusiva
+    chave = next(c for c in chaves if ht._cabecalho_cesto(ht._endereco_cesto(c))[1] == 4)
+    juncoes, leituras = ht.stats()['juncoes'], ht.stats()['leituras_cestos']
+    assert ht.delete(chave) and not ht._pode_juntar(ht._endereco_cesto(chave), chave)
+    assert ht.stats()['leituras_cestos'] == leituras + 1 and ht.stats()['juncoes'] == juncoes
+    ht.create(TestRecord(chave, f"v{chave}"))
+    tamanho = os.path.getsize(ht.nome_arquivo_cestos)
+    for c in chaves[:570]:
+        assert ht.delete(c)
+    confere_estrutura(ht)
+    assert ht.diretorio.profundidade_global < profundidade and ht.livres
+    assert len(ht) == 30 and sorted(ht.keys()) == sorted(chaves[570:])
+    # Novas inserções reaproveitam os cestos livres em vez de crescer o arquivo
+    for c in chaves[:300]:
+        ht.create(TestRecord(c, f"v{c}"))
+    confere_estrutura(ht)
+    assert os.path.getsize(ht.nome_arquivo_cestos) <= tamanho
+    for c in chaves[:300]:
+        ht.delete(c)
+    ht.close()
+    ht = HashExtensivel(TestRecord, 4, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, mmap_cestos=True)
+    assert ht.livres
+    ht.compact()
+    assert not ht.livres
+    confere_estrutura(ht)
+    assert os.path.getsize(ht.nome_arquivo_cestos) == len(set(ht.diretorio.enderecos)) * ht.bytes_por_cesto
+    assert os.path.getsize(ht.nome_arquivo_diretorio) == 1 + 8 * 2 ** ht.diretorio.profundidade_global
+    for c in chaves[570:]:
+        assert ht.read(c).value == f"v{c}"
+    ht.create(TestRecord(1, "novo"))
+    ht.close()
+    ht = HashExtensivel(TestRecord, 4, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos)
+    assert len(ht) == 31 and ht.read(1).value == "novo"
+    ht.close()
+
+# Testa a recuperação pelo log de junções e reduções do diretório, intercaladas com divisões
+def test_log_juncao():
+    log_path = os.path.join(cache_dir, 'log_juncao_wal.bin')
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    ht = nova_tabela('log_juncao', 2, arquivo_log=log_path, intervalo_sync=3600)
+    for i in range(64):
+        ht.create(TestRecord(i, "v"))
+    ht.checkpoint()
+    for i in range(60):
+        ht.delete(i)
+    for i in range(100, 120):
+        ht.create(TestRecord(i, "n"))
+    ht.log.sincroniza()
+    nd, nc, nl = copia_arquivos(ht, 'log_juncao_copia')
+    rec = HashExtensivel(TestRecord, 2, nd, nc, arquivo_log=nl)
+    confere_estrutura(rec)
+    assert sorted(rec.keys()) == list(range(60, 64)) + list(range(100, 120))
+    assert rec.diretorio.enderecos == ht.diretorio.enderecos
+    rec.close()
+    # Com leitores, reaplicar uma redução do diretório não encurta o arquivo
+    nd, nc, nl = copia_arquivos(ht, 'log_juncao_leitores')
+    tamanho = os.path.getsize(nd)
+    with open(nd, 'rb') as f:
+        profundidade = f.read(1)[0]
+    rec = HashExtensivel(TestRecord, 2, nd, nc, arquivo_log=nl, leitores=True)
+    assert rec.diretorio.profundidade_global == ht.diretorio.profundidade_global < profundidade
+    assert os.path.getsize(nd) == tamanho
+    assert sorted(rec.keys()) == list(range(60, 64)) + list(range(100, 120))
+    rec.close()
+    # Um log deixado ao lado de arquivos da tabela ausentes ou vazios é de outra tabela e é descartado
+    ht.log.sincroniza()
+    for vazio in (None, nc):
+        nd, nc, nl = copia_arquivos(ht, 'log_orfao')
+        os.remove(nd)
+        if vazio is not None:
+            open(vazio, 'wb').close()
+        rec = HashExtensivel(TestRecord, 2, nd, nc, arquivo_log=nl)
+        assert os.path.getsize(nl) == 0 and len(rec) == 0 and list(rec.keys()) == []
+        rec.create(TestRecord(1, "novo"))
+        rec.close()
+    ht.close()
+
+# Testa as funções de hash: a padrão espalha chaves que a original concentra
+def test_funcao_hash():
+    d = HashExtensivel.Diretorio()
+    d.profundidade_global = 10
+    assert d.hash(5) != d.hash(-5)
+    assert len({d.hash(i << 10) for i in range(1000)}) > 500
+    assert hash_splitmix64(-1) >= 0 and hash_splitmix64(2 ** 63 - 1) < 2 ** 64
+    chaves = [i << 10 for i in range(200)]
+    tabelas = {}
+    for nome, funcao in (('hash_mistura', hash_splitmix64), ('hash_modulo', hash_modulo), ('hash_propria', lambda c: c * 31)):
+        ht = nova_tabela(nome, 4, funcao_hash=funcao)
+        ht.create_many(TestRecord(c, f"v{c}") for c in chaves)
+        assert all(ht.read(c).value == f"v{c}" for c in chaves)
+        confere_estrutura(ht)
+        tabelas[nome] = ht.diretorio.profundidade_global
+        ht.close()
+        # A função usada fica gravada: sem funcao_hash a tabela reabre com ela, e outra função é recusada
+        nd, nc = ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos
+        if nome == 'hash_propria':
+            try:
+                HashExtensivel(TestRecord, 4, nd, nc)
+                assert False
+            except Exception as e:
+                assert "informe-a em funcao_hash" in str(e)
+            continue
+        with HashExtensivel(TestRecord, 4, nd, nc) as reaberta:
+            assert reaberta.funcao_hash is funcao and all(reaberta.read(c).value == f"v{c}" for c in chaves)
+        outra = hash_modulo if funcao is hash_splitmix64 else hash_splitmix64
+        try:
+            HashExtensivel(TestRecord, 4, nd, nc, funcao_hash=outra)
+            assert False
+        except Exception as e:
+            assert str(e).startswith("A tabela foi criada com a função de hash")
+    assert tabelas['hash_mistura'] < tabelas['hash_modulo']
+    # Uma tabela anterior ao registro (sem o arquivo .hash) é aberta com hash_modulo, a função original
+    nd = os.path.join(cache_dir, 'hash_modulo_dir.bin')
+    os.remove(nd + '.hash')
+    with HashExtensivel(TestRecord, 4, nd, os.path.join(cache_dir, 'hash_modulo_buckets.bin')) as antiga:
+        assert antiga.funcao_hash is hash_modulo and all(antiga.read(c).value == f"v{c}" for c in chaves)
+    with open(nd + '.hash') as f:
+        assert f.read() == 'modulo'
+
+# Registro de tamanho variável: a chave e um texto de qualquer comprimento
+class TextoRecord(RegistroHashExtensivel):
+    __test__ = False
+
+    def __init__(self, key: int = 0, value: str = ""):
+        self.key = key
+        self.value = value
+
+    def hash_code(self) -> int:
+        return self.key
+
+    def size(self) -> int:
+        return 4 + len(self.value.encode('utf-8'))
+
+    def to_byte_array(self) -> bytes:
+        return struct.pack('>i', self.key) + self.value.encode('utf-8')
+
+    def from_byte_array(self, ba: bytes):
+        self.key = struct.unpack('>i', ba[:4])[0]
+        self.value = bytes(ba[4:]).decode('utf-8')
+
+# Testa registros de tamanho variável guardados no arquivo heap, com e sem mapeamento dos cestos
+def test_registros_variaveis():
+    for nome, opcoes in (('variavel', {}), ('variavel_mapa', {'mmap_cestos': True})):
+        nd, nc, nh = (os.path.join(cache_dir, f'{nome}_{sufixo}.bin') for sufixo in ('dir', 'buckets', 'heap'))
+        for caminho in (nd, nc, nh):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        ht = HashExtensivelVariavel(TextoRecord, 4, nd, nc, nh, tamanho_inline=12, **opcoes)
+        textos = {i: 'x' * (i % 50) for i in range(300)}
+        assert ht.create_many(TextoRecord(i, textos[i]) for i in range(200)) == 200
+        for i in range(200, 300):
+            assert ht.create(TextoRecord(i, textos[i]))
+        # Inserções recusadas não deixam trechos sem uso no heap
+        fim = ht.fim_heap
+        try:
+            ht.create(TextoRecord(5, "outro registro longo"))
+            assert False
+        except Exception as e:
+            assert str(e) == "Elemento já existe"
+        try:
+            ht.create_many([TextoRecord(300, "registro novo e longo"), TextoRecord(40, "registro repetido")])
+            assert False
+        except Exception as e:
+            assert str(e) == "Elemento já existe"
+        assert ht.fim_heap == fim and ht.read(300) is None
+        assert not ht.update(TextoRecord(1000, "registro ausente e longo")) and ht.fim_heap == fim
+        # Registros curtos ficam na própria entrada e não ocupam o heap
+        assert ht.read(3).value == 'xxx'
+        assert ht.tabela.read(3).posicao == -1 and ht.tabela.read(40).posicao >= 0
+        for i in range(0, 300, 3):
+            textos[i] = 'atualizado ' * (i % 7)
+            assert ht.update(TextoRecord(i, textos[i]))
+        for i in range(0, 300, 5):
+            assert ht.delete(i)
+            del textos[i]
+        assert not ht.update(TextoRecord(0, "x"))
+        assert len(ht) == len(textos)
+        assert {r.key: r.value for r in ht.scan()} == textos
+        assert sorted(ht.keys(10, 20)) == [k for k in sorted(textos) if 10 <= k <= 20]
+        ht.close()
+        ht = HashExtensivelVariavel(TextoRecord, 4, nd, nc, nh, tamanho_inline=12, **opcoes)
+        assert all(ht.read(k).value == v for k, v in textos.items())
+        antes = os.path.getsize(nh)
+        ht.compact()
+        assert os.path.getsize(nh) < antes
+        assert os.path.getsize(nh) == sum(len(v) + 4 for v in textos.values() if len(v) + 4 > 12)
+        assert dict(ht.items()).keys() == textos.keys()
+        assert all(ht.read(k).value == v for k, v in textos.items())
+        assert ht.read(0) is None
+        assert [r and r.value for r in ht.read_many([1, 0, 49])] == [textos[1], None, textos[49]]
+        assert ht.update_many([TextoRecord(1, "y" * 40), TextoRecord(0, "z")]) == [True, False]
+        assert ht.delete_many([1, 1]) == [True, False] and ht.read(1) is None
+        ht.close()
+
+# Testa que, no modo com log, o heap é sincronizado antes do log que registra as entradas que apontam para ele
+def test_heap_sincronizado_antes_do_log():
+    nd, nc, nh, nl = (os.path.join(cache_dir, f'variavel_log_{sufixo}.bin') for sufixo in ('dir', 'buckets', 'heap', 'log'))
+    for caminho in (nd, nc, nh, nl):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    ht = HashExtensivelVariavel(TextoRecord, 4, nd, nc, nh, tamanho_inline=12, arquivo_log=nl)
+    eventos = []
+    sincroniza_heap = ht._sincroniza_heap
+    ht.tabela.antes_sincronizar_log[0] = lambda: (eventos.append('heap'), sincroniza_heap())
+    sincroniza_log = ht.tabela.log.sincroniza
+    ht.tabela.log.sincroniza = lambda: (eventos.append('log'), sincroniza_log())
+    ht.create(TextoRecord(1, "registro guardado no heap"))
+    assert eventos == ['heap', 'log']
+    ht.close()
+
+# Testa a retomada de um compact() do heap interrompido depois de regravar parte das entradas
+def test_compactacao_heap_interrompida():
+    nd, nc, nh = (os.path.join(cache_dir, f'variavel_interrompida_{sufixo}.bin') for sufixo in ('dir', 'buckets', 'heap'))
+    for caminho in (nd, nc, nh, nh + '.tmp', nh + '.compactando'):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    ht = HashExtensivelVariavel(TextoRecord, 4, nd, nc, nh, tamanho_inline=12)
+    textos = {i: 'registro %d ' % i * (1 + i % 4) for i in range(200)}
+    ht.create_many(TextoRecord(i, v) for i, v in textos.items())
+    for i in range(0, 200, 2):
+        textos[i] = 'novo ' * (3 + i % 5)
+        ht.update(TextoRecord(i, textos[i]))
+
+    # Simula a interrupção: metade das entradas já aponta para o novo heap, que ainda não substituiu o antigo
+    def interrompe(novas):
+        ht.tabela.update_many(novas[:len(novas) // 2])
+        ht.tabela.flush()
+        raise KeyboardInterrupt
+    ht._conclui_compactacao = interrompe
+    try:
+        ht.compact()
+        assert False
+    except KeyboardInterrupt:
+        pass
+    ht.tabela.close()
+    ht.arq_heap.close()
+    assert os.path.exists(nh + '.tmp') and os.path.exists(nh + '.compactando')
+
+    ht = HashExtensivelVariavel(TextoRecord, 4, nd, nc, nh, tamanho_inline=12)
+    assert not os.path.exists(nh + '.tmp') and not os.path.exists(nh + '.compactando')
+    assert os.path.getsize(nh) == sum(len(v) + 4 for v in textos.values() if len(v) + 4 > 12)
+    assert all(ht.read(k).value == v for k, v in textos.items())
+    ht.close()
+
+# O mesmo registro de teste, declarando o formato completo para a conversão vetorizada dos cestos
+class TestRecordFormatado(TestRecord):
+    __test__ = False
+    formato_registro = '>i20s'
+
+    def campos(self) -> tuple:
+        return self.key, self.value.encode('utf-8')[:20].ljust(20)
+
+    @classmethod
+    def de_campos(cls, campos: tuple):
+        return cls(campos[0], campos[1].decode('utf-8').rstrip())
+
+# Testa que as conversões dos cestos (registro a registro, struct e NumPy) gravam os mesmos bytes
+def test_codec_cestos():
+    c = HashExtensivel.Cesto(TestRecord, 8, 3)
+    c.define_elementos([TestRecord(k, f"v{k}") for k in (9, -4, 7)])
+    ba = c.to_byte_array()
+    assert len(ba) == c.size() and ba[0] == 3 and ba[3 + 3 * 24:] == bytes(5 * 24)
+    numpy_original = tabela_hash.numpy
+    arquivos = []
+    try:
+        for nome, cls, com_numpy in (('codec', TestRecord, False), ('codec_struct', TestRecordFormatado, False),
+                                     ('codec_numpy', TestRecordFormatado, True)):
+            tabela_hash.numpy = numpy_original if com_numpy else None
+            HashExtensivel.CodecRegistros.codecs.pop(cls, None)
+            f = HashExtensivel.Cesto(cls, 8)
+            f.from_byte_array(ba)
+            assert len(f.elementos) == 3 and list(f.chaves) == [-4, 7, 9]
+            assert [e.value for e in f.elementos] == ["v-4", "v7", "v9"] and f.to_byte_array() == ba
+            ht = nova_tabela(nome, 4)
+            ht.close()
+            ht = HashExtensivel(cls, 4, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos)
+            ht.create_many(cls(k, f"v{k}") for k in range(0, 600, 2))
+            for k in range(0, 600, 6):
+                ht.delete(k)
+            assert sorted(ht.keys()) == sorted(e.key for e in ht.scan())
+            ht.close()
+            with open(ht.nome_arquivo_cestos, 'rb') as arquivo:
+                arquivos.append(arquivo.read())
+    finally:
+        tabela_hash.numpy = numpy_original
+        for cls in (TestRecord, TestRecordFormatado):
+            HashExtensivel.CodecRegistros.codecs.pop(cls, None)
+    assert arquivos[0] == arquivos[1] == arquivos[2]
+    d = HashExtensivel.Diretorio()
+    d.duplica()
+    d.duplica()
+    d.enderecos = array('q', [0, -1, 2 ** 40, 7])
+    e = HashExtensivel.Diretorio()
+    e.from_byte_array(d.to_byte_array())
+    assert e.profundidade_global == 2 and e.enderecos == d.enderecos
+
+# Testa os contadores de stats(), os ganchos e o resumo da estrutura
+def test_estatisticas():
+    ht = nova_tabela('estatisticas', 4)
+    eventos = {}
+    def gancho(evento, dados):
+        eventos[evento] = eventos.get(evento, 0) + 1
+        if evento in ('leitura', 'gravacao'):
+            assert dados['tamanho'] > 0 and dados['duracao'] >= 0
+    ht.stats(zera=True)
+    ht.adiciona_gancho(gancho)
+    for i in range(300):
+        ht.create(TestRecord(i, f"v{i}"))
+    s = ht.stats()
+    cestos = len(set(ht.diretorio.enderecos))
+    assert s['divisoes'] == eventos['divisao'] == cestos - 1
+    assert s['duplicacoes'] == eventos['duplicacao'] == ht.diretorio.profundidade_global
+    assert s['gravacoes'] == eventos['gravacao'] and s['leituras'] == eventos['leitura']
+    assert s['leituras_cestos'] >= 300 and s['gravacoes_cestos'] >= 300 and s['bytes_gravados'] > 0
+    assert s['profundidade_divisao_maxima'] >= 1 and s['leituras_diretorio'] == 0
+    e = ht.estrutura()
+    assert e['registros'] == 300 == len(ht)
+    assert sum(e['histograma_profundidades'].values()) == len(e['cestos']) == cestos
+    assert e['fator_carga'] == 300 / (cestos * 4)
+    for c in e['cestos']:
+        assert c['quantidade'] == ht._le_cesto(c['endereco']).quantidade
+    assert e['cestos_cheios'] == sum(1 for c in e['cestos'] if c['quantidade'] == 4)
+    ht.stats(zera=True)
+    for i in range(290):
+        ht.delete(i)
+    s = ht.stats()
+    assert s['juncoes'] == eventos['juncao'] > 0 and s['reducoes'] == eventos['reducao'] > 0
+    assert s['divisoes'] == 0
+    ht.remove_gancho(gancho)
+    antes = dict(eventos)
+    ht.read(295)
+    assert eventos == antes and ht.stats()['leituras_cestos'] == s['leituras_cestos'] + 1
+    e = ht.estrutura()
+    assert e['registros'] == 10 and e['cestos_livres'] == len(ht.livres) > 0
+    ht.close()
+    nr = HashExtensivel(TestRecord, 4, ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, diretorio_residente=False)
+    nr.read(1)
+    nr.read(2)
+    assert nr.stats()['leituras_diretorio'] == 3
+    nr.close()
+
+# Testa a interface asyncio: leituras concorrentes juntadas em lotes, com uma leitura por cesto
+def test_async():
+    ht = nova_tabela('async', 16)
+    ht.create_many(TestRecord(i, f"v{i}") for i in range(1000))
+    grupos = ht._agrupa_por_cesto(range(1000))
+    mesmo_cesto = [i for indices in grupos.values() if len(indices) >= 10 for i in indices][:10]
+
+    async def principal():
+        async with AsyncHashExtensivel(ht, max_threads=2) as aht:
+            antes = ht.stats()['leituras_cestos']
+            registros = await asyncio.gather(*[aht.get(c) for c in mesmo_cesto])
+            assert [r.value for r in registros] == [f"v{c}" for c in mesmo_cesto]
+            assert ht.stats()['leituras_cestos'] == antes + 1 and aht.lotes == 1
+            chaves = [5, 2000, 999, 5, 3]
+            assert [r and r.value for r in await aht.get_many(chaves)] == ["v5", None, "v999", "v5", "v3"]
+            assert await aht.put(TestRecord(2000, "novo"))
+            assert await aht.put(TestRecord(5, "alterado"))
+            assert (await aht.get(2000)).value == "novo" and (await aht.get(5)).value == "alterado"
+            assert await aht.delete(5) and not await aht.delete(5)
+            assert await aht.get(5) is None
+            # Se outra thread insere a chave entre o update e o create, put() a atualiza; outros erros do
+            # create são relançados em vez de virarem um False
+            criacao = ht.create
+
+            def cria_concorrente(elem):
+                criacao(TestRecord(elem.key, "concorrente"))
+                return criacao(elem)
+            ht.create = cria_concorrente
+            assert await aht.put(TestRecord(3000, "put")) and (await aht.get(3000)).value == "put"
+
+            def falha(elem):
+                raise Exception("Profundidade local máxima de 127 bits")
+            ht.create = falha
+            try:
+                await aht.put(TestRecord(3001, "put"))
+                assert False
+            except Exception as e:
+                assert str(e) == "Profundidade local máxima de 127 bits"
+            del ht.create
+            assert await aht.delete(3000)
+            # Muitas leituras ao mesmo tempo, em vários lotes
+            todos = await aht.get_many(range(1001))
+            assert sum(r is not None for r in todos) == 999 and aht.chaves_lidas > 1000
+            # Leituras ainda na fila quando o bloco termina: close() espera os seus resultados
+            tarefas = [asyncio.ensure_future(aht.get(c)) for c in range(100)]
+            await asyncio.sleep(0)
+        assert ht.arq_cestos.closed and not aht.leituras_abertas
+        assert [t.result() is not None for t in tarefas] == [c != 5 for c in range(100)]
+
+    asyncio.run(principal())
+
+# Testa read_many, update_many e delete_many nos modos com arquivo, mmap, cache e log,
+# comparando com as operações individuais
+def test_operacoes_em_lote():
+    import random
+    aleatorio = random.Random(11)
+    log_path = os.path.join(cache_dir, 'lote_log_wal.bin')
+    if os.path.exists(log_path):
+        os.remove(log_path)
+    modos = (('varios', {}), ('varios_mapa', {'mmap_cestos': True}), ('varios_cache', {'cache_cestos': 8}),
+             ('varios_log', {'arquivo_log': log_path}))
+    for nome, opcoes in modos:
+        ht = nova_tabela(nome, 8, **opcoes)
+        ht.create_many(TestRecord(i, f"v{i}") for i in range(0, 2000, 2))
+        chaves = aleatorio.sample(range(2000), 500) + [10, 10]
+        ht.stats(zera=True)
+        lidos = ht.read_many(chaves)
+        assert [r and r.value for r in lidos] == [f"v{c}" if c % 2 == 0 else None for c in chaves]
+        if not opcoes:
+            # Cada cesto tocado é lido uma única vez
+            assert ht.stats()['leituras_cestos'] == len(ht._agrupa_por_cesto(chaves))
+        atualizados = ht.update_many(TestRecord(c, f"u{c}") for c in chaves)
+        assert atualizados == [c % 2 == 0 for c in chaves]
+        assert all(ht.read(c).value == f"u{c}" for c in chaves if c % 2 == 0)
+        removidas = ht.delete_many(chaves[:300] + [1, 1])
+        esperado = [c % 2 == 0 for c in chaves[:300]] + [False, False]
+        # A mesma chave repetida só é removida na primeira vez
+        vistos = set()
+        for i, c in enumerate(chaves[:300]):
+            if c in vistos:
+                esperado[i] = False
+            vistos.add(c)
+        assert removidas == esperado
+        restantes = set(range(0, 2000, 2)) - set(chaves[:300])
+        assert len(ht) == len(restantes) and set(ht.keys()) == restantes
+        confere_estrutura(ht)
+        ht.close()
+
+# Testa a tabela particionada, com as partições no próprio processo e em processos trabalhadores
+def test_particionada():
+    nome = os.path.join(cache_dir, 'particionada')
+    for processos in (0, 2):
+        for i in range(4):
+            for sufixo in ('dir', 'cestos'):
+                if os.path.exists(f'{nome}.{i}.{sufixo}.bin'):
+                    os.remove(f'{nome}.{i}.{sufixo}.bin')
+        if os.path.exists(nome + '.particoes'):
+            os.remove(nome + '.particoes')
+        with HashExtensivelParticionada(TestRecord, 8, nome, 4, processos=processos) as ht:
+            assert ht.create_many(TestRecord(i, f"v{i}") for i in range(0, 1000, 2)) == 500
+            assert ht.create(TestRecord(1, "um"))
+            try:
+                ht.create(TestRecord(1, "outro"))
+                assert False
+            except Exception as e:
+                assert str(e) == "Elemento já existe"
+            assert ht.read(1).value == "um" and ht.read(3) is None
+            assert [r and r.value for r in ht.read_many([4, 5, 998])] == ["v4", None, "v998"]
+            assert ht.update(TestRecord(4, "u4")) and not ht.update(TestRecord(5, "x"))
+            assert ht.update_many([TestRecord(6, "u6"), TestRecord(7, "x")]) == [True, False]
+            assert ht.delete(1) and ht.delete_many([2, 3, 2]) == [True, False, False]
+            assert len(ht) == 499
+            assert sorted(ht.keys()) == [0] + list(range(4, 1000, 2))
+            assert {k: r.value for k, r in ht.items(4, 7)} == {4: "u4", 6: "u6"}
+        # Todas as partições recebem chaves, e cada chave está só na partição calculada
+        tamanhos = []
+        for i, (nd, nc) in enumerate(ht.arquivos):
+            with HashExtensivel(TestRecord, 8, nd, nc) as parte:
+                chaves = list(parte.keys())
+                assert all(ht.particao(c) == i for c in chaves)
+                tamanhos.append(len(chaves))
+        assert sum(tamanhos) == 499 and min(tamanhos) > 60
+    # A quantidade de partições fica gravada e não pode mudar, inclusive em tabelas anteriores ao registro
+    for remove_registro in (False, True):
+        if remove_registro:
+            os.remove(nome + '.particoes')
+        for particoes in (2, 8):
+            try:
+                HashExtensivelParticionada(TestRecord, 8, nome, particoes)
+                assert False
+            except Exception as e:
+                assert str(e) == f"A tabela foi criada com 4 partições, não com {particoes}"
+    with HashExtensivelParticionada(TestRecord, 8, nome, 4) as ht:
+        assert len(ht) == 499 and ht.read(0).value == "v0"
+    assert os.path.exists(nome + '.particoes')
+
+# Testa a visão incremental da estrutura: só os cestos alterados são relidos a cada atualização
+def test_visao_estrutura():
+    ht = nova_tabela('visao', 4)
+    ht.create_many(TestRecord(i, f"v{i}") for i in range(0, 400, 2))
+    visao = VisaoEstrutura(ht)
+    assert visao.atualiza() == len(set(ht.diretorio.enderecos))
+    assert visao.atualiza() == 0
+    e = ht.estrutura()
+    resumo = visao.resumo()
+    for campo in ('registros', 'fator_carga', 'histograma_profundidades', 'cestos_vazios', 'cestos_cheios'):
+        assert resumo[campo] == e[campo]
+    # Uma atualização e uma remoção sem junção tocam apenas o cesto da chave
+    endereco = ht._endereco_cesto(10)
+    assert [r.value for r in visao.registros_cesto(endereco)] == [r.value for r in ht.registros_cesto(endereco)]
+    ht.update(TestRecord(10, "novo"))
+    assert visao.atualiza() == 1
+    assert "novo" in [r.value for r in visao.registros_cesto(endereco)]
+    # O diretório agrupado cobre todas as entradas, uma linha por cesto
+    linhas = visao.diretorio_agrupado()
+    assert len(linhas) == resumo['cestos'] and sum(l['entradas'] for l in linhas) == len(ht.diretorio.enderecos)
+    for l in linhas:
+        assert ht.diretorio.enderecos[l['primeira_entrada']] == l['endereco']
+    parcial = visao.diretorio_agrupado(5, 9)
+    assert sum(l['entradas'] for l in parcial) == 5
+    assert {l['endereco'] for l in parcial} == set(ht.diretorio.enderecos[5:10])
+    cestos, total = visao.pagina(0, 3, 5, 9)
+    assert total == len(set(ht.diretorio.enderecos[5:10])) and len(cestos) == min(3, total)
+    todos = []
+    for numero in range(100):
+        cestos, total = visao.pagina(numero, 7)
+        todos += cestos
+    assert total == resumo['cestos'] and [c['endereco'] for c in todos] == sorted(set(ht.diretorio.enderecos))
+    # Divisões, junções e compact() atualizam o diretório e os cabeçalhos
+    ht.create_many(TestRecord(i, "x") for i in range(1, 400, 2))
+    visao.atualiza()
+    assert visao.resumo()['registros'] == 400 and visao.resumo()['cestos'] == len(set(ht.diretorio.enderecos))
+    for endereco in visao.enderecos:
+        visao.registros_cesto(endereco)
+    guardados = len(visao.registros)
+    ht.delete_many(range(350))
+    visao.atualiza()
+    assert visao.resumo()['registros'] == 50 and set(visao.cabecalhos) == set(ht.diretorio.enderecos)
+    # Os registros guardados dos cestos liberados pelas junções são descartados
+    assert set(visao.registros) <= set(ht.diretorio.enderecos) and len(visao.registros) < guardados
+    ht.compact()
+    assert visao.atualiza() == len(set(ht.diretorio.enderecos))
+    assert visao.resumo()['registros'] == 50
+    ht.close()
+
+# Testa as impressões digitais das chaves: buscas de chaves ausentes sem ler o cesto, corretas após
+# divisões, remoções, junções, compact() e ao reabrir a tabela
+def test_impressoes():
+    for opcoes in ({}, {'mmap_cestos': True}, {'cache_cestos': 4}):
+        ht = nova_tabela('impressoes', 8, impressoes=True, **opcoes)
+        ht.create_many(TestRecord(i, f"v{i}") for i in range(0, 2000, 2))
+        for i in range(1, 200, 2):
+            ht.create(TestRecord(i, f"v{i}"))
+
+        def confere():
+            presentes = set(range(0, 2000, 2)) - set(range(0, 1600)) | set(range(1, 200, 2)) - set(range(0, 1600))
+            for endereco in set(ht.diretorio.enderecos):
+                assert sorted(ht.impressoes[endereco]) == sorted(
+                    tabela_hash.impressao_chave(r.key) for r in ht.registros_cesto(endereco))
+            ht.stats(zera=True)
+            assert [r is not None for r in ht.read_many(range(2000))] == [i in presentes for i in range(2000)]
+            s = ht.stats()
+            ausentes = 2000 - len(presentes)
+            assert s['negativos_impressoes'] + s['falsos_positivos_impressoes'] == ausentes
+            assert s['negativos_impressoes'] > 0.9 * ausentes
+
+        ht.stats(zera=True)
+        assert ht.read(3001) is None and not ht.update(TestRecord(3001, "x")) and not ht.delete(3001)
+        assert ht.stats()['leituras_cestos'] + ht.stats()['buscas_diretas'] == 0 and ht.stats()['negativos_impressoes'] == 3
+        ht.delete_many(range(0, 1600))
+        assert ht.stats()['juncoes'] > 0
+        confere()
+        ht.compact()
+        confere()
+        ht.close()
+        # Ao reabrir, as impressões gravadas no close() são carregadas sem percorrer os cestos
+        nd, nc = ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos
+        assert os.path.exists(nc + '.impressoes')
+        ht = HashExtensivel(TestRecord, 8, nd, nc, impressoes=True, **opcoes)
+        assert not os.path.exists(nc + '.impressoes')
+        confere()
+        ht.close()
+        # Se o arquivo de cestos mudar depois do close(), as impressões são refeitas a partir dos cestos
+        with HashExtensivel(TestRecord, 8, nd, nc) as outra:
+            outra.create(TestRecord(1999, "nova"))
+        ht = HashExtensivel(TestRecord, 8, nd, nc, impressoes=True, **opcoes)
+        assert ht.read(1999).value == "nova"
+        ht.delete(1999)
+        confere()
+        ht.close()
+
+# Processo leitor do test_leitores: lê repetidamente chaves que nunca deixam de existir e informa quantas
+# buscas falharam ou retornaram um valor errado
+def _le_chaves_fixas(nd, nc, conexao):
+    falhas = buscas = 0
+    with LeitorHashExtensivel(TestRecord, 8, nd, nc) as leitor:
+        while not conexao.poll():
+            for r, chave in zip(leitor.read_many(range(200), tamanho_lote=16), range(200)):
+                buscas += 1
+                if r is None or r.value != f"fixo{chave}":
+                    falhas += 1
+        conexao.send((buscas, falhas, leitor.repeticoes))
+
+# Testa o modo de leitores em outros processos: as buscas acompanham as alterações do processo que
+# grava, inclusive divisões, junções e compact(), e nunca veem uma alteração pela metade
+def test_leitores():
+    for opcoes in ({}, {'mmap_cestos': True}):
+        ht = nova_tabela('leitores', 8, leitores=True, **opcoes)
+        nd, nc = ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos
+        leitor = LeitorHashExtensivel(TestRecord, 8, nd, nc)
+        assert leitor.read(1) is None
+        ht.create(TestRecord(1, "um"))
+        assert leitor.read(1).value == "um"
+        ht.create_many(TestRecord(i, f"v{i}") for i in range(2, 2000))
+        assert ht.diretorio.profundidade_global > 5
+        assert [r.value for r in leitor.read_many(range(1, 2000))] == ["um"] + [f"v{i}" for i in range(2, 2000)]
+        ht.update(TestRecord(7, "sete"))
+        assert leitor.read(7).value == "sete" and leitor.read(5000) is None
+        ht.delete_many(range(10, 2000))
+        assert ht.stats()['reducoes'] > 0
+        assert [r and r.value for r in leitor.read_many(range(12))] == [None, "um"] + [f"v{i}" for i in range(2, 7)] + ["sete", "v8", "v9", None, None]
+        ht.compact()
+        assert leitor.read(9).value == "v9" and leitor.read(10) is None
+        assert leitor.versao[0] % 2 == 0 and leitor.versao[1] == 1
+        leitor.close()
+        ht.close()
+
+    # Um processo leitor consulta a tabela enquanto este processo insere e remove outras chaves
+    ht = nova_tabela('leitores', 8, leitores=True)
+    ht.create_many(TestRecord(i, f"fixo{i}") for i in range(200))
+    local, remota = multiprocessing.Pipe()
+    processo = multiprocessing.Process(target=_le_chaves_fixas,
+                                       args=(ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos, remota))
+    processo.start()
+    for rodada in range(3):
+        for i in range(200, 3000):
+            ht.create(TestRecord(i, "x"))
+        ht.delete_many(range(200, 3000))
+    local.send(None)
+    buscas, falhas, repeticoes = local.recv()
+    processo.join()
+    ht.close()
+    assert buscas > 0 and falhas == 0
+
+# Testa o diretório paginado: duplicações gravam só a parte nova, divisões regravam só as páginas
+# alteradas, e sem o diretório residente as buscas leem do arquivo apenas a posição da chave
+def test_diretorio_paginado():
+    ht = nova_tabela('paginado', 1, funcao_hash=hash_modulo)
+    nd, nc = ht.nome_arquivo_diretorio, ht.nome_arquivo_cestos
+    gravacoes = []
+
+    def gancho(evento, dados):
+        if evento == 'gravacao' and dados['arquivo'] == nd:
+            gravacoes.append(dados['tamanho'])
+
+    ht.adiciona_gancho(gancho)
+    # Com hash_modulo e um registro por cesto, chaves que diferem só no bit 15 levam à profundidade 16
+    ht.create(TestRecord(0, "zero"))
+    ht.create(TestRecord(1 << 15, "fundo"))
+    d = ht.diretorio
+    assert d.profundidade_global == 16 and isinstance(d.enderecos, array)
+    assert sum(gravacoes) == 1 + 8 * 2 ** 16
+    # 0x4000 cabe no cesto vazio de profundidade 15; 0xC000 o divide e muda uma única entrada
+    ht.create(TestRecord(0x4000, "a"))
+    del gravacoes[:]
+    ht.create(TestRecord(0xC000, "b"))
+    assert gravacoes == [8 * d.ENTRADAS_POR_PAGINA] and d.profundidade_global == 16
+    ht.remove_gancho(gancho)
+    ht.close()
+    assert os.path.getsize(nd) == 1 + 8 * 2 ** 16
+    nr = HashExtensivel(TestRecord, 1, nd, nc, diretorio_residente=False, funcao_hash=hash_modulo)
+    nr.stats(zera=True)
+    assert nr.read(0xC000).value == "b" and nr.read(0x4000).value == "a"
+    assert nr.stats()['bytes_lidos'] == 2 * (9 + nr.bytes_por_cesto)
+    # Sem o diretório residente, as leituras não guardam o vetor nem páginas dele
+    assert nr.diretorio.enderecos is None and not nr.diretorio.paginas
+    assert nr.diretorio.faixa(0, len(nr.diretorio)) == d.enderecos
+    # Remoções juntam os cestos e reduzem o diretório, encurtando o arquivo
+    for chave in (0xC000, 0x4000, 1 << 15):
+        assert nr.delete(chave)
+    assert nr.diretorio.profundidade_global == 0 and nr.read(0).value == "zero"
+    nr.close()
+    assert os.path.getsize(nd) == 9
+
+# Testa o diretório paginado (sem diretório residente) contra o residente: as mesmas operações, com
+# duplicações, divisões, junções, reduções e compactação, devem gravar exatamente os mesmos arquivos,
+# e o diretório paginado só guarda as páginas de uma operação
+def test_diretorio_paginado_nao_residente():
+    tabelas = [nova_tabela(f'paginado_{modo}', 2, diretorio_residente=residente, funcao_hash=hash_modulo)
+               for modo, residente in (('residente', True), ('arquivo', False))]
+    chaves = list(range(0, 1 << 14, 7)) + [1 << 17, (1 << 17) + (1 << 16), 3 << 12]
+    chaves.sort(key=hash_splitmix64)
+    lote = range((1 << 20) + 1, (1 << 20) + 4000, 13)
+    for ht in tabelas:
+        for chave in chaves:
+            ht.create(TestRecord(chave, "v"))
+        ht.create_many(TestRecord(chave, "l") for chave in lote)
+        for chave in chaves[::3]:
+            assert ht.delete(chave)
+        ht.flush()
+    residente, arquivo = tabelas
+    assert arquivo.diretorio.profundidade_global == residente.diretorio.profundidade_global >= 17
+    assert len(arquivo.diretorio.paginas) <= 2 and arquivo.diretorio.enderecos is None
+    assert sorted(arquivo.livres) == sorted(residente.livres)
+    for ht in tabelas:
+        ht.close()
+    with open(residente.nome_arquivo_diretorio, 'rb') as a, open(arquivo.nome_arquivo_diretorio, 'rb') as b:
+        assert a.read() == b.read()
+    with open(residente.nome_arquivo_cestos, 'rb') as a, open(arquivo.nome_arquivo_cestos, 'rb') as b:
+        assert a.read() == b.read()
+    # A lista de cestos livres gravada no close() é usada na abertura, sem percorrer o diretório
+    nr = HashExtensivel(TestRecord, 2, arquivo.nome_arquivo_diretorio, arquivo.nome_arquivo_cestos,
+                        diretorio_residente=False)
+    assert sorted(nr.livres) == sorted(residente.livres) and nr.stats()['bytes_lidos'] == 1
+    assert not os.path.exists(arquivo.nome_arquivo_diretorio + '.livres')
+    vivos = set(chaves[i] for i in range(len(chaves)) if i % 3)
+    assert all(nr.read(chave).value == "v" for chave in vivos)
+    nr.compact()
+    assert nr.livres == [] and all(nr.read(chave).value == "v" for chave in vivos)
+    assert nr.estrutura()['registros'] == len(vivos) + len(lote)
+    nr.close()